@@ -0,0 +1,100 @@
+"""
+Benchmark of relational conformance on a local FHIR stub: one GET for every row, as the check did before,
+against the check by set membership with and without the Patient data frame.
+
+Usage: python benchmarks/conformance_relational.py [--specimens 100000]
+There are five times fewer patients than specimens, half of them are not in the Patient data frame.
+About 3.5 % of references are missing, dangling or malformed.
+"""
+import argparse
+import random
+import time
+
+from fhir_stub import FhirStub
+
+import pandas as pd
+from load_data_fhir import provide_server_connection
+from quality_checks_fhir import conformance_relational
+
+
+def conformance_relational_per_row(df, server):
+    """
+    Relational conformance with one GET for the reference of every row.
+
+    :param df: Data frame.
+    :param server: FHIR server.
+    :return:
+        Number of records and number of invalid references.
+    """
+    count_of_invalid_references = 0
+    for index in df.index:
+        try:
+            server.request_json(df['subject_reference'][index])
+        except Exception:
+            count_of_invalid_references += 1
+    return [df.shape[0], count_of_invalid_references]
+
+
+def counts(fig):
+    """
+    Counts of the graph of relational conformance.
+
+    :param fig: Graph of relational conformance.
+    :return:
+        Number of records and number of invalid references.
+    """
+    return [int(count) for count in fig.data[0].y]
+
+
+def specimen_data_frame(stub, count_of_specimens):
+    """
+    Store patients on stub and create data frames referencing them.
+
+    :param stub: FHIR stub.
+    :param count_of_specimens: Number of specimens.
+    :return:
+        Specimen and Patient data frame.
+    """
+    random.seed(1)
+    ids = [stub.store({"resourceType": "Patient", "gender": "male"})["id"]
+           for _ in range(count_of_specimens // 5)]
+    references = []
+    for number in range(count_of_specimens):
+        value = random.random()
+        if value < 0.01:
+            references.append(None)
+        elif value < 0.03:
+            references.append("Patient/missing" + str(number % 37))
+        elif value < 0.035:
+            references.append("garbage")
+        else:
+            references.append("Patient/" + random.choice(ids))
+    sdf = pd.DataFrame({"id": [str(number) for number in range(count_of_specimens)],
+                        "resourceType": "Specimen", "subject_reference": references})
+    # the other half of patients is from another load
+    pdf = pd.DataFrame({"id": ids[:len(ids) // 2]})
+    return sdf, pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--specimens", type=int, default=100000)
+    args = parser.parse_args()
+
+    with FhirStub() as stub:
+        sdf, pdf = specimen_data_frame(stub, args.specimens)
+        server = provide_server_connection(stub.url).server
+        for name, function in [("set membership, Patient frame",
+                                lambda: counts(conformance_relational(sdf, server, pdf))),
+                               ("set membership, search only", lambda: counts(conformance_relational(sdf, server))),
+                               ("GET per row", lambda: conformance_relational_per_row(sdf, server))]:
+            requests = stub.requests
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+            print("%-30s rows %d invalid %d requests %6d %8.2fs"
+                  % (name, result[0], result[1], stub.requests - requests, elapsed), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of the ten data frame builders of extended FHIR quality checks on resources kept by the loader.
+The resources of the input file, stored on a local FHIR stub, are repeated for every number of patients.
+
+Usage, in the folder of gui.py with the input file in uploads:
+    python benchmarks/extra_frames.py <input file>.xml [--scale 250 1000 4000] [--baseline <git revision>]
+With --baseline, builders of quality_checks_fhir_extra.py in the git revision are timed too,
+e.g. the revision before builders were changed from pd.concat for every resource to record lists.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import types
+
+from fhir_stub import FhirStub
+
+import quality_checks_fhir_extra
+from load_data_fhir_extra import provide_server_connection, read_xml_and_create_resources
+
+BUILDERS = ["create_patient_data_frame", "create_recurrence_df", "create_tnm_dataframe",
+            "create_time_observation_df", "create_response_df", "create_radiation_df",
+            "create_targeted_therapy_dataframe", "create_surgery_df", "create_specimen_data_frame",
+            "create_condition_data_frame"]
+
+
+def module_of_revision(revision):
+    """
+    Load quality_checks_fhir_extra.py of git revision as a module.
+
+    :param revision: Git revision.
+    :return:
+        Module.
+    """
+    source = subprocess.run(["git", "show", revision + ":./quality_checks_fhir_extra.py"], check=True,
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    module = types.ModuleType("quality_checks_fhir_extra_" + revision)
+    exec(compile(source, revision + ":quality_checks_fhir_extra.py", "exec"), module.__dict__)
+    return module
+
+
+def load_resources(file_name):
+    """
+    Store the input file on a local FHIR stub in a temporary folder, so IDs files of the app are not overwritten.
+
+    :param file_name: Name of input file in uploads.
+    :return:
+        Resources kept by the loader.
+    """
+    folder = os.getcwd()
+    with FhirStub() as stub, tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "uploads"))
+        shutil.copy(os.path.join(folder, "uploads", file_name), os.path.join(directory, "uploads"))
+        os.chdir(directory)
+        try:
+            return read_xml_and_create_resources(file_name, provide_server_connection(stub.url), keep_resources=True)
+        finally:
+            os.chdir(folder)
+
+
+def build_frames(module, resources):
+    """
+    Build all data frames and measure the time.
+
+    :param module: Module with builders.
+    :param resources: Resources kept by the loader.
+    :return:
+        Seconds.
+    """
+    start = time.perf_counter()
+    for builder in BUILDERS:
+        getattr(module, builder)(None, resources)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file_name", help="name of input file in uploads")
+    parser.add_argument("--scale", type=int, nargs="+", default=[250, 1000, 4000],
+                        help="numbers of repetitions of the resources of the input file")
+    parser.add_argument("--baseline", help="git revision with builders to compare")
+    args = parser.parse_args()
+
+    modules = [("records", quality_checks_fhir_extra)]
+    if args.baseline is not None:
+        modules.insert(0, (args.baseline, module_of_revision(args.baseline)))
+    kept = load_resources(args.file_name)
+    patients = len(kept["patients"])
+    print("%8s %10s" % ("patients", "resources") + "".join(" %10s" % name[:10] for name, _ in modules))
+    for scale in args.scale:
+        resources = {name: named_resources * scale for name, named_resources in kept.items()}
+        count_of_resources = sum(len(named_resources) for named_resources in resources.values())
+        print("%8d %10d" % (patients * scale, count_of_resources)
+              + "".join(" %9.2fs" % build_frames(module, resources) for _, module in modules), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark of reading the values of patients from an input file: repeated find() chains, as the loaders did before,
+against one pass of extract_patient.
+
+Usage, in the folder of gui.py with the input file in uploads:
+    python benchmarks/extract_patient.py <input file>.xml [--patients 2000] [--repeat 15]
+Patients of the file are repeated up to the given number, process time of the best run is printed.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+
+# modules of the convertor import each other by flat imports, like when gui.py is run from its folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cohort import FIELDS, FORMS, NAMESPACE as ns, extract_patient, load_cohort
+
+
+def find_chains(element):
+    """
+    Read every value of FIELDS the way the loaders did before: find() for the test and find() again for .text.
+
+    :param element: Element BHPatient.
+    :return:
+        Dictionary of names and texts of values.
+    """
+    values = {}
+    form = element.find(ns + "Locations").find(ns + "Location").find(ns + "BasicData").find(ns + "Form")
+    for tag, name in FIELDS["BasicData"].items():
+        values[name] = form.find(ns + tag).text if form.find(ns + tag) is not None else None
+    events = element.find(ns + "Locations").find(ns + "Location").find(ns + "Events")
+    for event in events.findall(ns + "Event"):
+        event_type = event.attrib.get("eventtype")
+        if event_type in FORMS and event_type != "BasicData":
+            for tag, name in FIELDS[event_type].items():
+                if event.find(ns + "LogitudinalData").find(ns + FORMS[event_type]).find(ns + tag) is not None:
+                    values[name] = event.find(ns + "LogitudinalData").find(ns + FORMS[event_type]).find(ns + tag).text
+                else:
+                    values[name] = None
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file_name", help="name of input file in uploads")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=15)
+    args = parser.parse_args()
+
+    patients = load_cohort(args.file_name).patients
+    patients = (patients * (args.patients // len(patients) + 1))[:args.patients]
+    for name, function in [("find() chains", lambda: [find_chains(patient) for patient in patients]),
+                           ("extract_patient", lambda: [extract_patient(patient) for patient in patients])]:
+        best = min(timeit.repeat(function, number=1, repeat=args.repeat, timer=time.process_time))
+        print("%-16s %6.1f us/patient" % (name, best / len(patients) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
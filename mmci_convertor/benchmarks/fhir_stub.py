@@ -0,0 +1,133 @@
+"""
+In-memory FHIR server for benchmarks. It stores transaction Bundles, reads resources and searches them by _id,
+every request is counted.
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# modules of the convertor import each other by flat imports, like when gui.py is run from its folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CAPABILITY = {"resourceType": "CapabilityStatement", "status": "active", "date": "2020-01-01",
+              "kind": "instance", "fhirVersion": "4.0.1", "format": ["json"], "rest": [{"mode": "server"}]}
+
+LAST_UPDATED = "2020-01-01T00:00:00.000+00:00"
+
+
+def replace_references(element, references):
+    """
+    Replace references in element and its children.
+
+    :param element: Element of resource in json format, changed in place.
+    :param references: Dictionary of old and new references.
+    """
+    if isinstance(element, list):
+        for child in element:
+            replace_references(child, references)
+    elif isinstance(element, dict):
+        for key, child in element.items():
+            if key == "reference" and child in references:
+                element[key] = references[child]
+            else:
+                replace_references(child, references)
+
+
+class FhirStub:
+    """
+    FHIR server on localhost, base URL is in url.
+    """
+
+    def __init__(self, port=0):
+        self.resources = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, code, body):
+                data = json.dumps(body, separators=(",", ":")).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/fhir+json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                stub.count_request()
+                url = urlparse(self.path)
+                parts = url.path[len("/fhir/"):].strip("/").split("/")
+                if parts == ["metadata"]:
+                    return self.send(200, CAPABILITY)
+                if len(parts) == 1 and url.query:
+                    return self.send(200, stub.search(parts[0], parse_qs(url.query), self.headers["Host"]))
+                if len(parts) == 2 and (parts[0], parts[1]) in stub.resources:
+                    return self.send(200, stub.resources[(parts[0], parts[1])])
+                return self.send(404, {"resourceType": "OperationOutcome"})
+
+            def do_POST(self):
+                stub.count_request()
+                bundle = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                return self.send(200, stub.transaction(bundle))
+
+        self.httpd = ThreadingHTTPServer(("localhost", port), Handler)
+        self.url = "http://localhost:" + str(self.httpd.server_port) + "/fhir/"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def store(self, resource):
+        """
+        Store resource with a new ID.
+
+        :param resource: Resource in json format.
+        :return:
+            Stored resource.
+        """
+        with self.lock:
+            id = "%016x" % (len(self.resources) + 1)
+            stored = dict(resource, id=id, meta={"versionId": "1", "lastUpdated": LAST_UPDATED})
+            self.resources[(resource["resourceType"], id)] = stored
+        return stored
+
+    def transaction(self, bundle):
+        entries = bundle.get("entry", [])
+        resources = [self.store(entry["resource"]) for entry in entries]
+        # references to fullUrl of entries are replaced by references to stored resources
+        references = {entry["fullUrl"]: resource["resourceType"] + "/" + resource["id"]
+                      for entry, resource in zip(entries, resources) if entry.get("fullUrl")}
+        for resource in resources:
+            replace_references(resource, references)
+        return {"resourceType": "Bundle", "type": "transaction-response",
+                "entry": [{"response": {"status": "201 Created",
+                                        "location": resource["resourceType"] + "/" + resource["id"] + "/_history/1",
+                                        "etag": 'W/"1"', "lastModified": LAST_UPDATED}} for resource in resources]}
+
+    def search(self, type, query, host):
+        ids = [id for value in query.get("_id", []) for id in value.split(",")]
+        count = int(query.get("_count", ["20"])[0])
+        offset = int(query.get("_offset", ["0"])[0])
+        matches = [self.resources[(type, id)] for id in ids if (type, id) in self.resources]
+        base = "http://" + host + "/fhir/"
+        bundle = {"resourceType": "Bundle", "type": "searchset", "total": len(matches),
+                  "entry": [{"fullUrl": base + type + "/" + resource["id"], "resource": resource,
+                             "search": {"mode": "match"}} for resource in matches[offset:offset + count]]}
+        if offset + count < len(matches):
+            next_query = urlencode({"_id": ",".join(ids), "_count": count, "_offset": offset + count})
+            bundle["link"] = [{"relation": "next", "url": base + type + "?" + next_query}]
+        return bundle
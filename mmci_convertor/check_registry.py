@@ -0,0 +1,258 @@
+import inspect
+import os
+import threading
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+import plotly.express as px
+
+# maximal number of data frames and quality checks processed at the same time
+CHECK_CONCURRENCY = 4
+
+# plotly express builds its shared default template lazily, it is built once before checks run in threads
+template_lock = threading.Lock()
+template_ready = threading.Event()
+
+# maximal number of processes running quality checks which use only data frames, 1 runs them in threads,
+# set by environment variable CHECK_PROCESSES, starting processes pays off only for large data on many cores
+CHECK_PROCESSES = int(os.environ.get("CHECK_PROCESSES", "1"))
+
+# data frames shared with a process running quality checks
+shared_values = {}
+
+
+class Frame:
+    """
+    Data frame used by quality checks, built by function from named inputs.
+    """
+
+    def __init__(self, name, function, inputs, arguments=None):
+        """
+        :param name: Name of the data frame, used as input of checks.
+        :param function: Function building the data frame.
+        :param inputs: Names of values passed to function, in the order of its parameters.
+        :param arguments: Dictionary of other keyword arguments of function.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.arguments = arguments or {}
+
+
+class Check:
+    """
+    Data quality check shown on a dashboard.
+    """
+
+    def __init__(self, id, title, function, inputs, reports=(), graphs=1, arguments=None):
+        """
+        :param id: Unique ID of the check.
+        :param title: Title of the check.
+        :param function: Function of the check, returning a figure or a tuple of figures.
+        :param inputs: Names of data frames and values passed to function, in the order of its parameters.
+        :param reports: Paths of reports written by function.
+        :param graphs: Number of figures returned by function.
+        :param arguments: Dictionary of other keyword arguments of function.
+        """
+        self.id = id
+        self.title = title
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.reports = tuple(reports)
+        self.graphs = graphs
+        self.arguments = arguments or {}
+
+
+def graph_count(checks):
+    """
+    Count graphs shown on a dashboard.
+
+    :param checks: List of Check.
+    :return:
+        Number of graphs.
+    """
+    return sum(check.graphs for check in checks)
+
+
+def report_count(checks):
+    """
+    Count CSV reports of failures shown on a dashboard.
+
+    :param checks: List of Check.
+    :return:
+        Number of distinct CSV reports.
+    """
+    return len({report for check in checks for report in check.reports if report.endswith(".csv")})
+
+
+def call(node, values):
+    """
+    Call function of a data frame or a check with its inputs.
+
+    :param node: Frame or Check.
+    :param values: Dictionary of available values.
+    :return:
+        Result of the function.
+    """
+    inputs = [values[name] for name in node.inputs]
+    if not node.arguments:
+        return node.function(*inputs)
+    # inputs fill the parameters which are not given by arguments
+    parameters = [name for name in inspect.signature(node.function).parameters if name not in node.arguments]
+    return node.function(**dict(zip(parameters, inputs)), **node.arguments)
+
+
+def run_check(check, values):
+    """
+    Run one quality check.
+
+    :param check: Check.
+    :param values: Dictionary of available values.
+    :return:
+        List of figures in json format.
+    """
+    figures = call(check, values)
+    if check.graphs == 1:
+        figures = (figures,)
+    return [figure.to_json() for figure in figures]
+
+
+def share_values(values):
+    """
+    Keep data frames in a process running quality checks, so they are sent to the process only once.
+
+    :param values: Dictionary of data frames.
+    :return:
+        None
+    """
+    shared_values.update(values)
+
+
+def run_shared_check(check):
+    """
+    Run one quality check on data frames shared with this process.
+
+    :param check: Check.
+    :return:
+        List of figures in json format.
+    """
+    return run_check(check, shared_values)
+
+
+def prepare_template():
+    """
+    Build the parts of the default plotly template which plotly express reads.
+    Plotly builds them on the first use and threads building them at the same time fail with ValueError,
+    so every check must only read them.
+
+    :return:
+        None
+    """
+    with template_lock:
+        if not template_ready.is_set():
+            px.bar(x=[0], y=[0])
+            px.pie(names=[""], values=[1])
+            px.scatter(x=[0], y=[0])
+            template_ready.set()
+
+
+def dependencies(checks, values, frames):
+    """
+    Build the graph of dependencies of data frames and checks.
+    A check depends on its data frames and on the previous check writing the same report,
+    so reports are written in the order of checks.
+    Raises KeyError if an input is neither a data frame nor a value.
+
+    :param checks: List of Check.
+    :param values: Dictionary of values available to data frames and checks.
+    :param frames: List of Frame.
+    :return:
+        Dictionary of nodes and sets of nodes they depend on. Data frames are keyed by name, checks by index.
+    """
+    result = {}
+    nodes = [(frame.name, frame) for frame in frames] + list(enumerate(checks))
+    for key, node in nodes:
+        unknown = [name for name in node.inputs if name not in values and name not in result]
+        if unknown:
+            raise KeyError("Unknown inputs of " + str(getattr(node, "id", key)) + ": " + ", ".join(unknown))
+        result[key] = {name for name in node.inputs if name not in values}
+    writers = {}
+    for index, check in enumerate(checks):
+        for report in check.reports:
+            if report in writers:
+                result[index].add(writers[report])
+            writers[report] = index
+    return result
+
+
+def run_checks(checks, values, frames=(), concurrency=CHECK_CONCURRENCY, processes=CHECK_PROCESSES):
+    """
+    Build data frames and run quality checks in a pool of threads.
+    Every data frame and check is started as soon as all its inputs are ready,
+    so independent checks run at the same time.
+    Checks which use only data frames are CPU bound, so if processes is greater than 1, they run in a pool
+    of processes spawned after all their data frames are ready. The data frames are pickled to every process once
+    by its initializer, they are not shared memory. The processes write reports and return figures.
+    Processes are spawned, not forked, because forking while other threads hold locks can deadlock.
+    Checks using connection to database or FHIR server stay in threads.
+
+    :param checks: List of Check.
+    :param values: Dictionary of values available to data frames and checks, e.g. connection to database.
+    :param frames: List of Frame used by checks.
+    :param concurrency: Maximal number of data frames and checks processed at the same time in threads.
+    :param processes: Maximal number of processes running checks.
+    :return:
+        List of figures in json format, in the order of checks.
+    """
+    waiting = dependencies(checks, values, frames)
+    frame_names = {frame.name for frame in frames}
+    in_processes = set()
+    if processes > 1:
+        in_processes = {index for index, check in enumerate(checks)
+                        if check.inputs and frame_names.issuperset(check.inputs)}
+    shared = {name for index in in_processes for name in checks[index].inputs}
+    for index in in_processes:
+        waiting[index].update(shared)
+    dependents = {}
+    for key, required in waiting.items():
+        for name in required:
+            dependents.setdefault(name, []).append(key)
+    nodes = {frame.name: frame for frame in frames}
+    values = dict(values)
+    figures = {}
+    process_pool = []
+    prepare_template()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        running = {}
+
+        def start(key):
+            if key in in_processes:
+                if not process_pool:
+                    process_pool.append(ProcessPoolExecutor(max_workers=min(processes, len(in_processes)),
+                                                            mp_context=get_context("spawn"),
+                                                            initializer=share_values,
+                                                            initargs=({name: values[name] for name in shared},)))
+                running[process_pool[0].submit(run_shared_check, checks[key])] = key
+            elif isinstance(key, int):
+                running[executor.submit(run_check, checks[key], values)] = key
+            else:
+                running[executor.submit(call, nodes[key], values)] = key
+
+        try:
+            for key in [key for key, required in waiting.items() if not required]:
+                start(key)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    if isinstance(key, int):
+                        figures[key] = future.result()
+                    else:
+                        values[key] = future.result()
+                    for dependent in dependents.get(key, []):
+                        waiting[dependent].discard(key)
+                        if not waiting[dependent]:
+                            start(dependent)
+        finally:
+            if process_pool:
+                process_pool[0].shutdown(cancel_futures=True)
+    return [figure for index in range(len(checks)) for figure in figures[index]]
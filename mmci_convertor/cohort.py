@@ -0,0 +1,279 @@
+import hashlib
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+
+NAMESPACE = "{http://registry.samply.de/schemata/import_v1}"
+
+# parsed input files, keyed by the SHA-256 of their content
+_cohorts = {}
+_cohorts_lock = threading.Lock()
+_MAX_CACHED_COHORTS = 4
+
+# input files of this size (in bytes) or bigger are streamed instead of kept in memory
+STREAMING_THRESHOLD = 256 * 1024 * 1024
+
+# form element holding the values of basic data and of each event type
+FORMS = {"BasicData": "Form",
+         "Surgery": "Form",
+         "Sample": "Form1",
+         "Histopathology": "Form2",
+         "Pharmacotherapy": "Form3",
+         "Response to therapy": "Form4",
+         "Radiation therapy": "Form5",
+         "Targeted Therapy": "Form6"}
+
+# data elements used by the OMOP, FHIR and FHIR extra loaders and the names of their values
+FIELDS = {"BasicData": {"Dataelement_51_3": "date_diagnosis",
+                        "Dataelement_6_3": "last_update",
+                        "Dataelement_5_2": "vital_status",
+                        "Dataelement_7_2": "overall_survival",
+                        "Dataelement_85_1": "sex",
+                        "Dataelement_3_1": "age_at_diagnosis",
+                        "Dataelement_61_5": "liver_imaging",
+                        "Dataelement_31_3": "ct",
+                        "Dataelement_88_1": "colonoscopy",
+                        "Dataelement_63_4": "lung_imaging",
+                        "Dataelement_30_3": "mri",
+                        "Dataelement_4_3": "recurrence"},
+          "Surgery": {"Dataelement_8_3": "start_week",
+                      "Dataelement_49_1": "surgery_type",
+                      "Dataelement_67_1": "other_surgery_type",
+                      "Dataelement_9_2": "radicality",
+                      "Dataelement_93_1": "location"},
+          "Sample": {"Dataelement_56_2": "sample_id",
+                     "Dataelement_54_2": "material_type",
+                     "Dataelement_55_2": "preservation_mode",
+                     "Dataelement_89_3": "year_of_collection"},
+          "Histopathology": {"Dataelement_92_1": "localization",
+                             "Dataelement_73_3": "uicc_version",
+                             "Dataelement_71_1": "primary_tumor",
+                             "Dataelement_77_1": "lymph_nodes",
+                             "Dataelement_75_1": "metastasis",
+                             "Dataelement_70_2": "stage",
+                             "Dataelement_83_1": "grade",
+                             "Dataelement_91_1": "morphology"},
+          "Pharmacotherapy": {"Dataelement_10_2": "start_week",
+                              "Dataelement_11_2": "end_week",
+                              "Dataelement_59_5": "scheme",
+                              "Dataelement_81_3": "other_scheme"},
+          "Response to therapy": {"Dataelement_33_1": "response",
+                                  "Dataelement_34_1": "week"},
+          "Radiation therapy": {"Dataelement_12_4": "start_week",
+                                "Dataelement_13_2": "end_week"},
+          "Targeted Therapy": {"Dataelement_35_3": "start_week",
+                               "Dataelement_36_1": "end_week"}}
+
+# FIELDS keyed by qualified tags, so every form is matched without building tag names
+_TAGS = {section: {NAMESPACE + tag: name for tag, name in fields.items()} for section, fields in FIELDS.items()}
+_EMPTY_VALUES = {section: dict.fromkeys(fields.values()) for section, fields in FIELDS.items()}
+_EVENT_TYPES = frozenset(FIELDS) - {"BasicData"}
+
+
+class Cohort:
+    """
+    A class representing a parsed input file shared by validation, FHIR and OMOP.
+
+    Attributes:
+        content_hash (str) : SHA-256 of the content of input file.
+        root (Element) : The root element BHImport.
+        patients (List[Element]) : All BHPatient elements in document order.
+    """
+    def __init__(self, content_hash, root):
+        self.content_hash = content_hash
+        self.root = root
+        self.patients = root.findall(NAMESPACE + "BHPatient")
+
+
+class PatientValues:
+    """
+    A class representing values of one BHPatient element extracted in a single pass.
+
+    Attributes:
+        identifier (str) : The original identifier.
+        basic_data (dict) : Values of form BasicData keyed by names from FIELDS.
+        events (List[Tuple[str, dict]]) : Event types and values of their forms in document order.
+    """
+    def __init__(self, identifier, basic_data, events):
+        self.identifier = identifier
+        self.basic_data = basic_data
+        self.events = events
+
+
+def hash_input_file(file_name):
+    """
+    Compute the content hash of an uploaded file.
+
+    Args:
+        file_name: Name of input file with data.
+
+    Returns:
+        Hex digest of SHA-256 of the file content.
+    """
+    digest = hashlib.sha256()
+    with open("uploads/" + file_name, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_cohort(file_name):
+    """
+    Parse input file once and share the result between all stages of one run.
+    The file is parsed again only if its content has changed.
+
+    Args:
+        file_name: Name of input file with data.
+
+    Returns:
+        Instance of class Cohort.
+
+    Raises:
+        ElementTree.ParseError: If the file is not well-formed XML.
+    """
+    content_hash = hash_input_file(file_name)
+    with _cohorts_lock:
+        cohort = _cohorts.get(content_hash)
+        if cohort is None:
+            tree = ElementTree.parse("uploads/" + file_name)
+            cohort = Cohort(content_hash, tree.getroot())
+            if len(_cohorts) >= _MAX_CACHED_COHORTS:
+                _cohorts.pop(next(iter(_cohorts)))
+            _cohorts[content_hash] = cohort
+    return cohort
+
+
+def clear_cohorts():
+    """
+    Drop all parsed input files from memory.
+
+    Returns:
+        None
+    """
+    with _cohorts_lock:
+        _cohorts.clear()
+
+
+def is_streamed(file_name):
+    """
+    Decide if input file is too big to be parsed into memory at once.
+
+    Args:
+        file_name: Name of input file with data.
+
+    Returns:
+        True if the file should be processed with iterparse_patients.
+    """
+    return os.path.getsize("uploads/" + file_name) >= STREAMING_THRESHOLD
+
+
+def iterparse_patients(file_name):
+    """
+    Stream input file and yield one BHPatient element at a time.
+    Every patient is removed from the tree after it has been processed,
+    so only the root element and the current patient are kept in memory.
+
+    Args:
+        file_name: Name of input file with data.
+
+    Yields:
+        Pairs of the root element BHImport and one BHPatient element.
+
+    Raises:
+        ElementTree.ParseError: If the file is not well-formed XML.
+    """
+    root = None
+    depth = 0
+    for event, element in ElementTree.iterparse("uploads/" + file_name, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        # only direct children of root are patients
+        if depth == 1 and element.tag == NAMESPACE + "BHPatient":
+            yield root, element
+            element.clear()
+            root.remove(element)
+
+
+def iter_patients(file_name):
+    """
+    Iterate over all BHPatient elements of input file. Big files are
+    streamed, other files are served from the shared parsed cohort.
+
+    Args:
+        file_name: Name of input file with data.
+
+    Returns:
+        Iterator of BHPatient elements in document order.
+    """
+    if is_streamed(file_name):
+        return (patient for _, patient in iterparse_patients(file_name))
+    return iter(load_cohort(file_name).patients)
+
+
+def extract_form(form, section):
+    """
+    Read all values of one form in a single pass over its data elements.
+
+    Args:
+        form: Form element, can be None.
+        section: Key of FIELDS describing the form.
+
+    Returns:
+        Dictionary with all names of the section, missing data elements are None.
+    """
+    values = _EMPTY_VALUES[section].copy()
+    if form is None:
+        return values
+    names = _TAGS[section].get
+    # walk backwards, so the first occurrence of a data element wins as with find()
+    for element in reversed(form):
+        name = names(element.tag)
+        if name is not None:
+            values[name] = element.text
+    return values
+
+
+def extract_patient(element, event_types=None):
+    """
+    Read all values of one BHPatient element needed by the loaders.
+
+    Args:
+        element: BHPatient element.
+        event_types: Event types to extract, all event types from FIELDS by default.
+
+    Returns:
+        Instance of class PatientValues.
+    """
+    if event_types is None:
+        event_types = _EVENT_TYPES
+    identifier = element.find(NAMESPACE + "Identifier")
+    if identifier is not None:
+        identifier = identifier.text
+    location = element.find(NAMESPACE + "Locations").find(NAMESPACE + "Location")
+    basic_data = extract_form(location.find(NAMESPACE + "BasicData").find(NAMESPACE + FORMS["BasicData"]),
+                              "BasicData")
+    events = []
+    for event in location.find(NAMESPACE + "Events").findall(NAMESPACE + "Event"):
+        event_type = event.attrib.get("eventtype")
+        if event_type in event_types:
+            form = event.find(NAMESPACE + "LogitudinalData").find(NAMESPACE + FORMS[event_type])
+            events.append((event_type, extract_form(form, event_type)))
+    return PatientValues(identifier, basic_data, events)
+
+
+def event_values(events, event_type):
+    """
+    Select values of all events of one type.
+
+    Args:
+        events: Event types and values from PatientValues.events.
+        event_type: Wanted eventtype.
+
+    Returns:
+        List of dictionaries with values of the events in document order.
+    """
+    return [values for current_type, values in events if current_type == event_type]
@@ -0,0 +1,360 @@
+import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# maximal number of resources stored on FHIR server in one transaction Bundle
+BUNDLE_SIZE = 500
+
+# maximal number of Bundles sent to FHIR server at the same time
+CONCURRENCY = 4
+
+# number of resources read from FHIR server by one search request
+SEARCH_COUNT = 200
+
+
+class RefusedRetry(Retry):
+    """
+    Repeat only requests which FHIR server did not process, a repeated transaction would store the resources twice.
+    Connection errors happen before the request is sent and 429 refuses it, other errors and statuses are not repeated.
+    """
+    RETRY_AFTER_STATUS_CODES = frozenset([429])
+
+
+def bundle_entry(file, type, full_url=None):
+    """
+    Create an entry of transaction Bundle creating one resource.
+
+    :param file: FHIR model, precursor of FHIR json.
+    :param type: Type of Resource.
+    :param full_url: Temporary urn:uuid used by references from other entries of the Bundle.
+    :return:
+        The entry in json format.
+    """
+    entry = {"resource": file.as_json(), "request": {"method": "POST", "url": type}}
+    if full_url is not None:
+        entry["fullUrl"] = full_url
+    return entry
+
+
+def resource_id(entry):
+    """
+    Read ID of the created resource from an entry of transaction-response Bundle.
+
+    :param entry: The entry in json format.
+    :return:
+        ID of the resource.
+    """
+    # location is [base/]Type/id/_history/version
+    parts = entry["response"]["location"].split("/")
+    if "_history" in parts:
+        return parts[parts.index("_history") - 1]
+    return parts[-1]
+
+
+def resource_version(response):
+    """
+    Read version of the created resource from the response of transaction-response Bundle.
+
+    :param response: The response of one entry in json format.
+    :return:
+        The version ID, None if the server did not send it.
+    """
+    parts = response.get("location", "").split("/")
+    if "_history" in parts and parts.index("_history") + 1 < len(parts):
+        return parts[parts.index("_history") + 1]
+    etag = response.get("etag")
+    if etag is not None:
+        return etag.replace('W/', '').strip('"')
+    return None
+
+
+def replace_references(value, references):
+    """
+    Replace temporary urn:uuid references by references of stored resources.
+
+    :param value: Resource or its part in json format.
+    :param references: Dictionary of fullUrls and references of stored resources.
+    :return:
+        Copy of the value with replaced references.
+    """
+    if isinstance(value, dict):
+        return {key: (references.get(item, item) if key == "reference" else replace_references(item, references))
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_references(item, references) for item in value]
+    return value
+
+
+def stored_resource(entry, response, references):
+    """
+    Create the resource as it is stored on FHIR server from the sent entry and the response of the server,
+    so it does not have to be read back.
+
+    :param entry: The sent entry in json format.
+    :param response: The response of the entry in json format.
+    :param references: Dictionary of fullUrls and references of stored resources.
+    :return:
+        The resource in json format.
+    """
+    resource = entry["resource"]
+    meta = {"versionId": resource_version(response), "lastUpdated": response.get("lastModified")}
+    result = {"resourceType": resource["resourceType"],
+              "id": resource_id({"response": response}),
+              "meta": {key: value for key, value in meta.items() if value is not None}}
+    result.update(replace_references(resource, references))
+    return result
+
+
+def group_into_bundles(resources, bundle_size=BUNDLE_SIZE):
+    """
+    Split resources of patients into transaction Bundles.
+    Resources of one patient are never split, because urn:uuid references are resolved only inside one Bundle.
+    A patient with more resources than bundle_size gets its own Bundle.
+
+    :param resources: Iterable of resources of one patient, lists of pairs of the name of IDs file and Bundle entry.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :return:
+        Generator of lists of patients stored in one Bundle.
+    """
+    bundle = []
+    count = 0
+    for patient_entries in resources:
+        if bundle and count + len(patient_entries) > bundle_size:
+            yield bundle
+            bundle = []
+            count = 0
+        bundle.append(patient_entries)
+        count += len(patient_entries)
+    if bundle:
+        yield bundle
+
+
+def patient_identifier(patient_entries):
+    """
+    Find the original identifier of patient for error reports.
+
+    :param patient_entries: Resources of one patient, the first one is Patient.
+    :return:
+        The original identifier, can be None.
+    """
+    identifiers = patient_entries[0][1]["resource"].get("identifier") or [{}]
+    return identifiers[0].get("value")
+
+
+def report_rejected(patient, entries, status, outcome):
+    """
+    Print every entry which was not stored on FHIR server.
+
+    :param patient: The original identifier of patient.
+    :param entries: Rejected entries of the patient.
+    :param status: HTTP status of the rejection.
+    :param outcome: OperationOutcome in json format explaining the rejection, can be None.
+    :return:
+        None
+    """
+    diagnostics = "; ".join(issue.get("diagnostics", issue.get("code", ""))
+                            for issue in (outcome or {}).get("issue", []))
+    for entry in entries:
+        print(f"Error: {entry['request']['url']} of patient {patient} was not stored: {status} {diagnostics}")
+
+
+def store_transaction(smart_client, bundle):
+    """
+    Store resources of patients on FHIR server in one transaction Bundle.
+    Raises requests.HTTPError if the server rejects the whole transaction.
+
+    :param smart_client: The FHIR client.
+    :param bundle: Resources of patients from group_into_bundles.
+    :return:
+        Lists of responses of entries of every patient, responses of rejected entries are None.
+    """
+    entries = [entry for patient_entries in bundle for _, entry in patient_entries]
+    transaction = {"resourceType": "Bundle", "type": "transaction", "entry": entries}
+    responses = iter(smart_client.server.post_json(path="", resource_json=transaction).json()["entry"])
+    result = []
+    for patient_entries in bundle:
+        patient_responses = []
+        for _, entry in patient_entries:
+            response = next(responses)["response"]
+            if response["status"].startswith("2"):
+                patient_responses.append(response)
+            else:
+                report_rejected(patient_identifier(patient_entries), [entry], response["status"],
+                                response.get("outcome"))
+                patient_responses.append(None)
+        result.append(patient_responses)
+    return result
+
+
+def store_bundle(smart_client, bundle):
+    """
+    Store resources of patients on FHIR server in one transaction Bundle.
+    If the server rejects the content of the transaction, every patient is stored in its own transaction,
+    so only the invalid patients are lost. Their entries are reported.
+
+    :param smart_client: The FHIR client.
+    :param bundle: Resources of patients from group_into_bundles.
+    :return:
+        Lists of responses of entries of every patient, responses of rejected entries are None.
+    """
+    try:
+        return store_transaction(smart_client, bundle)
+    except requests.HTTPError as e:
+        status = e.response.status_code
+        # the server is overloaded or broken, splitting the Bundle would not help
+        if status == 429 or status >= 500:
+            raise
+        if len(bundle) > 1:
+            return [store_bundle(smart_client, [patient_entries])[0] for patient_entries in bundle]
+        try:
+            outcome = e.response.json()
+        except ValueError:
+            outcome = None
+        report_rejected(patient_identifier(bundle[0]), [entry for _, entry in bundle[0]], status, outcome)
+        return [[None] * len(bundle[0])]
+
+
+def pool_connections(smart_client, concurrency=CONCURRENCY):
+    """
+    Let the session of FHIR client keep one connection alive for every concurrent request.
+    Called once for a new client. Requests refused by overloaded server (429) and requests which could not connect
+    are repeated, after the time the server asks for. Requests which may have reached the server are not repeated.
+
+    :param smart_client: The FHIR client.
+    :param concurrency: Maximal number of requests sent at the same time.
+    :return:
+        None
+    """
+    retry = RefusedRetry(total=5, connect=5, read=0, other=0, status=5, status_forcelist=(429,),
+                         allowed_methods=None, backoff_factor=0.5, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+    smart_client.server.session.mount("http://", adapter)
+    smart_client.server.session.mount("https://", adapter)
+
+
+def store_bundles(smart_client, bundles, concurrency=CONCURRENCY):
+    """
+    Store transaction Bundles on FHIR server concurrently.
+    At most concurrency Bundles are sent at the same time and the next Bundle is created
+    only after the oldest one is stored, so a slow server slows down the upload instead of being flooded.
+    Connections are kept alive by pool_connections of provide_server_connection.
+
+    :param smart_client: The FHIR client.
+    :param bundles: Iterable of Bundles from group_into_bundles.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :return:
+        Generator of pairs of Bundle and responses from store_bundle in the order of bundles.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for bundle in bundles:
+            if len(pending) >= concurrency:
+                stored, future = pending.popleft()
+                yield stored, future.result()
+            pending.append((bundle, executor.submit(store_bundle, smart_client, bundle)))
+        while pending:
+            stored, future = pending.popleft()
+            yield stored, future.result()
+
+
+def store_patients(smart_client, resources, bundle_size=BUNDLE_SIZE, concurrency=CONCURRENCY, keep_resources=False):
+    """
+    Store resources of all patients on FHIR server in concurrent transaction Bundles.
+
+    :param smart_client: The FHIR client.
+    :param resources: Iterable of resources of one patient, lists of pairs of the name of IDs file and Bundle entry.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :param keep_resources: Keep stored resources in memory, so quality checks do not have to read them back.
+    :return:
+        Dictionary with IDs of stored resources for every name of IDs file, in the order of resources.
+        Dictionary with stored resources for every name of IDs file, None if keep_resources is False.
+    """
+    ids_files = {}
+    stored = {} if keep_resources else None
+    for bundle, responses in store_bundles(smart_client, group_into_bundles(resources, bundle_size), concurrency):
+        for patient_entries, patient_responses in zip(bundle, responses):
+            references = {}
+            for (_, entry), response in zip(patient_entries, patient_responses):
+                if response is not None and "fullUrl" in entry:
+                    references[entry["fullUrl"]] = (entry["resource"]["resourceType"] + "/"
+                                                    + resource_id({"response": response}))
+            for (name, entry), response in zip(patient_entries, patient_responses):
+                # rejected resources are left out
+                if response is None:
+                    continue
+                ids_files.setdefault(name, []).append(resource_id({"response": response}))
+                if keep_resources:
+                    stored.setdefault(name, []).append(stored_resource(entry, response, references))
+    return ids_files, stored
+
+
+def search_resources(server, type, ids, count=SEARCH_COUNT, elements=None):
+    """
+    Read resources from FHIR server by search of their IDs, following next links of the searchset Bundles.
+    IDs are searched in chunks of count IDs.
+
+    :param server: FHIR server.
+    :param type: Type of Resource.
+    :param ids: List of IDs of resources.
+    :param count: Number of resources in one page of search results.
+    :param elements: Names of elements returned by the server, None for whole resources.
+    :return:
+        Dictionary of IDs and resources in json format.
+    """
+    found = {}
+    for start in range(0, len(ids), count):
+        parameters = {"_id": ",".join(ids[start:start + count]), "_count": count}
+        if elements is not None:
+            parameters["_elements"] = ",".join(elements)
+        # relative to the base URL of the server, next links are absolute
+        url = type + '?' + urlencode(parameters, safe=",")
+        while url is not None:
+            bundle = server.request_json(url)
+            for entry in bundle.get("entry", []):
+                resource = entry.get("resource", {})
+                # included resources and OperationOutcomes are not results
+                if entry.get("search", {}).get("mode", "match") == "match" and resource.get("resourceType") == type:
+                    found[resource["id"]] = resource
+            url = next((link["url"] for link in bundle.get("link", []) if link.get("relation") == "next"), None)
+    return found
+
+
+def read_resources(server, name, type, resources=None, count=SEARCH_COUNT, elements=None):
+    """
+    Iterate over resources listed in IDs file. Resources kept by the loader are used if available,
+    otherwise resources are read from FHIR server by search in pages of count resources.
+    Resources missing on the server are reported and skipped.
+
+    :param server: FHIR server.
+    :param name: Name of IDs file.
+    :param type: Type of Resource.
+    :param resources: Stored resources from store_patients or exported resources from exported_resources,
+        None to read resources from server.
+    :param count: Number of resources read from server by one request.
+    :param elements: Names of elements read from server, None for whole resources.
+    :return:
+        Generator of pairs of ID and resource in json format, the resource can be modified.
+    """
+    if resources is not None:
+        named_resources = resources.get(name, [])
+        for resource in named_resources:
+            # stored resources are kept for other checks, exported resources are parsed for every iteration
+            if isinstance(named_resources, list):
+                resource = copy.deepcopy(resource)
+            yield resource["id"], resource
+        return
+    with open(name + '_ids.txt', 'r') as file_ids:
+        ids = [id[:-1] for id in file_ids]
+    for start in range(0, len(ids), count):
+        chunk = ids[start:start + count]
+        found = search_resources(server, type, chunk, count, elements)
+        for id in chunk:
+            if id in found:
+                yield id, found[id]
+            else:
+                print(f"Error: {type} {id} was not found on FHIR server")
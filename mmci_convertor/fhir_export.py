@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin
+
+# seconds between two requests for the status of export, if the server does not send Retry-After
+EXPORT_POLL_INTERVAL = 1
+
+# maximal number of seconds to wait for export
+EXPORT_TIMEOUT = 3600
+
+# seconds subtracted from the start of loading, the clocks of client and server may differ
+EXPORT_SINCE_MARGIN = 300
+
+
+def export_since(margin=EXPORT_SINCE_MARGIN):
+    """
+    Time for the _since parameter of export, taken before resources are stored.
+
+    :param margin: Seconds subtracted from the current time.
+    :return:
+        FHIR instant in UTC.
+    """
+    return (datetime.now(timezone.utc) - timedelta(seconds=margin)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def start_export(server, types, since=None):
+    """
+    Start system-level FHIR Bulk Data export of resources of given types.
+
+    :param server: FHIR server.
+    :param types: Types of Resources.
+    :param since: Only resources changed after this FHIR instant are exported, all resources if None.
+    :return:
+        URL of the status of export.
+    """
+    params = {"_type": ",".join(types)}
+    if since is not None:
+        params["_since"] = since
+    response = server.session.get(urljoin(server.base_uri, '$export'), params=params,
+                                  headers={"Accept": "application/fhir+json", "Prefer": "respond-async"})
+    response.raise_for_status()
+    return response.headers["Content-Location"]
+
+
+def wait_for_export(server, status_url, poll_interval=EXPORT_POLL_INTERVAL, timeout=EXPORT_TIMEOUT):
+    """
+    Poll the status of export until the server finishes it.
+    Raises TimeoutError if the export is not finished in timeout seconds.
+
+    :param server: FHIR server.
+    :param status_url: URL of the status of export from start_export.
+    :param poll_interval: Seconds between two requests, if the server does not send Retry-After.
+    :param timeout: Maximal number of seconds to wait.
+    :return:
+        Manifest of the export in json format.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        response = server.session.get(status_url, headers={"Accept": "application/json"})
+        response.raise_for_status()
+        if response.status_code != 202:
+            return response.json()
+        if time.monotonic() > deadline:
+            raise TimeoutError("Export " + status_url + " was not finished in " + str(timeout) + " seconds")
+        retry_after = response.headers.get("Retry-After", "")
+        time.sleep(int(retry_after) if retry_after.isdigit() else poll_interval)
+
+
+def download_export(server, manifest, directory):
+    """
+    Stream output files of export into directory, so they are downloaded only once.
+
+    :param server: FHIR server.
+    :param manifest: Manifest of the export from wait_for_export.
+    :param directory: Directory for NDJSON files, old files are overwritten.
+    :return:
+        Dictionary with paths of NDJSON files for every type of Resource.
+    """
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for error in manifest.get("error", []):
+        print(f"Error: export of {error.get('type')} failed, see {error.get('url')}")
+    for number, output in enumerate(manifest.get("output", [])):
+        path = os.path.join(directory, output["type"] + "_" + str(number) + ".ndjson")
+        with server.session.get(output["url"], headers={"Accept": "application/fhir+ndjson"}, stream=True) as response:
+            response.raise_for_status()
+            with open(path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=1 << 16):
+                    file.write(chunk)
+        files.setdefault(output["type"], []).append(path)
+    return files
+
+
+class NdjsonResources:
+    """
+    Resources from NDJSON files with IDs from one IDs file.
+    The files are parsed again for every iteration, so no resource is kept in memory.
+    """
+
+    def __init__(self, paths, ids):
+        self.paths = paths
+        self.ids = ids
+
+    def __iter__(self):
+        for path in self.paths:
+            with open(path, "r") as file:
+                for line in file:
+                    if line.strip():
+                        resource = json.loads(line)
+                        if resource.get("id") in self.ids:
+                            yield resource
+
+
+def exported_resources(server, names, directory, since=None, poll_interval=EXPORT_POLL_INTERVAL,
+                       timeout=EXPORT_TIMEOUT):
+    """
+    Read resources listed in IDs files by FHIR Bulk Data export instead of reading them one by one.
+    Resources are in the order of export, not in the order of IDs files.
+    The files contain patient data, the caller deletes directory when the resources are not needed.
+
+    :param server: FHIR server.
+    :param names: Dictionary of names of IDs files and their types of Resource.
+    :param directory: Directory for NDJSON files, e.g. a temporary directory.
+    :param since: Only resources changed after this FHIR instant are exported, all resources if None.
+    :param poll_interval: Seconds between two requests for the status of export.
+    :param timeout: Maximal number of seconds to wait for export.
+    :return:
+        Dictionary with resources for every name of IDs file, accepted by read_resources.
+    """
+    status_url = start_export(server, sorted(set(names.values())), since)
+    files = download_export(server, wait_for_export(server, status_url, poll_interval, timeout), directory)
+    result = {}
+    for name, type in names.items():
+        with open(name + '_ids.txt', 'r') as file_ids:
+            ids = {id[:-1] for id in file_ids}
+        result[name] = NdjsonResources(files.get(type, []), ids)
+    return result
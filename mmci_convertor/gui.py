@@ -8,10 +8,12 @@ from fhirclient import client
 import io
 import zipfile
 import threading
-from load_data_fhir import provide_server_connection, read_xml_and_create_resources, create_graphs
-from load_data_fhir_extra import create_graphs_extra
-from load_data_ohdsi import create_graphs_omop
+from load_data_fhir import provide_server_connection, create_graphs, FHIR_CHECKS
+from load_data_fhir_extra import create_graphs_extra, FHIR_EXTRA_CHECKS
+from load_data_ohdsi import create_graphs_omop, OMOP_CHECKS
+from check_registry import graph_count, report_count
 from input_validation import check_well_formed_xml, validate_elements
+from cohort import clear_cohorts
 
 
 app = Flask(__name__)
@@ -239,7 +241,7 @@ def upload_file():
         file.save(os.path.join(app.config['UPLOAD_FOLDER'], file.filename))
         content = "Correct input file!"
         well_formed = check_well_formed_xml(file.filename)
-        if check_well_formed_xml(file.filename) is not None:
+        if well_formed is not None:
             content = well_formed
         else:
             validation = validate_elements(file.filename)
@@ -687,9 +689,7 @@ def fire(url, file_name, fhir_extra):
     # server
     smart_client = provide_server_connection(url)
 
-    # store resources
-    read_xml_and_create_resources(file_name, smart_client)
-
+    # store resources and run quality checks
     graphs = create_graphs(file_name, smart_client)
 
     # generated by ChatGPT and customized
@@ -779,6 +779,7 @@ def teardown():
     delete_files_except_one("graphs/fhir/extra")
     delete_files_except_one("graphs/omop")
     delete_files_except_one("uploads")
+    clear_cohorts()
     try:
         os.remove("patients_ids.txt")
         os.remove("recurrence_ids.txt")
@@ -794,8 +795,6 @@ def teardown():
         print(f"Error: {e}")
         return "An error occurred", 500
 
-atexit.register(teardown)
-
 
 # checking functions
 def check_fhir_connection(url):
@@ -885,7 +884,7 @@ def download_graphs_fhir_zip():
     """
     files_path = os.path.join(os.getcwd(), "graphs/fhir")
     # Generate the ZIP file containing existing files
-    zip_buffer = create_zip_graphs(files_path, 17)
+    zip_buffer = create_zip_graphs(files_path, graph_count(FHIR_CHECKS))
 
     # Send the ZIP file as a downloadable response
     return send_file(zip_buffer, as_attachment=True, download_name="graphs_fhir.zip", mimetype='application/zip')
@@ -901,7 +900,7 @@ def download_graphs_fhir_zip_extra():
     """
     files_path = os.path.join(os.getcwd(), "graphs/fhir/extra")
     # Generate the ZIP file containing existing files
-    zip_buffer = create_zip_graphs(files_path, 47)
+    zip_buffer = create_zip_graphs(files_path, graph_count(FHIR_EXTRA_CHECKS))
 
     # Send the ZIP file as a downloadable response
     return send_file(zip_buffer, as_attachment=True, download_name="graphs_fhir_extra.zip", mimetype='application/zip')
@@ -917,7 +916,7 @@ def download_graphs_omop_zip():
     """
     files_path = os.path.join(os.getcwd(), "graphs/omop")
     # Generate the ZIP file containing existing files
-    zip_buffer = create_zip_graphs(files_path, 39)
+    zip_buffer = create_zip_graphs(files_path, graph_count(OMOP_CHECKS))
 
     # Send the ZIP file as a downloadable response
     return send_file(zip_buffer, as_attachment=True, download_name="graphs_omop.zip", mimetype='application/zip')
@@ -1027,7 +1026,7 @@ def check_graphs_done_fhir_extra():
             with open(os.path.join('graphs/fhir/extra', file_name)) as f:
                 graphs.append(json.load(f))
 
-    if len(graphs) != 47:
+    if len(graphs) != graph_count(FHIR_EXTRA_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1059,7 +1058,7 @@ def check_failures_done_fhir_extra():
         tables.append(table_html)
 
     print(len(tables))
-    if len(tables) != 28:
+    if len(tables) != report_count(FHIR_EXTRA_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1088,7 +1087,7 @@ def check_graphs_done_fhir():
             with open(os.path.join('graphs/fhir', file_name)) as f:
                 graphs.append(json.load(f))
 
-    if len(graphs) != 17:
+    if len(graphs) != graph_count(FHIR_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1120,7 +1119,7 @@ def check_failures_done_fhir():
         tables.append(table_html)
 
     print(len(tables))
-    if len(tables) != 16:
+    if len(tables) != report_count(FHIR_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1152,7 +1151,7 @@ def check_failures_done_omop():
         tables.append(table_html)
 
     print(len(tables))
-    if len(tables) != 39:
+    if len(tables) != report_count(OMOP_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1181,7 +1180,7 @@ def check_graphs_done_omop():
             with open(os.path.join('graphs/omop', file_name)) as f:
                 graphs.append(json.load(f))
 
-    if len(graphs) != 39:
+    if len(graphs) != graph_count(OMOP_CHECKS):
         graphs_done = False
     else:
         graphs_done = True
@@ -1215,6 +1214,8 @@ def qc_documentation():
 
 
 if __name__ == "__main__":
+    # processes running quality checks import this module again, they must not clean the repository
+    atexit.register(teardown)
     try:
         app.run(debug=True)
     finally:
@@ -1,5 +1,5 @@
+import uuid
 from fhirclient import client
-import xml.etree.ElementTree as ElementTree
 import fhirclient.models.patient as p
 import fhirclient.models.condition as c
 import fhirclient.models.specimen as s
@@ -11,14 +11,19 @@ from fhirclient.models.specimen import SpecimenCollection
 from fhirclient.models.identifier import Identifier
 from datetime import datetime
 from fhir_classes import Specimen, Patient, Condition
+from cohort import iter_patients, extract_patient, event_values
+from fhir_bundle import BUNDLE_SIZE, CONCURRENCY, bundle_entry, pool_connections, store_patients
 from quality_checks_fhir import *
+from check_registry import Frame, Check, run_checks
 
 
-def provide_server_connection(url):
+def provide_server_connection(url, transport=None):
     """
-    Connects to FHIR server.
+    Connects to FHIR server. The session keeps connections alive for concurrent requests.
 
     :param url: The url of FHIR server.
+    :param transport: Transport adapter of requests used for all requests to the server, e.g. of a cache proxy,
+        default transport if None.
     :return:
         FHIR client.
     """
@@ -27,6 +32,9 @@ def provide_server_connection(url):
         'api_base': url
     }
     smart = client.FHIRClient(settings=settings)
+    pool_connections(smart)
+    if transport is not None:
+        smart.server.session.mount(smart.server.base_uri, transport)
     assert not smart.ready
     smart.prepare()
     assert smart.ready
@@ -34,109 +42,79 @@ def provide_server_connection(url):
     return smart
 
 
-def read_xml_and_create_resources(file_name, smart):
+def read_xml_and_create_resources(file_name, smart, bundle_size=BUNDLE_SIZE, concurrency=CONCURRENCY,
+                                  keep_resources=False):
     """
     Parse input file, process data, store them on FHIR server.
 
     :param file_name: The path of input file.
     :param smart: FHIR client.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :param keep_resources: Keep stored resources in memory for quality checks.
     :return:
-        None
+        Dictionary with stored resources for every name of IDs file, None if keep_resources is False.
     """
-    tree = ElementTree.parse("uploads/" + file_name)
-    root = tree.getroot()
-    namespace = "{http://registry.samply.de/schemata/import_v1}"
-    result = []
-    for element in root.iter():
-        if element.tag == namespace + "BHPatient":
-            # patient
-            if element.find(namespace + "Identifier") is not None:
-                patient_id = element.find(namespace + "Identifier").text
-            else:
-                patient_id = None
-            form = element.find(namespace +
-                                "Locations").find(namespace +
-                                                  "Location").find(namespace +
-                                                                   "BasicData").find(namespace +
-                                                                                     "Form")
-            if form.find(namespace + "Dataelement_85_1") is not None:
-                sex = form.find(namespace + "Dataelement_85_1").text
-            else:
-                sex = None
+    return create_files(read_records(file_name), smart, bundle_size, concurrency, keep_resources)
 
-            if form.find(namespace + "Dataelement_3_1") is not None:
-                age_at_primary_diagnostic = form.find(namespace + "Dataelement_3_1").text
-            else:
-                age_at_primary_diagnostic = None
-
-            # condition
-            date_diagnosis = form.find(namespace + "Dataelement_51_3")
-            if date_diagnosis is not None:
-                date_diagnosis = date_diagnosis.text
-
-                # patient
-                diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
-                if age_at_primary_diagnostic is not None:
-                    birth_date = FHIRDate(str(diagnosis.year - int(age_at_primary_diagnostic)))
-                else:
-                    birth_date = None
+
+def read_records(file_name):
+    """
+    Parse input file and process data of one patient at a time,
+    so only the Bundles being stored are kept in memory.
+
+    :param file_name: The path of input file.
+    :return:
+        Generator of data of one patient: Patient, Condition and list of Specimens.
+    """
+    for element in iter_patients(file_name):
+        values = extract_patient(element, ("Sample", "Histopathology"))
+        form = values.basic_data
+
+        # patient
+        patient_id = values.identifier
+        sex = form["sex"]
+        age_at_primary_diagnostic = form["age_at_diagnosis"]
+
+        # condition
+        date_diagnosis = form["date_diagnosis"]
+        if date_diagnosis is not None:
+            # patient
+            diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
+            if age_at_primary_diagnostic is not None:
+                birth_date = FHIRDate(str(diagnosis.year - int(age_at_primary_diagnostic)))
             else:
-                date_diagnosis = None
                 birth_date = None
-            patient = Patient(patient_id, sex, birth_date)
-            events = element.find(namespace + "Locations").find(namespace + "Location").find(namespace + "Events")
-            if find_histopathology(namespace, events) is not None:
-                histopathology = find_histopathology(namespace, events).text
-            else:
-                histopathology = None
+        else:
+            birth_date = None
+        patient = Patient(patient_id, sex, birth_date)
+        histopathology = find_histopathology(values.events)
 
-            # specimen
-            specimens = find_specimens(namespace, events).copy()
+        # specimen
+        specimens = find_specimens(values.events)
 
-            result.append([patient,
-                           Condition(histopathology, date_diagnosis),
-                           specimens])
-    create_files(result, smart)
-    return None
+        yield [patient,
+               Condition(histopathology, date_diagnosis),
+               specimens]
 
 
-def find_specimens(namespace, events):
+def find_specimens(events):
     """
     Create a list of all specimens of one patient.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Specimens can be stored.
+    :param events: Values of all events of one patient, where Specimens can be stored.
     :return:
         List of all specimens.
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-        if "eventtype" in event.attrib and event.attrib.get("eventtype") == "Sample":
-
-            sample = event.find(namespace + "LogitudinalData").find(namespace + "Form1")
-            if sample.find(namespace + "Dataelement_89_3") is not None:
-                year_of_sample_connection = int(sample.find(namespace + "Dataelement_89_3").text)
-            else:
-                year_of_sample_connection = None
+    for sample in event_values(events, "Sample"):
+        year_of_sample_connection = sample["year_of_collection"]
+        if year_of_sample_connection is not None:
+            year_of_sample_connection = int(year_of_sample_connection)
 
-            if sample.find(namespace + "Dataelement_54_2") is not None:
-                sample_material_type = sample.find(namespace + "Dataelement_54_2").text
-            else:
-                sample_material_type = None
-
-            if sample.find(namespace + "Dataelement_55_2") is not None:
-                preservation_mode = sample.find(namespace + "Dataelement_55_2").text
-            else:
-                preservation_mode = None
-
-            if sample.find(namespace + "Dataelement_56_2") is not None:
-                identifier = sample.find(namespace + "Dataelement_56_2").text
-            else:
-                identifier = None
+        code, display = specimen_mapping(sample["material_type"], sample["preservation_mode"])
 
-            code, display = specimen_mapping(sample_material_type, preservation_mode)
-
-            result.append(Specimen(identifier, code, display, year_of_sample_connection))
+        result.append(Specimen(sample["sample_id"], code, display, year_of_sample_connection))
     return result
 
 
@@ -171,50 +149,45 @@ def specimen_mapping(sample_material_type, preservation_mode):
     return None, None
 
 
-def find_histopathology(namespace, events):
+def find_histopathology(events):
     """
     Find a localization of primary tumor in form Histopathology.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Histopathology can be stored.
+    :param events: Values of all events of one patient, where Histopathology can be stored.
     :return:
-        The element with localization of primary tumor.
+        The localization of primary tumor.
     """
-    for event in events.findall(namespace + "Event"):
-        if event.attrib.get("eventtype") == "Histopathology":
-            return event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_92_1")
+    for histopathology in event_values(events, "Histopathology"):
+        return histopathology["localization"]
 
 
-def create_resources(patient, condition, specimens, smart_client):
+def create_resources(patient, condition, specimens):
     """
-    Create and store resources for one patient on FHIR server.
+    Create resources for one patient as entries of transaction Bundle.
+    Condition and Specimens refer to Patient by its temporary urn:uuid fullUrl,
+    which is replaced by the assigned ID when the Bundle is stored.
 
     :param patient: The instance of class Patient.
     :param condition: The instance of class Condition.
     :param specimens: List of instances of class Specimen.
-    :param smart_client: The FHIR client.
     :return:
-        patient_url: The url of Resource Patient.
-        condition_url: The url of Resource Condition.
-        specimen_urls: The urls of Resources Specimen
+        List of pairs of the name of IDs file and Bundle entry, Patient is the first one.
     """
-    patient_url = create_patient(patient, smart_client)
-    condition_url = create_condition(condition, patient_url, smart_client)
-    specimen_urls = []
+    patient_url = "urn:uuid:" + str(uuid.uuid4())
+    entries = [("patients", bundle_entry(create_patient(patient), "Patient", patient_url)),
+               ("conditions", bundle_entry(create_condition(condition, patient_url), "Condition"))]
     for specimen in specimens:
-        specimen_urls.append(create_specimen(patient_url, specimen, smart_client))
-    return patient_url, condition_url, specimen_urls
+        entries.append(("specimens", bundle_entry(create_specimen(patient_url, specimen), "Specimen")))
+    return entries
 
 
-def create_patient(patient_info, smart_client):
+def create_patient(patient_info):
     """
-    Create and store the Resource Patient on FHIR server.
+    Create the Resource Patient.
 
     :param patient_info: The instance of class Patient.
-    :param smart_client: The FHIR client.
     :return:
-        The url of Resource Patient.
+        FHIR model of Resource Patient.
     """
     patient = p.Patient()
     if patient_info.birth_date is not None:
@@ -224,22 +197,17 @@ def create_patient(patient_info, smart_client):
     patient.identifier = [Identifier()]
     if patient_info.identifier is not None:
         patient.identifier[0].value = patient_info.identifier
+    return patient
 
-    response = store_resources(smart_client, patient, "Patient")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id+16].decode("utf-8")
 
-
-def create_condition(condition_info, patient_id, smart_client):
+def create_condition(condition_info, patient_url):
     """
-    Create and store the Resource Condition on FHIR server.
+    Create the Resource Condition.
 
     :param condition_info: The instance of class Condition.
-    :param patient_id: The url of relevant Resource Patient.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of relevant Resource Patient.
     :return:
-        The url of Resource Condition.
+        FHIR model of Resource Condition.
     """
     condition = c.Condition()
     if condition_info.date_diagnosis is not None:
@@ -263,7 +231,7 @@ def create_condition(condition_info, patient_id, smart_client):
         condition.onsetDateTime = date_time
 
     # subject (patient)
-    condition.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    condition.subject = FHIRReference({'reference': patient_url})
 
     # code
     mapping = {"C18.0": "Malignant neoplasm of cecum",
@@ -293,22 +261,17 @@ def create_condition(condition_info, patient_id, smart_client):
         code_in_json.coding = [coding]
 
         condition.code = code_in_json
+    return condition
 
-    response = store_resources(smart_client, condition, "Condition")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
 
-
-def create_specimen(patient_id, specimen_info, smart_client):
+def create_specimen(patient_url, specimen_info):
     """
-    Create and store the Resource Specimen on FHIR server.
+    Create the Resource Specimen.
 
-    :param patient_id: The url of relevant Resource Patient.
+    :param patient_url: The reference of relevant Resource Patient.
     :param specimen_info: The instance of class Specimen.
-    :param smart_client: The FHIR client.
     :return:
-        The url of Resource Specimen.
+        FHIR model of Resource Specimen.
     """
     specimen = s.Specimen()
 
@@ -343,46 +306,31 @@ def create_specimen(patient_id, specimen_info, smart_client):
     # specimen.type = type
 
     # subject
-    specimen.subject = FHIRReference({'reference': "Patient/" + patient_id})
-
-    response = store_resources(smart_client, specimen, "Specimen")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
+    specimen.subject = FHIRReference({'reference': patient_url})
+    return specimen
 
 
-def store_resources(smart_client, file, type):
+def create_files(data, smart_client, bundle_size=BUNDLE_SIZE, concurrency=CONCURRENCY, keep_resources=False):
     """
-    Store resources on FHIR server.
+    Store resources on FHIR server in concurrent transaction Bundles and
+    create files with Resurces IDs for further processing.
 
+    :param data: Iterable of data of one patient in instances of classes: Patient, Condition, Specimen,
+        it is consumed while Bundles are stored.
     :param smart_client: The FHIR client.
-    :param file: FHIR model, precursor of FHIR json.
-    :param type: Type of Resource.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :param keep_resources: Keep stored resources in memory for quality checks.
     :return:
-    """
-    server = smart_client.server
-    resource = file.as_json()
-    return server.post_json(path=type, resource_json=resource)
-
-
-def create_files(data, smart_client):
-    """
-    Create files with Resurces IDs for further processing.
-
-    :param data: Data prepared in the list of instances of classes: Patient, Condition, Specimen.
-    :param smart_client: The FHIR client.
-    :return:
-        None
+        Dictionary with stored resources for every name of IDs file, None if keep_resources is False.
     """
     # resources
-    patients = []
-    conditions = []
-    specimens = []
-    for record in data:
-        patient_url, condition_url, specimen_urls = create_resources(record[0], record[1], record[2], smart_client)
-        patients.append(patient_url)
-        conditions.append(condition_url)
-        specimens += specimen_urls
+    resources = (create_resources(record[0], record[1], record[2]) for record in data)
+    ids_files, stored = store_patients(smart_client, resources, bundle_size, concurrency, keep_resources)
+    patients = ids_files.get("patients", [])
+    conditions = ids_files.get("conditions", [])
+    specimens = ids_files.get("specimens", [])
+
     file_patients_ids = open("patients_ids.txt", "w")
     file_conditions_ids = open("conditions_ids.txt", "w")
     file_specimens_ids = open("specimens_ids.txt", "w")
@@ -395,67 +343,86 @@ def create_files(data, smart_client):
     file_patients_ids.close()
     file_conditions_ids.close()
     file_specimens_ids.close()
-    return None
-
-
-def create_graphs(file_name, client):
+    return stored
+
+
+# data frames used by quality checks, built from the stored resources
+FHIR_FRAMES = [Frame("pdf", create_patient_data_frame, ["server", "resources"]),
+               Frame("sdf", create_specimen_data_frame, ["server", "resources"]),
+               Frame("cdf", create_condition_data_frame, ["server", "resources"]),
+               # dates converted as by conformance checks, the checks after them in FHIR_CHECKS use converted dates
+               Frame("pdf_dates", convert_dates, ["pdf"], arguments={"columns": ["birthDate"]}),
+               Frame("sdf_dates", convert_dates, ["sdf"], arguments={"columns": ["collection_collectedDateTime"]}),
+               Frame("cdf_dates", convert_dates, ["cdf"], arguments={"columns": ["recordedDate", "onsetDateTime"]})]
+
+# quality checks in the order of graphs on the FHIR dashboard
+FHIR_CHECKS = [
+    Check("completeness_patient", "Completeness of patients", completeness, ["pdf"]),
+    Check("completeness_specimen", "Completeness of specimens", completeness, ["sdf"]),
+    Check("completeness_condition", "Completeness of conditions", completeness, ["cdf"]),
+
+    Check("uniqueness_patient", "Uniqueness of patients", uniqueness, ["pdf"],
+          ["reports/fhir/uniquenesspatient.csv"], arguments={"name": "patient"}),
+    Check("uniqueness_specimen", "Uniqueness of specimens", uniqueness, ["pdf"],
+          ["reports/fhir/uniquenessspecimen.csv"], arguments={"name": "specimen"}),
+    Check("uniqueness_condition", "Uniqueness of conditions", uniqueness, ["pdf"],
+          ["reports/fhir/uniquenesscondition.csv"], arguments={"name": "condition"}),
+
+    Check("conformance_patient", "Conformance of patients", conformance_patient, ["pdf"]),
+    Check("conformance_condition", "Conformance of conditions", conformance_condition, ["cdf"]),
+    Check("conformance_specimen", "Conformance of specimens", conformance_specimen, ["sdf"]),
+
+    Check("conformance_relational_specimen", "Relational conformance of specimens", conformance_relational,
+          ["sdf", "server", "pdf"]),
+    Check("conformance_relational_condition", "Relational conformance of conditions", conformance_relational,
+          ["cdf", "server", "pdf"]),
+    Check("conformance_computational", "Computational conformance", conformance_computational,
+          ["pdf_dates", "sdf_dates", "cdf_dates"]),
+
+    Check("age_at_primary_diagnosis", "Suspiciously young patient", age_at_primary_diagnosis,
+          ["pdf_dates", "cdf_dates"],
+          ["reports/fhir/too_young_patients.csv"]),
+    Check("diagnosis_in_future", "Initial diagnosis date is in the future", diagnosis_in_future, ["cdf_dates"],
+          ["reports/fhir/diagnosis_in_future.csv"]),
+    Check("missing_collection_collectedDateTime", "Patients without date of collection of specimen",
+          missing_collection_collectedDateTime, ["pdf_dates", "sdf_dates"],
+          ["reports/fhir/patients_without_collection_collectedDateTime.csv",
+           "reports/fhir/patients_with_collection_collectedDateTime.csv"]),
+    Check("patients_without_specimen_type_text", "Patients without type of specimen",
+          patients_without_specimen_type_text, ["pdf_dates", "sdf_dates"],
+          ["reports/fhir/patients_without_specimen_type_text.csv"]),
+
+    Check("patients_without_condition_values", "Patients without values of condition",
+          patients_without_condition_values, ["pdf_dates", "cdf_dates"],
+          ["reports/fhir/patients_without_code_coding_system.csv",
+           "reports/fhir/patients_without_ccode_coding_code.csv",
+           "reports/fhir/patients_without_code_coding_display.csv",
+           "reports/fhir/patients_without_code_text.csv",
+           "reports/fhir/patients_without_subject_reference.csv",
+           "reports/fhir/patients_without_clinicalStatus_coding_system.csv",
+           "reports/fhir/patients_without_clinicalStatus_coding_code.csv",
+           "reports/fhir/patients_without_clinicalStatus_coding_display.csv"])
+]
+
+
+def create_graphs(file_name, client, read_back=False, read_client=None):
     """
     Store data from file_name in provided server, then create
-    pandas dataframes and run all quality checks from quality_checks_fhir.py
+    pandas dataframes and run all quality checks of FHIR_CHECKS concurrently
 
     Args:
         file_name: Name of input file with data.
         client: FHIR client.
+        read_back: Read stored resources back from the server instead of using the resources kept by the loader,
+            this verifies what the server really stored.
+        read_client: FHIR client used by quality checks to read resources, e.g. of a read replica or a cache proxy,
+            client if None.
 
     Returns:
         List of figures from data quality checks.
 
     """
-    read_xml_and_create_resources(file_name, client)
-
-    pdf = create_patient_data_frame(client.server)
-    sdf = create_specimen_data_frame(client.server)
-    cdf = create_condition_data_frame(client.server)
-
-    graphs = []
-    p_completeness = completeness(pdf).to_json()
-    graphs.append(p_completeness)
-    s_completeness = completeness(sdf).to_json()
-    graphs.append(s_completeness)
-    c_completeness = completeness(cdf).to_json()
-    graphs.append(c_completeness)
-
-    p_uniqueness = uniqueness(pdf, "patient").to_json()
-    graphs.append(p_uniqueness)
-    s_uniqueness = uniqueness(pdf, "specimen").to_json()
-    graphs.append(s_uniqueness)
-    c_uniqueness = uniqueness(pdf, "condition").to_json()
-    graphs.append(c_uniqueness)
-
-    p_conformance = conformance_patient(pdf).to_json()
-    graphs.append(p_conformance)
-    c_conformance = conformance_condition(cdf).to_json()
-    graphs.append(c_conformance)
-    s_conformance = conformance_specimen(sdf).to_json()
-    graphs.append(s_conformance)
-
-    s_conformance_r = conformance_relational(sdf, client.server).to_json()
-    graphs.append(s_conformance_r)
-    c_conformance_r = conformance_relational(cdf, client.server).to_json()
-    graphs.append(c_conformance_r)
-    conformance_c = conformance_computational(pdf, sdf, cdf).to_json()
-    graphs.append(conformance_c)
-
-    age = age_at_primary_diagnosis(pdf, cdf).to_json()
-    graphs.append(age)
-    diagnosis = diagnosis_in_future(cdf).to_json()
-    graphs.append(diagnosis)
-    missing = missing_collection_collectedDateTime(pdf, sdf).to_json()
-    graphs.append(missing)
-    patients_without_specimen = patients_without_specimen_type_text(pdf, sdf).to_json()
-    graphs.append(patients_without_specimen)
-
-    patients = patients_without_condition_values(pdf, cdf).to_json()
-    graphs.append(patients)
-
-    return graphs
\ No newline at end of file
+    resources = read_xml_and_create_resources(file_name, client, keep_resources=not read_back)
+    server = (read_client or client).server
+
+    return run_checks(FHIR_CHECKS, {"server": server, "resources": resources}, FHIR_FRAMES)
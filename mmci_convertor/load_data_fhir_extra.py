@@ -1,5 +1,6 @@
+import tempfile
+import uuid
 from fhirclient import client
-import xml.etree.ElementTree as ElementTree
 import fhirclient.models.patient as p
 import fhirclient.models.observation as o
 import fhirclient.models.condition as c
@@ -17,14 +18,32 @@ from fhirclient.models.specimen import SpecimenCollection
 from fhirclient.models.identifier import Identifier
 from datetime import timedelta, datetime
 from fhir_classes_extra import *
+from cohort import iter_patients, extract_patient, event_values
+from fhir_bundle import BUNDLE_SIZE, CONCURRENCY, bundle_entry, pool_connections, store_patients
+from fhir_export import export_since, exported_resources
 from quality_checks_fhir_extra import *
+from check_registry import Frame, Check, run_checks
 
+# names of IDs files and types of their resources
+RESOURCE_TYPES = {"patients": "Patient",
+                  "recurrence": "Observation",
+                  "time_observation": "Observation",
+                  "tnm": "Observation",
+                  "surgery": "Procedure",
+                  "radiation": "Procedure",
+                  "targeteds": "Procedure",
+                  "response": "Observation",
+                  "conditions": "Condition",
+                  "specimens": "Specimen"}
 
-def provide_server_connection(url):
+
+def provide_server_connection(url, transport=None):
     """
-    Connects to FHIR server.
+    Connects to FHIR server. The session keeps connections alive for concurrent requests.
 
     :param url: The url of FHIR server.
+    :param transport: Transport adapter of requests used for all requests to the server, e.g. of a cache proxy,
+        default transport if None.
     :return:
         FHIR client.
     """
@@ -33,6 +52,9 @@ def provide_server_connection(url):
         'api_base': url
     }
     smart = client.FHIRClient(settings=settings)
+    pool_connections(smart)
+    if transport is not None:
+        smart.server.session.mount(smart.server.base_uri, transport)
     assert not smart.ready
     smart.prepare()
     assert smart.ready
@@ -40,122 +62,102 @@ def provide_server_connection(url):
     return smart
 
 
-def read_xml_and_create_resources(file_name, smart):
+def read_xml_and_create_resources(file_name, smart, bundle_size=BUNDLE_SIZE, concurrency=CONCURRENCY,
+                                  keep_resources=False):
     """
     Parse input file, process data, store them on FHIR server.
 
     :param file_name: The path of input file.
     :param smart: FHIR client.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :param keep_resources: Keep stored resources in memory for quality checks.
     :return:
-        None
+        Dictionary with stored resources for every name of IDs file, None if keep_resources is False.
     """
-    tree = ElementTree.parse("uploads/" + file_name)
-    root = tree.getroot()
-    namespace = "{http://registry.samply.de/schemata/import_v1}"
-    result = []
-    for element in root.iter():
-        if element.tag == namespace + "BHPatient":
-            # patient
-            if element.find(namespace + "Identifier") is not None:
-                patient_id = element.find(namespace + "Identifier").text
-            else:
-                patient_id = None
-            form = element.find(namespace +
-                                "Locations").find(namespace +
-                                                  "Location").find(namespace +
-                                                                   "BasicData").find(namespace +
-                                                                                     "Form")
-            sex = form.find(namespace + "Dataelement_85_1")
-            if sex is not None:
-                sex = sex.text
-            if form.find(namespace + "Dataelement_3_1") is not None:
-                age_at_primary_diagnostic = form.find(namespace + "Dataelement_3_1").text
-            else:
-                age_at_primary_diagnostic = None
-            if form.find(namespace + "Dataelement_5_2") is not None:
-                vital_status = form.find(namespace + "Dataelement_5_2").text
-            else:
-                vital_status = None
-            if form.find(namespace + "Dataelement_7_2") is not None:
-                overall_survival = form.find(namespace + "Dataelement_7_2").text
-            else:
-                overall_survival = None
-            if form.find(namespace + "Dataelement_6_3") is not None:
-                last_update = form.find(namespace + "Dataelement_6_3").text
-            else:
-                last_update = None
-            time_observation = TimeObservation(overall_survival, last_update)
+    return create_files(read_records(file_name), smart, bundle_size, concurrency, keep_resources)
 
-            if form.find(namespace + "Dataelement_51_3") is not None:
-                date_diagnosis = form.find(namespace + "Dataelement_51_3").text
-                diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
-            else:
-                diagnosis = None
 
-            if diagnosis is not None and age_at_primary_diagnostic is not None:
-                birth_date = FHIRDate(str(diagnosis.year - int(age_at_primary_diagnostic)))
-            else:
-                birth_date = None
-
-            if vital_status != "ALIVE":
-                deceased_boolean = True
-                if form.find(namespace + "Dataelement_6_3") is not None:
-                    timestamp = form.find(namespace + "Dataelement_6_3").text
-                else:
-                    timestamp = None
-            else:
-                deceased_boolean = False
-                timestamp = None
-            patient = Patient(patient_id, deceased_boolean, timestamp, sex, birth_date)
-
-            # recurrence
-            recurrence = form.find(namespace + "Dataelement_4_3")
-            if recurrence is not None:
-                recurrence = recurrence.text
-
-            # condition
-            date_diagnosis = form.find(namespace + "Dataelement_51_3")
-            if date_diagnosis is not None:
-                date_diagnosis = date_diagnosis.text
-            events = element.find(namespace + "Locations").find(namespace + "Location").find(namespace + "Events")
-
-            # tnm
-            (localization, tnm_t, tnm_n, tnm_m, stage,
-             uicc_version, grade, morphology) = find_histopathology(namespace, events)
-            tnm_t_code, tnm_t_display = map_tnm_pt(tnm_t)
-            tnm_n_code, tnm_n_display = map_tnm_pn(tnm_n)
-            tnm_m_code, tnm_m_display = map_tnm_pm(tnm_m)
-            stage_code, stage_display = map_stage(stage)
-            uicc_code, uicc_display = map_uicc(uicc_version)
-            grade_code, grade_display = map_grade(grade)
-            morphology_code, morphology_display = map_morphology(morphology)
-
-            tnm = TNM(tnm_t_code, tnm_t_display, tnm_n_code, tnm_n_display, tnm_m_code,
-                      tnm_m_display, stage_code, stage_display, uicc_code, uicc_display,
-                      grade_code, grade_display, morphology_code, morphology_display)
-
-            # response
-            responses = find_response(namespace, events, diagnosis)
-
-            # surgery
-            surgeries = find_surgeries(namespace, events, diagnosis)
-
-            # radiation_therapy
-            radiations = find_radiation(namespace, events, diagnosis)
-
-            # targeted_therape
-            targeteds = find_targeteds(namespace, events, diagnosis)
-
-            # specimen
-            specimens = find_specimens(namespace, events)
-
-            record = Record(patient, recurrence, time_observation, responses,
-                           surgeries, radiations, targeteds, tnm,
-                           Condition(localization, date_diagnosis),
-                           specimens)
-            result.append(record)
-    create_files(result, smart)
-    return None
+def read_records(file_name):
+    """
+    Parse input file and process data of one patient at a time,
+    so only the Bundles being stored are kept in memory.
+
+    :param file_name: The path of input file.
+    :return:
+        Generator of instances of class Record.
+    """
+    for element in iter_patients(file_name):
+        values = extract_patient(element)
+        form = values.basic_data
+        events = values.events
+
+        # patient
+        patient_id = values.identifier
+        sex = form["sex"]
+        age_at_primary_diagnostic = form["age_at_diagnosis"]
+        vital_status = form["vital_status"]
+        overall_survival = form["overall_survival"]
+        last_update = form["last_update"]
+        time_observation = TimeObservation(overall_survival, last_update)
+
+        date_diagnosis = form["date_diagnosis"]
+        if date_diagnosis is not None:
+            diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
+        else:
+            diagnosis = None
+
+        if diagnosis is not None and age_at_primary_diagnostic is not None:
+            birth_date = FHIRDate(str(diagnosis.year - int(age_at_primary_diagnostic)))
+        else:
+            birth_date = None
+
+        if vital_status != "ALIVE":
+            deceased_boolean = True
+            timestamp = last_update
+        else:
+            deceased_boolean = False
+            timestamp = None
+        patient = Patient(patient_id, deceased_boolean, timestamp, sex, birth_date)
+
+        # recurrence
+        recurrence = form["recurrence"]
+
+        # tnm
+        (localization, tnm_t, tnm_n, tnm_m, stage,
+         uicc_version, grade, morphology) = find_histopathology(events)
+        tnm_t_code, tnm_t_display = map_tnm_pt(tnm_t)
+        tnm_n_code, tnm_n_display = map_tnm_pn(tnm_n)
+        tnm_m_code, tnm_m_display = map_tnm_pm(tnm_m)
+        stage_code, stage_display = map_stage(stage)
+        uicc_code, uicc_display = map_uicc(uicc_version)
+        grade_code, grade_display = map_grade(grade)
+        morphology_code, morphology_display = map_morphology(morphology)
+
+        tnm = TNM(tnm_t_code, tnm_t_display, tnm_n_code, tnm_n_display, tnm_m_code,
+                  tnm_m_display, stage_code, stage_display, uicc_code, uicc_display,
+                  grade_code, grade_display, morphology_code, morphology_display)
+
+        # response
+        responses = find_response(events, diagnosis)
+
+        # surgery
+        surgeries = find_surgeries(events, diagnosis)
+
+        # radiation_therapy
+        radiations = find_radiation(events, diagnosis)
+
+        # targeted_therape
+        targeteds = find_targeteds(events, diagnosis)
+
+        # specimen
+        specimens = find_specimens(events)
+
+        record = Record(patient, recurrence, time_observation, responses,
+                       surgeries, radiations, targeteds, tnm,
+                       Condition(localization, date_diagnosis),
+                       specimens)
+        yield record
 
 
 def map_tnm_pt(tumor):
@@ -342,115 +344,87 @@ def map_surgery(primary_surgery, secondary_surgery):
     return "Unknown (qualifier value)", 261665006, note
 
 
-def find_surgeries(namespace, events, initial_diagnosis):
+def find_surgeries(events, initial_diagnosis):
     """
     Find all surgeries for one patient.
 
     Args:
-        namespace: The namespace of file.
-        events: XML element, where Surgery can be stored.
+        events: Values of all events of one patient, where Surgery can be stored.
         initial_diagnosis: Date of first diagnosis.
 
     Returns: List of all surgeries for one patient, stored in Surgery class.
 
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-
-        if event.attrib.get("eventtype") == "Surgery":
-            primary_surgery = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_49_1")
-            if primary_surgery is not None:
-                primary_surgery = primary_surgery.text
-            secondary_surgery_node = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_67_1")
-            secondary_surgery = None if secondary_surgery_node is None else secondary_surgery_node.text
-            surgery_name, surgery_code, note = map_surgery(primary_surgery, secondary_surgery)
-            start_week = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_8_3")
-            if start_week is not None:
-                start_week = int(start_week.text)
-                date = initial_diagnosis + timedelta(weeks=start_week)
-                time = date.strftime("%Y-%m-%d")
-            else:
-                time = None
-            radicality = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_9_2")
-            if radicality is not None:
-                radicality = radicality.text
-            surgery_radicality_name, surgery_radicality_code = mapp_surgery_radicality(radicality)
-            location = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_93_1")
-            if location is not None:
-                location = location.text
-            else:
-                location = None
-            body_site_code = body_site_mapping_codes(location)
-            body_site_name = body_site_mapping_names(location)
-            if surgery_code is not None:
-                result.append(Surgery(time, surgery_name, surgery_code, surgery_radicality_name, surgery_radicality_code, body_site_name, body_site_code, note))
+    for surgery in event_values(events, "Surgery"):
+        surgery_name, surgery_code, note = map_surgery(surgery["surgery_type"], surgery["other_surgery_type"])
+        start_week = surgery["start_week"]
+        if start_week is not None:
+            start_week = int(start_week)
+            date = initial_diagnosis + timedelta(weeks=start_week)
+            time = date.strftime("%Y-%m-%d")
+        else:
+            time = None
+        surgery_radicality_name, surgery_radicality_code = mapp_surgery_radicality(surgery["radicality"])
+        location = surgery["location"]
+        body_site_code = body_site_mapping_codes(location)
+        body_site_name = body_site_mapping_names(location)
+        if surgery_code is not None:
+            result.append(Surgery(time, surgery_name, surgery_code, surgery_radicality_name, surgery_radicality_code, body_site_name, body_site_code, note))
     return result
 
 
-def find_radiation(namespace, events, initial_diagnosis):
+def find_radiation(events, initial_diagnosis):
     """
     Find all radiation therapies for one patient.
 
     Args:
-        namespace: The namespace of file.
-        events: XML element, where Radiation Therapy can be stored.
+        events: Values of all events of one patient, where Radiation Therapy can be stored.
         initial_diagnosis: Date of first diagnosis.
 
     Returns: List of all radiation therapies for one patient, stored in Radiation Therapy class.
 
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-        if event.attrib.get("eventtype") == "Radiation therapy":
-            start_week = event.find(namespace + "LogitudinalData").find(namespace + "Form5").find(
-                namespace + "Dataelement_12_4")
-            if start_week is not None:
-                start_week = int(start_week.text)
-            end_week = event.find(namespace + "LogitudinalData").find(namespace + "Form5").find(
-                namespace + "Dataelement_13_2")
-            if end_week is not None:
-                end_week = int(end_week.text)
-            start_date = initial_diagnosis + timedelta(weeks=start_week)
-            end_date = initial_diagnosis + timedelta(weeks=end_week)
-            start = FHIRDate(start_date.strftime("%Y-%m-%d"))
-            end = FHIRDate(end_date.strftime("%Y-%m-%d"))
-            result.append(RadiationTherapy(start, end))
+    for radiation in event_values(events, "Radiation therapy"):
+        start_week = radiation["start_week"]
+        if start_week is not None:
+            start_week = int(start_week)
+        end_week = radiation["end_week"]
+        if end_week is not None:
+            end_week = int(end_week)
+        start_date = initial_diagnosis + timedelta(weeks=start_week)
+        end_date = initial_diagnosis + timedelta(weeks=end_week)
+        start = FHIRDate(start_date.strftime("%Y-%m-%d"))
+        end = FHIRDate(end_date.strftime("%Y-%m-%d"))
+        result.append(RadiationTherapy(start, end))
     return result
 
 
-def find_targeteds(namespace, events, initial_diagnosis):
+def find_targeteds(events, initial_diagnosis):
     """
     Find all targeted therapies for one patient.
 
     Args:
-        namespace: The namespace of file.
-        events: XML element, where Targeted Therapy can be stored.
+        events: Values of all events of one patient, where Targeted Therapy can be stored.
         initial_diagnosis: Date of first diagnosis.
 
     Returns: List of all targeted therapies for one patient, stored in Targeted Therapy class.
 
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-        if event.attrib.get("eventtype") == "Targeted Therapy":
-            start_week = event.find(namespace + "LogitudinalData").find(namespace + "Form6").find(
-                namespace + "Dataelement_35_3")
-            if start_week is not None:
-                start_week = int(start_week.text)
-            end_week = event.find(namespace + "LogitudinalData").find(namespace + "Form6").find(
-                namespace + "Dataelement_36_1")
-            if end_week is not None:
-                end_week = int(end_week.text)
-            start_date = initial_diagnosis + timedelta(weeks=start_week)
-            end_date = initial_diagnosis + timedelta(weeks=end_week)
-            start = FHIRDate(start_date.strftime("%Y-%m-%d"))
-            end = FHIRDate(end_date.strftime("%Y-%m-%d"))
-            result.append(TargetedTherapy(start, end))
+    for targeted in event_values(events, "Targeted Therapy"):
+        start_week = targeted["start_week"]
+        if start_week is not None:
+            start_week = int(start_week)
+        end_week = targeted["end_week"]
+        if end_week is not None:
+            end_week = int(end_week)
+        start_date = initial_diagnosis + timedelta(weeks=start_week)
+        end_date = initial_diagnosis + timedelta(weeks=end_week)
+        start = FHIRDate(start_date.strftime("%Y-%m-%d"))
+        end = FHIRDate(end_date.strftime("%Y-%m-%d"))
+        result.append(TargetedTherapy(start, end))
     return result
 
 
@@ -475,34 +449,26 @@ def map_response(response):
     return None, None
 
 
-def find_response(namespace, events, initial_diagnosis):
+def find_response(events, initial_diagnosis):
     """
     Find all "Response to therapy" forms for one patient.
 
     Args:
-        namespace: The namespace of file.
-        events: XML element, where Targeted Therapy can be stored.
+        events: Values of all events of one patient, where Response to therapy can be stored.
         initial_diagnosis: Date of first diagnosis.
 
     Returns: List of all "Response to therapy" forms for one patient, stored in "Response" class.
 
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-
-        if event.attrib.get("eventtype") == "Response to therapy":
-            content = event.find(namespace + "LogitudinalData").find(namespace + "Form4").find(
-                namespace + "Dataelement_33_1")
-            if content is not None:
-                content = content.text
-            time = event.find(namespace + "LogitudinalData").find(namespace + "Form4").find(
-                namespace + "Dataelement_34_1")
-            if time is not None:
-                time = int(time.text)
-            time = initial_diagnosis + timedelta(weeks=time)
-            time = time.strftime("%Y-%m-%d")
-            code, display = map_response(content)
-            result.append(Response(code, display, time))
+    for response in event_values(events, "Response to therapy"):
+        time = response["week"]
+        if time is not None:
+            time = int(time)
+        time = initial_diagnosis + timedelta(weeks=time)
+        time = time.strftime("%Y-%m-%d")
+        code, display = map_response(response["response"])
+        result.append(Response(code, display, time))
     return result
 
 def body_site_mapping_codes(location):
@@ -582,36 +548,23 @@ def mapp_surgery_radicality(radicality):
     return None, None
 
 
-def find_specimens(namespace, events):
+def find_specimens(events):
     """
     Create a list of all specimens of one patient.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Specimens can be stored.
+    :param events: Values of all events of one patient, where Specimens can be stored.
     :return:
         List of all specimens.
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-        if "eventtype" in event.attrib and event.attrib.get("eventtype") == "Sample":
-
-            sample = event.find(namespace + "LogitudinalData").find(namespace + "Form1")
-            year_of_sample_connection = sample.find(namespace + "Dataelement_89_3")
-            if year_of_sample_connection is not None:
-                year_of_sample_connection = FHIRDate(year_of_sample_connection.text)
-            sample_material_type = sample.find(namespace + "Dataelement_54_2")
-            if sample_material_type is not None:
-                sample_material_type = sample_material_type.text
-            preservation_mode = sample.find(namespace + "Dataelement_55_2")
-            if preservation_mode is not None:
-                preservation_mode = preservation_mode.text
-            identifier = sample.find(namespace + "Dataelement_56_2")
-            if identifier is not None:
-                identifier = identifier.text
-
-            code, display = specimen_mapping(sample_material_type, preservation_mode)
-
-            result.append(Specimen(identifier, code, display, year_of_sample_connection))
+    for sample in event_values(events, "Sample"):
+        year_of_sample_connection = sample["year_of_collection"]
+        if year_of_sample_connection is not None:
+            year_of_sample_connection = FHIRDate(year_of_sample_connection)
+
+        code, display = specimen_mapping(sample["material_type"], sample["preservation_mode"])
+
+        result.append(Specimen(sample["sample_id"], code, display, year_of_sample_connection))
     return result
 
 
@@ -646,103 +599,59 @@ def specimen_mapping(sample_material_type, preservation_mode):
     return None, None
 
 
-def find_histopathology(namespace, events):
+def find_histopathology(events):
     """
-    Find a localization of primary tumor in form Histopathology.
+    Find a localization of primary tumor, tnm, stage, uicc version, grade and morphology in form Histopathology.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Histopathology can be stored.
+    :param events: Values of all events of one patient, where Histopathology can be stored.
     :return:
-        The element with localization of primary tumor.
-    """
-    for event in events.findall(namespace + "Event"):
-        if event.attrib.get("eventtype") == "Histopathology":
-            localization =  event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_92_1")
-            if localization is not None:
-                localization = localization.text
-            uicc_version = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_73_3")
-            if uicc_version is not None:
-                uicc_version = uicc_version.text
-            tnm_t = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_71_1")
-            if tnm_t is not None:
-                tnm_t = tnm_t.text
-            tnm_n = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_77_1")
-            if tnm_n is not None:
-                tnm_n = tnm_n.text
-            tnm_m = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_75_1")
-            if tnm_m is not None:
-                tnm_m = tnm_m.text
-            stage = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_70_2")
-            if stage is not None:
-                stage = stage.text
-            grade = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_83_1")
-            if grade is not None:
-                grade = grade.text
-            morphology = event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_91_1")
-            if morphology is not None:
-                morphology = morphology.text
-            return localization, tnm_t, tnm_n, tnm_m, stage, uicc_version, grade, morphology
-
-
-def create_resources(record, smart_client):
-    """
-    Create and store resources for one patient on FHIR server.
+        The values of the first form Histopathology.
+    """
+    for histopathology in event_values(events, "Histopathology"):
+        return (histopathology["localization"], histopathology["primary_tumor"], histopathology["lymph_nodes"],
+                histopathology["metastasis"], histopathology["stage"], histopathology["uicc_version"],
+                histopathology["grade"], histopathology["morphology"])
+
+
+def create_resources(record):
+    """
+    Create resources for one patient as entries of transaction Bundle.
+    All resources refer to Patient by its temporary urn:uuid fullUrl,
+    which is replaced by the assigned ID when the Bundle is stored.
 
     :param record: The instance of class Record.
-    :param smart_client: The FHIR client.
     :return:
-        patient_url: The url of Resource Patient.
-        time_observation_url: The url of Resource Observation. (TimeObservation)
-        responses_url: The url of Resource Observation. (Response)
-        surgeries_url: The url of Resource Procedure. (Surgery)
-        radiations_url: The url of Resource Procedure. (RadiationTherapy)
-        targeteds_url: The url of Resource Procedure. (TargetedTherapy)
-        tnm_url: The url of Resource Observation. (TNM)
-        condition_url: The url of Resource Condition.
-        specimen_urls: The urls of Resources Specimen.
-    """
-    patient_url = create_patient(record.patient, smart_client)
-    recurrence_url = None
+        List of pairs of the name of IDs file and Bundle entry, Patient is the first one.
+    """
+    patient_url = "urn:uuid:" + str(uuid.uuid4())
+    entries = [("patients", bundle_entry(create_patient(record.patient), "Patient", patient_url))]
     if record.recurrence is not None:
-        recurrence_url = create_recurrence_observation(record.recurrence, patient_url, smart_client)
-    time_observation_url = create_time_observation(record.time_observation, patient_url, smart_client)
-    responses_url = []
+        entries.append(("recurrence", bundle_entry(create_recurrence_observation(record.recurrence, patient_url),
+                                                   "Observation")))
+    entries.append(("time_observation", bundle_entry(create_time_observation(record.time_observation, patient_url),
+                                                     "Observation")))
     for response in record.responses:
-        responses_url.append(create_response(response, patient_url, smart_client))
-    surgeries_url = []
+        entries.append(("response", bundle_entry(create_response(response, patient_url), "Observation")))
     for surgery in record.surgeries:
-        surgeries_url.append(create_surgery(surgery, patient_url, smart_client))
-    radiations_url = []
+        entries.append(("surgery", bundle_entry(create_surgery(surgery, patient_url), "Procedure")))
     for radiation in record.radiations:
-        radiations_url.append(create_radiation_therapy(radiation, patient_url, smart_client))
-    targeteds_url = []
+        entries.append(("radiation", bundle_entry(create_radiation_therapy(radiation, patient_url), "Procedure")))
     for targeted in record.targeteds:
-        targeteds_url.append(create_targeted(targeted, patient_url, smart_client))
-    tnm_url = create_tnm(record.tnm, patient_url, smart_client)
-    condition_url = create_condition(record.condition, patient_url, smart_client)
-    specimen_urls = []
+        entries.append(("targeteds", bundle_entry(create_targeted(targeted, patient_url), "Procedure")))
+    entries.append(("tnm", bundle_entry(create_tnm(record.tnm, patient_url), "Observation")))
+    entries.append(("conditions", bundle_entry(create_condition(record.condition, patient_url), "Condition")))
     for specimen in record.specimens:
-        specimen_urls.append(create_specimen(patient_url, specimen, smart_client))
-    return (patient_url, recurrence_url, time_observation_url, responses_url, surgeries_url,
-            radiations_url, targeteds_url, tnm_url, condition_url, specimen_urls)
+        entries.append(("specimens", bundle_entry(create_specimen(patient_url, specimen), "Specimen")))
+    return entries
 
 
-def create_patient(patient_info, smart_client):
+def create_patient(patient_info):
     """
-    Create and store the Resource Patient on FHIR server.
+    Create the Resource Patient.
 
     :param patient_info: The instance of class Patient.
-    :param smart_client: The FHIR client.
     :return:
-        The url of Resource Patient.
+        FHIR model of Resource Patient.
     """
     patient = p.Patient()
     if patient_info.birth_date is not None:
@@ -756,25 +665,20 @@ def create_patient(patient_info, smart_client):
     patient.identifier = [Identifier()]
     if patient_info.identifier is not None:
         patient.identifier[0].value = patient_info.identifier
-
-    response = store_resources(smart_client, patient, "Patient")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id+16].decode("utf-8")
+    return patient
 
 
-def create_recurrence_observation(recurrence_observation, patient_id, smart_client):
+def create_recurrence_observation(recurrence_observation, patient_url):
     """
-    Create and store the Resource Observation on FHIR server.
+    Create the Resource Observation.
     The resource should represent recurrence observation.
 
     Args:
         recurrence_observation: The recurrence diagnosis time interval.
-        patient_id: The url of patient subject.
-        smart_client: The FHIR client.
+        patient_url: The reference of patient subject.
 
     Returns:
-        The url of Resource Observation.
+        FHIR model of Resource Observation.
     """
     observation = o.Observation()
 
@@ -793,7 +697,7 @@ def create_recurrence_observation(recurrence_observation, patient_id, smart_clie
     observation.code = code_wrapper
 
     # subject
-    observation.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    observation.subject = FHIRReference({'reference': patient_url})
 
     # valueQuantity
     value = Quantity()
@@ -803,23 +707,18 @@ def create_recurrence_observation(recurrence_observation, patient_id, smart_clie
     value.code = "wk"
 
     observation.valueQuantity = value
-
-    response = store_resources(smart_client, observation, "Observation")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id+16].decode("utf-8")
+    return observation
 
 
-def create_time_observation(time_observation, patient_id, smart_client):
+def create_time_observation(time_observation, patient_url):
     """
-    Create and store the Resource Observation on FHIR server.
+    Create the Resource Observation.
     The resource should represent time observation.
 
     :param time_observation: The instance of class TimeObservation.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Observation.
+        FHIR model of Resource Observation.
     """
     observation = o.Observation()
 
@@ -838,7 +737,7 @@ def create_time_observation(time_observation, patient_id, smart_client):
     observation.code = code_wrapper
 
     # subject
-    observation.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    observation.subject = FHIRReference({'reference': patient_url})
 
     # effectiveDateTime
     if time_observation.last_update is not None:
@@ -855,23 +754,18 @@ def create_time_observation(time_observation, patient_id, smart_client):
     value.code = "wk"
 
     observation.valueQuantity = value
-
-    response = store_resources(smart_client, observation, "Observation")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id+16].decode("utf-8")
+    return observation
 
 
-def create_tnm(tnm, patient_id, smart_client):
+def create_tnm(tnm, patient_url):
     """
-    Create and store the Resource Observation on FHIR server.
+    Create the Resource Observation.
     The resource should represent tnm and other information about histopathology of primary findings.
 
     :param tnm: The instance of class TNM.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Observation.
+        FHIR model of Resource Observation.
     """
     observation = o.Observation()
 
@@ -899,7 +793,7 @@ def create_tnm(tnm, patient_id, smart_client):
     observation.code = code
 
     # subject
-    observation.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    observation.subject = FHIRReference({'reference': patient_url})
 
     # method
     uicc_version = Coding()
@@ -1071,23 +965,18 @@ def create_tnm(tnm, patient_id, smart_client):
 
     # add all
     observation.component = [component_t, component_n, component_m, component_morpho, component_grade]
-
-    response = store_resources(smart_client, observation, "Observation")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id+16].decode("utf-8")
+    return observation
 
 
-def create_surgery(surgery_info, patient_id, smart_client):
+def create_surgery(surgery_info, patient_url):
     """
-    Create and store the Resource Procedure on FHIR server.
+    Create the Resource Procedure.
     The resource should represent surgery.
 
     :param surgery_info: The instance of class Surgery.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Procedure.
+        FHIR model of Resource Procedure.
     """
     surgery = pro.Procedure()
 
@@ -1107,7 +996,7 @@ def create_surgery(surgery_info, patient_id, smart_client):
         surgery.code = clinical_status
 
     # subject
-    surgery.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    surgery.subject = FHIRReference({'reference': patient_url})
 
     # performedPeriod
     if surgery_info.start is not None:
@@ -1146,23 +1035,18 @@ def create_surgery(surgery_info, patient_id, smart_client):
         note.text = surgery_info.note
 
         surgery.note = [note]
-
-    response = store_resources(smart_client, surgery, "Procedure")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
+    return surgery
 
 
-def create_radiation_therapy(radiation_info, patient_id, smart_client):
+def create_radiation_therapy(radiation_info, patient_url):
     """
-    Create and store the Resource Procedure on FHIR server.
+    Create the Resource Procedure.
     The resource should represent surgery.
 
     :param radiation_info: The instance of class RadiationTherapy.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Procedure.
+        FHIR model of Resource Procedure.
     """
     radiation = pro.Procedure()
 
@@ -1181,7 +1065,7 @@ def create_radiation_therapy(radiation_info, patient_id, smart_client):
     radiation.code = code
 
     # subject
-    radiation.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    radiation.subject = FHIRReference({'reference': patient_url})
 
     # start
     radiation_period = period.Period()
@@ -1193,23 +1077,18 @@ def create_radiation_therapy(radiation_info, patient_id, smart_client):
         radiation_period.end = radiation_info.end
 
     radiation.performedPeriod = radiation_period
+    return radiation
 
-    response = store_resources(smart_client, radiation, "Procedure")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
 
-
-def create_response(response_info, patient_id, smart_client):
+def create_response(response_info, patient_url):
     """
-    Create and store the Resource Observation on FHIR server.
+    Create the Resource Observation.
     The resource should represent Response to Therapy.
 
     :param response_info: The instance of class Response.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Observation.
+        FHIR model of Resource Observation.
     """
     observation = o.Observation()
 
@@ -1239,7 +1118,7 @@ def create_response(response_info, patient_id, smart_client):
     observation.code = code
 
     # subject
-    observation.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    observation.subject = FHIRReference({'reference': patient_url})
 
     # effectiveDateTime
     if response_info.time is not None:
@@ -1256,22 +1135,17 @@ def create_response(response_info, patient_id, smart_client):
         valueCodeableConcept.coding = [coding]
 
         observation.valueCodeableConcept = valueCodeableConcept
+    return observation
 
-    response = store_resources(smart_client, observation, "Observation")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
 
-
-def create_condition(condition_info, patient_id, smart_client):
+def create_condition(condition_info, patient_url):
     """
-    Create and store the Resource Condition on FHIR server.
+    Create the Resource Condition.
 
     :param condition_info: The instance of class Condition.
-    :param patient_id: The url of relevant Resource Patient.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of relevant Resource Patient.
     :return:
-        The url of Resource Condition.
+        FHIR model of Resource Condition.
     """
     condition = c.Condition()
     if condition_info.date_diagnosis is not None:
@@ -1295,7 +1169,7 @@ def create_condition(condition_info, patient_id, smart_client):
         condition.onsetDateTime = date_time
 
     # subject (patient)
-    condition.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    condition.subject = FHIRReference({'reference': patient_url})
 
     # code
     mapping = {"C18.0": "Malignant neoplasm of cecum",
@@ -1325,22 +1199,17 @@ def create_condition(condition_info, patient_id, smart_client):
         code_in_json.coding = [coding]
 
         condition.code = code_in_json
+    return condition
 
-    response = store_resources(smart_client, condition, "Condition")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
 
-
-def create_specimen(patient_id, specimen_info, smart_client):
+def create_specimen(patient_url, specimen_info):
     """
-    Create and store the Resource Specimen on FHIR server.
+    Create the Resource Specimen.
 
-    :param patient_id: The url of relevant Resource Patient.
+    :param patient_url: The reference of relevant Resource Patient.
     :param specimen_info: The instance of class Specimen.
-    :param smart_client: The FHIR client.
     :return:
-        The url of Resource Specimen.
+        FHIR model of Resource Specimen.
     """
     specimen = s.Specimen()
 
@@ -1369,24 +1238,19 @@ def create_specimen(patient_id, specimen_info, smart_client):
         specimen.type = type
 
     # subject
-    specimen.subject = FHIRReference({'reference': "Patient/" + patient_id})
-
-    response = store_resources(smart_client, specimen, "Specimen")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
+    specimen.subject = FHIRReference({'reference': patient_url})
+    return specimen
 
 
-def create_targeted(targeted_info, patient_id, smart_client):
+def create_targeted(targeted_info, patient_url):
     """
-    Create and store the Resource Procedure on FHIR server.
+    Create the Resource Procedure.
     The resource should represent surgery.
 
     :param targeted_info: The instance of class TargetedTherapy.
-    :param patient_id: The url of patient subject.
-    :param smart_client: The FHIR client.
+    :param patient_url: The reference of patient subject.
     :return:
-        The url of Resource Procedure.
+        FHIR model of Resource Procedure.
     """
     targeted = pro.Procedure()
 
@@ -1405,7 +1269,7 @@ def create_targeted(targeted_info, patient_id, smart_client):
     targeted.code = code
 
     # subject
-    targeted.subject = FHIRReference({'reference': "Patient/" + patient_id})
+    targeted.subject = FHIRReference({'reference': patient_url})
 
     # start
     targeted_period = period.Period()
@@ -1421,190 +1285,240 @@ def create_targeted(targeted_info, patient_id, smart_client):
     # note
     note = anno.Annotation()
     note.text = "Code for targeted therapy is taken from breast cancer codes."
+    return targeted
 
-    response = store_resources(smart_client, targeted, "Procedure")
-    resource_on_server = response.content
-    index_id = resource_on_server.rfind(b'"id"') + 6
-    return resource_on_server[index_id:index_id + 16].decode("utf-8")
-
-
-def store_resources(smart_client, file, type):
-    """
-    Store resources on FHIR server.
-
-    :param smart_client: The FHIR client.
-    :param file: FHIR model, precursor of FHIR json.
-    :param type: Type of Resource.
-    :return:
-    """
-    server = smart_client.server
-    resource = file.as_json()
-    return server.post_json(path=type, resource_json=resource)
 
-def create_files(data, smart_client):
+def create_files(data, smart_client, bundle_size=BUNDLE_SIZE, concurrency=CONCURRENCY, keep_resources=False):
     """
-    Create files with Resurces IDs for further processing.
+    Store resources on FHIR server in concurrent transaction Bundles and
+    create files with Resurces IDs for further processing.
 
-    :param data: Data prepared in the list of instances of classes: Patient, Condition, Specimen.
+    :param data: Iterable of instances of class Record, it is consumed while Bundles are stored.
     :param smart_client: The FHIR client.
+    :param bundle_size: Maximal number of resources in one transaction Bundle.
+    :param concurrency: Maximal number of Bundles sent at the same time.
+    :param keep_resources: Keep stored resources in memory for quality checks.
     :return:
-        None
+        Dictionary with stored resources for every name of IDs file, None if keep_resources is False.
     """
     # resources
-    patients = []
-    recurrence = []
-    time_observations = []
-    surgeries = []
-    radiations = []
-    targeteds = []
-    responses = []
-    tnms = []
-    conditions = []
-    specimens = []
-    for record in data:
-        (patient_url, recurrence_url, time_observation_url, responses_url, surgeries_url, radiations_url,
-         targeteds_url, tnm_url, condition_url, specimen_urls) = create_resources(record, smart_client)
-        patients.append(patient_url)
-        time_observations.append(time_observation_url)
-        if recurrence_url is not None:
-            recurrence.append(recurrence_url)
-        tnms.append(tnm_url)
-        surgeries += surgeries_url
-        radiations += radiations_url
-        targeteds += targeteds_url
-        responses += responses_url
-        conditions.append(condition_url)
-        specimens += specimen_urls
-    file_patients_ids = open("patients_ids.txt", "w")
-    file_recurrence_ids = open("recurrence_ids.txt", "w")
-    file_time_observation_ids = open("time_observation_ids.txt", "w")
-    file_tnm_ids = open("tnm_ids.txt", "w")
-    file_surgery_ids = open("surgery_ids.txt", "w")
-    file_radiation_ids = open("radiation_ids.txt", "w")
-    file_targeteds_ids = open("targeteds_ids.txt", "w")
-    file_response_ids = open("response_ids.txt", "w")
-    file_conditions_ids = open("conditions_ids.txt", "w")
-    file_specimens_ids = open("specimens_ids.txt", "w")
-    for record in patients:
-        file_patients_ids.write(record + "\n")
-    for record in recurrence:
-        file_recurrence_ids.write(record + "\n")
-    for record in time_observations:
-        file_time_observation_ids.write(record + "\n")
-    for record in tnms:
-        file_tnm_ids.write(record + "\n")
-    for record in surgeries:
-        file_surgery_ids.write(record + "\n")
-    for record in radiations:
-        file_radiation_ids.write(record + "\n")
-    for record in targeteds:
-        file_targeteds_ids.write(record + "\n")
-    for record in responses:
-        file_response_ids.write(record + "\n")
-    for record in conditions:
-        file_conditions_ids.write(record + "\n")
-    for record in specimens:
-        file_specimens_ids.write(record + "\n")
-    file_patients_ids.close()
-    file_time_observation_ids.close()
-    file_tnm_ids.close()
-    file_surgery_ids.close()
-    file_radiation_ids.close()
-    file_targeteds_ids.close()
-    file_response_ids.close()
-    file_conditions_ids.close()
-    file_specimens_ids.close()
-    return None
-
-
-def create_graphs_extra(file_name, client):
+    ids_files, stored = store_patients(smart_client, (create_resources(record) for record in data), bundle_size,
+                                       concurrency, keep_resources)
+    for name in RESOURCE_TYPES:
+        with open(name + "_ids.txt", "w") as file_ids:
+            for record in ids_files.get(name, []):
+                file_ids.write(record + "\n")
+    return stored
+
+
+# data frames used by quality checks, built from the stored resources
+FHIR_EXTRA_FRAMES = [Frame("patient_df", create_patient_data_frame, ["server", "resources"]),
+                     Frame("recurrence_df", create_recurrence_df, ["server", "resources"]),
+                     Frame("tnm_df", create_tnm_dataframe, ["server", "resources"]),
+                     Frame("time_df", create_time_observation_df, ["server", "resources"]),
+                     Frame("response_df", create_response_df, ["server", "resources"]),
+                     Frame("radiation_df", create_radiation_df, ["server", "resources"]),
+                     Frame("targeted_df", create_targeted_therapy_dataframe, ["server", "resources"]),
+                     Frame("surgery_df", create_surgery_df, ["server", "resources"]),
+                     Frame("specimen_df", create_specimen_data_frame, ["server", "resources"]),
+                     Frame("condition_df", create_condition_data_frame, ["server", "resources"])]
+
+# quality checks in the order of graphs on the FHIR extra dashboard
+FHIR_EXTRA_CHECKS = [
+    # completeness
+    Check("completeness_patient", "Completeness of patients", completeness, ["patient_df"]),
+    Check("completeness_recurrence", "Completeness of recurrences", completeness, ["recurrence_df"]),
+    Check("completeness_tnm", "Completeness of TNM classifications", completeness, ["tnm_df"]),
+    Check("completeness_time", "Completeness of time observations", completeness, ["time_df"]),
+    Check("completeness_response", "Completeness of responses to therapy", completeness, ["response_df"]),
+    Check("completeness_radiation", "Completeness of radiation therapies", completeness, ["radiation_df"]),
+    Check("completeness_targeted", "Completeness of targeted therapies", completeness, ["targeted_df"]),
+    Check("completeness_surgery", "Completeness of surgeries", completeness, ["surgery_df"]),
+    Check("completeness_specimen", "Completeness of specimens", completeness, ["specimen_df"]),
+    Check("completeness_condition", "Completeness of conditions", completeness, ["condition_df"]),
+
+    # warnings
+    Check("last_update_before_initial_diagnosis",
+          "Vital check date precedes initial diagnosis date",
+          last_update_before_initial_diagnosis,
+          ["condition_df", "time_df"], ["reports/fhir/extra/last_update_before_initial_diagnosis.csv"]),
+    Check("vital_check_date_is_equal_to_initial_diagnosis_date",
+          "Vital check date is equal to initial diagnosis date",
+          vital_check_date_is_equal_to_initial_diagnosis_date,
+          ["condition_df", "time_df"], ["reports/fhir/extra/vital_check_date_is_equal_to_initial_diagnosis_date.csv"]),
+    Check("suspicious_survival_information", "Suspicious survival information", suspicious_survival_information,
+          ["condition_df", "time_df"], ["reports/fhir/extra/suspicious_survival_information.csv"]),
+    Check("age_at_primary_diagnosis", "Suspiciously young patient", age_at_primary_diagnosis,
+          ["patient_df", "condition_df"], ["reports/fhir/extra/too_young_patients.csv"]),
+    Check("suspiciously_long_survival", "Suspiciously long survival", suspiciously_long_survival,
+          ["patient_df", "time_df", "condition_df"], ["reports/fhir/extra/suspiciously_long_survival.csv"]),
+
+    Check("vital_status_timestamp_missing", "Vital status timestamp missing", vital_status_timestamp_missing,
+          ["patient_df", "time_df"], ["reports/fhir/extra/vital_status_timestamp_missing.csv"]),
+    Check("vital_status_timestamp_is_in_the_future",
+          "Vital status timestamp is in the future",
+          vital_status_timestamp_is_in_the_future,
+          ["time_df"], ["reports/fhir/extra/vital_status_timestamp_is_in_the_future.csv"]),
+    Check("diagnosis_in_future", "Initial diagnosis date is in the future", diagnosis_in_future,
+          ["condition_df"], ["reports/fhir/extra/diagnosis_in_future.csv"]),
+    Check("surgery_and_histological_location_do_not_match_only_one",
+          "Surgery and histological location do not match",
+          surgery_and_histological_location_do_not_match_only_one,
+          ["condition_df", "surgery_df"],
+          ["reports/fhir/extra/surgery_and_histological_location_do_not_match_only_one.csv"]),
+    Check("surgery_and_histological_location_do_not_match_multiple",
+          "Surgery and histological location do not match (multiple surgeries per patient)",
+          surgery_and_histological_location_do_not_match_multiple,
+          ["condition_df", "surgery_df"],
+          ["reports/fhir/extra/surgery_and_histological_location_do_not_match_multiple.csv"]),
+
+    Check("mismatch_between_surgery_location_and_surgery_type",
+          "Mismatch between surgery location and surgery type",
+          mismatch_between_surgery_location_and_surgery_type,
+          ["surgery_df"], ["reports/fhir/extra/mismatch_between_surgery_location_and_surgery_type.csv"]),
+    Check("end_time_is_before_start_time_radiation",
+          "End time is before start time of radiation therapies",
+          end_time_is_before_start_time,
+          ["radiation_df"], ["reports/fhir/extra/end_time_is_before_start_time.csv"]),
+    Check("end_time_is_before_start_time_targeted",
+          "End time is before start time of targeted therapies",
+          end_time_is_before_start_time,
+          ["targeted_df"], ["reports/fhir/extra/end_time_is_before_start_time.csv"]),
+    Check("event_starts_or_ends_after_survival_of_patient_radiation",
+          "Event starts or ends after survival of patient (radiation therapies)",
+          event_starts_or_ends_after_survival_of_patient_procedure,
+          ["patient_df", "radiation_df", "time_df", "condition_df"],
+          ["reports/fhir/extra/event_starts_or_ends_after_survival_of_patient_procedure.csv"]),
+    Check("event_starts_or_ends_after_survival_of_patient_targeted",
+          "Event starts or ends after survival of patient (targeted therapies)",
+          event_starts_or_ends_after_survival_of_patient_procedure,
+          ["patient_df", "targeted_df", "time_df", "condition_df"],
+          ["reports/fhir/extra/event_starts_or_ends_after_survival_of_patient_procedure.csv"]),
+
+    Check("event_starts_or_ends_after_survival_of_patient_surgery",
+          "Event starts or ends after survival of patient (surgeries)",
+          event_starts_or_ends_after_survival_of_patient,
+          ["patient_df", "surgery_df", "time_df", "condition_df"],
+          ["reports/fhir/extra/event_starts_or_ends_after_survival_of_patient.csv"]),
+    Check("event_starts_or_ends_after_survival_of_patient_response",
+          "Event starts or ends after survival of patient (responses to therapy)",
+          event_starts_or_ends_after_survival_of_patient,
+          ["patient_df", "response_df", "time_df", "condition_df"],
+          ["reports/fhir/extra/event_starts_or_ends_after_survival_of_patient.csv"]),
+    Check("start_of_response_to_therapy_is_before_diagnosis",
+          "Start of response to therapy is before diagnosis",
+          start_of_response_to_therapy_is_before_diagnosis,
+          ["response_df", "condition_df"], ["reports/fhir/extra/start_of_response_to_therapy_is_before_diagnosis.csv"]),
+    Check("patient_died_but_last_response_is_complete",
+          "Patient died while last response to therapy is complete response",
+          patient_died_but_last_response_is_complete,
+          ["patient_df", "response_df"], ["reports/fhir/extra/patient_died_but_last_response_is_complete.csv"]),
+    Check("start_of_response_to_therapy_is_in_the_future",
+          "Start of response to therapy is in the future",
+          start_of_response_to_therapy_is_in_the_future,
+          ["response_df"], ["reports/fhir/extra/start_of_response_to_therapy_is_in_the_future.csv"]),
+
+    Check("start_of_therapy_is_before_diagnosis_radiation",
+          "Start of therapy is before diagnosis (radiation therapies)",
+          start_of_therapy_is_before_diagnosis,
+          ["radiation_df", "condition_df"], ["reports/fhir/extra/start_of_therapy_is_before_diagnosis.csv"]),
+    Check("start_of_therapy_is_before_diagnosis_targeted",
+          "Start of therapy is before diagnosis (targeted therapies)",
+          start_of_therapy_is_before_diagnosis,
+          ["targeted_df", "condition_df"], ["reports/fhir/extra/start_of_therapy_is_before_diagnosis.csv"]),
+    Check("start_of_therapy_is_before_diagnosis_surgery",
+          "Start of therapy is before diagnosis (surgeries)",
+          start_of_therapy_is_before_diagnosis,
+          ["surgery_df", "condition_df"], ["reports/fhir/extra/start_of_therapy_is_before_diagnosis.csv"]),
+    Check("start_of_treatment_is_in_the_future_radiation",
+          "Start of treatment is in the future (radiation therapies)",
+          start_of_treatment_is_in_the_future,
+          ["radiation_df", "condition_df"], ["reports/fhir/extra/start_of_treatment_is_in_the_future.csv"]),
+    Check("start_of_treatment_is_in_the_future_targeted",
+          "Start of treatment is in the future (targeted therapies)",
+          start_of_treatment_is_in_the_future,
+          ["targeted_df", "condition_df"], ["reports/fhir/extra/start_of_treatment_is_in_the_future.csv"]),
+
+    Check("start_of_treatment_is_in_the_future_surgery",
+          "Start of treatment is in the future (surgeries)",
+          start_of_treatment_is_in_the_future,
+          ["surgery_df", "condition_df"], ["reports/fhir/extra/start_of_treatment_is_in_the_future.csv"]),
+    Check("end_of_treatment_is_in_the_future_radiation",
+          "End of treatment is in the future (radiation therapies)",
+          end_of_treatment_is_in_the_future,
+          ["radiation_df"], ["reports/fhir/extra/end_of_treatment_is_in_the_future.csv"]),
+    Check("end_of_treatment_is_in_the_future_targeted",
+          "End of treatment is in the future (targeted therapies)",
+          end_of_treatment_is_in_the_future,
+          ["targeted_df"], ["reports/fhir/extra/end_of_treatment_is_in_the_future.csv"]),
+    Check("non_surgery_therapy_starts_and_ends_in_week_0_radiation",
+          "Therapy starts and ends in week 0 since initial diagnosis (radiation therapies)",
+          non_surgery_therapy_starts_and_ends_in_week_0_since_initial_diagnosis,
+          ["radiation_df", "condition_df"], ["reports/fhir/extra/sus_early_therapy.csv"]),
+    Check("non_surgery_therapy_starts_and_ends_in_week_0_targeted",
+          "Therapy starts and ends in week 0 since initial diagnosis (targeted therapies)",
+          non_surgery_therapy_starts_and_ends_in_week_0_since_initial_diagnosis,
+          ["targeted_df", "condition_df"], ["reports/fhir/extra/sus_early_therapy.csv"]),
+
+    Check("mismatch_between_provided_and_computed_stage_value",
+          "Mismatch between provided and computed stage value",
+          mismatch_between_provided_and_computed_stage_value,
+          ["tnm_df"], ["reports/fhir/extra/mismatch_between_provided_and_computed_stage_value.csv"]),
+    Check("sus_tnm_combo_for_uicc_version_or_uncomputable_stage",
+          "Suspicious TNM combination for UICC version or uncomputable UICC stage",
+          sus_tnm_combo_for_uicc_version_or_uncomputable_stage,
+          ["tnm_df"], ["reports/fhir/extra/sus_tnm_combo_for_uicc_version_or_uncomputable_stage.csv"]),
+    Check("pnx_and_missing_uicc_stage", "pNX provided while UICC stage is determined", pnx_and_missing_uicc_stage,
+          ["tnm_df"], ["reports/fhir/extra/pnx_and_missing_uicc_stage.csv"]),
+
+    # reports
+    Check("create_plot_without_preservation_mode",
+          "Specimens without preservation mode",
+          create_plot_without_preservation_mode,
+          ["patient_df", "specimen_df"], ["reports/fhir/extra/missing_preservation_mode.csv"]),
+    Check("create_plots_without_response_to_therapy",
+          "Responses to therapy with missing values",
+          create_plots_without_response_to_therapy,
+          ["patient_df", "response_df"], ["reports/fhir/extra/patient_with_response_to_therapy_missing_fields.csv"]),
+    Check("get_patients_with_preservation_mode_but_without_ffpe",
+          "Specimens with preservation mode other than FFPE",
+          get_patients_with_preservation_mode_but_without_ffpe,
+          ["patient_df", "specimen_df"], ["reports/fhir/extra/preservation_mode_but_NO_FFPE.csv"]),
+    Check("treatment_after_complete_response_without_recurrence_diagnosis",
+          "Treatment after complete response without recurrence diagnosis",
+          treatment_after_complete_response_without_recurrence_diagnosis,
+          ["patient_df", "response_df", "condition_df", "recurrence_df"],
+          ["reports/fhir/extra/treatment_after_complete_response_without_recurrence_diagnosis.csv"])
+]
+
+
+def create_graphs_extra(file_name, client, read_back=False, bulk_export=False, read_client=None):
     """
     Store data from file_name in provided server, then create
-    pandas dataframes and run all quality checks from quality_checks_fhir_extra.py
+    pandas dataframes and run all quality checks of FHIR_EXTRA_CHECKS concurrently
 
     Args:
         file_name: Name of input file with data.
         client: FHIR client.
+        read_back: Read stored resources back from the server instead of using the resources kept by the loader,
+            this verifies what the server really stored.
+        bulk_export: Read stored resources back by FHIR Bulk Data export, faster than read_back for large cohorts.
+            The export is system-level and limited only by _since, so it also contains resources stored by others
+            during the load. NDJSON files are deleted after the checks.
+        read_client: FHIR client used by quality checks to read resources, e.g. of a read replica or a cache proxy,
+            client if None.
 
     Returns:
         List of figures from data quality checks.
 
     """
-    read_xml_and_create_resources(file_name, client)
-
-    patient_df = create_patient_data_frame(client.server)
-    recurrence_df = create_recurrence_df(client.server)
-    tnm_df = create_tnm_dataframe(client.server)
-    time_df = create_time_observation_df(client.server)
-    response_df = create_response_df(client.server)
-    radiation_df = create_radiation_df(client.server)
-    targeted_df = create_targeted_therapy_dataframe(client.server)
-    surgery_df = create_surgery_df(client.server)
-    specimen_df = create_specimen_data_frame(client.server)
-    condition_df = create_condition_data_frame(client.server)
+    since = export_since()
+    resources = read_xml_and_create_resources(file_name, client, keep_resources=not (read_back or bulk_export))
+    server = (read_client or client).server
+    if bulk_export:
+        # frames are built from the files by run_checks, so the files are kept until it returns
+        with tempfile.TemporaryDirectory() as directory:
+            resources = exported_resources(server, RESOURCE_TYPES, directory, since)
+            return run_checks(FHIR_EXTRA_CHECKS, {"server": server, "resources": resources}, FHIR_EXTRA_FRAMES)
 
-    graphs = [
-    # completeness
-    completeness(patient_df),
-    completeness(recurrence_df),
-    completeness(tnm_df),
-    completeness(time_df),
-    completeness(response_df),
-    completeness(radiation_df),
-    completeness(targeted_df),
-    completeness(surgery_df),
-    completeness(specimen_df),
-    completeness(condition_df),
-
-    # warnings:
-    last_update_before_initial_diagnosis(condition_df, time_df),
-    vital_check_date_is_equal_to_initial_diagnosis_date(condition_df, time_df),
-    suspicious_survival_information(condition_df, time_df),
-    age_at_primary_diagnosis(patient_df, condition_df),
-    suspiciously_long_survival(patient_df, time_df, condition_df),
-
-    vital_status_timestamp_missing(patient_df, time_df),
-    vital_status_timestamp_is_in_the_future(time_df),
-    diagnosis_in_future(condition_df),
-    surgery_and_histological_location_do_not_match_only_one(condition_df, surgery_df),
-    surgery_and_histological_location_do_not_match_multiple(condition_df, surgery_df),
-
-    mismatch_between_surgery_location_and_surgery_type(surgery_df),
-    end_time_is_before_start_time(radiation_df),
-    end_time_is_before_start_time(targeted_df),
-    event_starts_or_ends_after_survival_of_patient_procedure(patient_df, radiation_df, time_df, condition_df),
-    event_starts_or_ends_after_survival_of_patient_procedure(patient_df, targeted_df, time_df, condition_df),
-
-    event_starts_or_ends_after_survival_of_patient(patient_df, surgery_df, time_df, condition_df),
-    event_starts_or_ends_after_survival_of_patient(patient_df, response_df, time_df, condition_df),
-    start_of_response_to_therapy_is_before_diagnosis(response_df, condition_df),
-    patient_died_but_last_response_is_complete(patient_df, response_df),
-    start_of_response_to_therapy_is_in_the_future(response_df),
-
-    start_of_therapy_is_before_diagnosis(radiation_df, condition_df),
-    start_of_therapy_is_before_diagnosis(targeted_df, condition_df),
-    start_of_therapy_is_before_diagnosis(surgery_df, condition_df),
-    start_of_treatment_is_in_the_future(radiation_df, condition_df),
-    start_of_treatment_is_in_the_future(targeted_df, condition_df),
-
-    start_of_treatment_is_in_the_future(surgery_df, condition_df),
-    end_of_treatment_is_in_the_future(radiation_df),
-    end_of_treatment_is_in_the_future(targeted_df),
-    non_surgery_therapy_starts_and_ends_in_week_0_since_initial_diagnosis(radiation_df, condition_df),
-    non_surgery_therapy_starts_and_ends_in_week_0_since_initial_diagnosis(targeted_df, condition_df),
-
-    mismatch_between_provided_and_computed_stage_value(tnm_df),
-    sus_tnm_combo_for_uicc_version_or_uncomputable_stage(tnm_df),
-    pnx_and_missing_uicc_stage(tnm_df),
-
-    # reports:
-    create_plot_without_preservation_mode(patient_df, specimen_df),
-    create_plots_without_response_to_therapy(patient_df, response_df),
-    get_patients_with_preservation_mode_but_without_ffpe(patient_df, specimen_df),
-    treatment_after_complete_response_without_recurrence_diagnosis(patient_df, response_df, condition_df, recurrence_df)
-    ]
-
-    for i in range(len(graphs)):
-        graphs[i] = graphs[i].to_json()
-
-    return graphs
+    return run_checks(FHIR_EXTRA_CHECKS, {"server": server, "resources": resources}, FHIR_EXTRA_FRAMES)
@@ -1,139 +1,122 @@
 from typing import List
+import tempfile
 import psycopg2
-import xml.etree.ElementTree as ElementTree
+from psycopg2.errors import InsufficientPrivilege
 from collections import deque
+from contextlib import closing
 from datetime import datetime, timedelta
 from ohdsi_classes import *
+from cohort import iter_patients, extract_patient, event_values
 from quality_checks_ohdsi import  *
+from quality_checks_ohdsi_sql import *
+from check_registry import Frame, Check, run_checks
+
+# table with the next free ID of every OMOP CDM table, shared by all loads into the schema
+ID_COUNTER = "mmci_id_counter"
+
+# tables written by the loader, in the order of data of one patient
+COPY_TABLES = ["person", "observation_period", "condition_occurrence", "specimen", "drug_exposure",
+               "procedure_occurrence"]
+
+# rows of COPY buffered in memory for one table, in characters, bigger buffers are moved to temporary files
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
 
 
 def read_xml_and_parse(file_name):
     """
-    Parse input file and proccess data.
+    Parse input file and proccess data of one patient at a time.
 
     :param file_name: The path of input file.
     :return:
-        Data prepared in the list of instances of classes from ohdsi_classes.py
-    """
-    tree = ElementTree.parse("uploads/" + file_name)
-    root = tree.getroot()
-    namespace = "{http://registry.samply.de/schemata/import_v1}"
-    result = []
-    for element in root.iter():
-        if element.tag == namespace + "BHPatient":
-            # patient
-            if element.find(namespace + "Identifier") is not None:
-                patient_id = element.find(namespace + "Identifier").text
-            else:
-                patient_id = None
-            form = element.find(namespace +
-                                "Locations").find(namespace +
-                                                  "Location").find(namespace +
-                                                                   "BasicData").find(namespace +
-                                                                                     "Form")
-            if form.find(namespace + "Dataelement_85_1") is not None:
-                sex = form.find(namespace + "Dataelement_85_1").text
-            else:
-                sex = None
-            condition_start_date = None
-            if form.find(namespace + "Dataelement_51_3") is not None:
-                date_diagnosis = form.find(namespace + "Dataelement_51_3").text
-                condition_start_date = datetime.strptime(date_diagnosis, '%Y-%m-%d').date()
-            else:
-                date_diagnosis = None
-            if form.find(namespace + "Dataelement_3_1") is not None:
-                age_at_primary_diagnostic = form.find(namespace + "Dataelement_3_1").text
-            else:
-                age_at_primary_diagnostic = None
-            if date_diagnosis is not None and age_at_primary_diagnostic is not None:
-                year_of_birth = int(date_diagnosis[:4]) - int(age_at_primary_diagnostic)
-            else:
-                year_of_birth = None
-
-            # observation period
-            events = element.find(namespace + "Locations").find(namespace + "Location").find(namespace + "Events")
-            observation_start_date = find_observation_start_date(namespace, events)
-            if observation_start_date is None:
-                observation_start_date = condition_start_date
-            if form.find(namespace + "Dataelement_6_3") is not None:
-                observation_end_date = form.find(namespace + "Dataelement_6_3").text
-                observation_end_date = datetime.strptime(observation_end_date, '%Y-%m-%d').date()
-            else:
-                observation_end_date = observation_start_date
-
-            # condition occurrence
-            if find_histopathology(namespace, events) is not None:
-                histopathology = find_histopathology(namespace, events).text
-            else:
-                histopathology = None
-
-            # specimen
-            specimens = find_specimens(namespace, events)
-
-            # drug exposure
-            if date_diagnosis is not None:
-                diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
-                drug_exposures = find_drug_exposures(namespace, events, diagnosis)
-            else:
-                diagnosis = None
-                drug_exposures = find_drug_exposures(namespace, events, None)
-
-            # procedure occurrence
-            procedures = find_procedures(namespace, events, diagnosis)
-            procedures = procedures + find_diagnostic_procedures(namespace, form, date_diagnosis)
-            # initialize classes
-            result.append([Patient(patient_id, sex, year_of_birth),
-                           ObservationPeriod(observation_start_date, observation_end_date),
-                           ConditionOccurrence(histopathology, condition_start_date),
-                           specimens,
-                           drug_exposures,
-                           procedures])
-    return result
-
-
-def find_diagnostic_procedures(namespace, form, diagnosis):
+        Generator of data of one patient prepared in the list of instances of classes from ohdsi_classes.py
+    """
+    for element in iter_patients(file_name):
+        values = extract_patient(element, ("Sample", "Histopathology", "Pharmacotherapy", "Surgery",
+                                           "Radiation therapy"))
+        form = values.basic_data
+        events = values.events
+
+        # patient
+        patient_id = values.identifier
+        sex = form["sex"]
+        condition_start_date = None
+        date_diagnosis = form["date_diagnosis"]
+        if date_diagnosis is not None:
+            condition_start_date = datetime.strptime(date_diagnosis, '%Y-%m-%d').date()
+        age_at_primary_diagnostic = form["age_at_diagnosis"]
+        if date_diagnosis is not None and age_at_primary_diagnostic is not None:
+            year_of_birth = int(date_diagnosis[:4]) - int(age_at_primary_diagnostic)
+        else:
+            year_of_birth = None
+
+        # observation period
+        observation_start_date = find_observation_start_date(events)
+        if observation_start_date is None:
+            observation_start_date = condition_start_date
+        if form["last_update"] is not None:
+            observation_end_date = datetime.strptime(form["last_update"], '%Y-%m-%d').date()
+        else:
+            observation_end_date = observation_start_date
+
+        # condition occurrence
+        histopathology = find_histopathology(events)
+
+        # specimen
+        specimens = find_specimens(events)
+
+        # drug exposure
+        if date_diagnosis is not None:
+            diagnosis = datetime.strptime(date_diagnosis, "%Y-%m-%d")
+        else:
+            diagnosis = None
+        drug_exposures = find_drug_exposures(events, diagnosis)
+
+        # procedure occurrence
+        procedures = find_procedures(events, diagnosis)
+        procedures = procedures + find_diagnostic_procedures(form, date_diagnosis)
+        # initialize classes
+        yield [Patient(patient_id, sex, year_of_birth),
+               ObservationPeriod(observation_start_date, observation_end_date),
+               ConditionOccurrence(histopathology, condition_start_date),
+               specimens,
+               drug_exposures,
+               procedures]
+
+
+def find_diagnostic_procedures(form, diagnosis):
     """
     Find a values of diagnostic procedures.
 
-    :param namespace: The namespace of file.
-    :param form: XML element, where Diagnosis procedure can be stored.
+    :param form: Values of form BasicData, where Diagnosis procedure can be stored.
     :param diagnosis: Date of diagnosis used as diagnostic procedure.
     :return:
         List of instances of class ProcedureOccurrence representing diagnostic procedures.
     """
     result = []
     # liver_imaging
-    if form.find(namespace + "Dataelement_61_5") is not None:
-        liver_imaging = form.find(namespace + "Dataelement_61_5").text
-        if liver_imaging.find("Liver imaging - Done") != -1:
-            result.append(ProcedureOccurrence(4085576, diagnosis, "liver imaging"))
+    liver_imaging = form["liver_imaging"]
+    if liver_imaging is not None and liver_imaging.find("Liver imaging - Done") != -1:
+        result.append(ProcedureOccurrence(4085576, diagnosis, "liver imaging"))
 
     # ct
-    if form.find(namespace + "Dataelement_31_3") is not None:
-        ct = form.find(namespace + "Dataelement_31_3").text
-        if ct.find("CT - Done") != -1:
-            result.append(ProcedureOccurrence(4019823, diagnosis, "CT"))
-
+    ct = form["ct"]
+    if ct is not None and ct.find("CT - Done") != -1:
+        result.append(ProcedureOccurrence(4019823, diagnosis, "CT"))
 
     # colonoscopy
-    if form.find(namespace + "Dataelement_88_1") is not None:
-        colonoscopy = form.find(namespace + "Dataelement_88_1").text
-        if colonoscopy.find("Colonoscopy diagnostic exam - Positive") != -1:
-            result.append(ProcedureOccurrence(4249893, diagnosis, "colonoscopy"))
-
+    colonoscopy = form["colonoscopy"]
+    if colonoscopy is not None and colonoscopy.find("Colonoscopy diagnostic exam - Positive") != -1:
+        result.append(ProcedureOccurrence(4249893, diagnosis, "colonoscopy"))
 
     # lung_imaging
-    if form.find(namespace + "Dataelement_63_4") is not None:
-        lung_imaging = form.find(namespace + "Dataelement_63_4").text
-        if lung_imaging.find("Lung imaging - Done") != -1:
-            result.append(ProcedureOccurrence(4082968, diagnosis, "lung imaging"))
+    lung_imaging = form["lung_imaging"]
+    if lung_imaging is not None and lung_imaging.find("Lung imaging - Done") != -1:
+        result.append(ProcedureOccurrence(4082968, diagnosis, "lung imaging"))
 
     # mri
-    if form.find(namespace + "Dataelement_30_3") is not None:
-        mri = form.find(namespace + "Dataelement_30_3").text
-        if mri.find("MRI - Done") != -1:
-            result.append(ProcedureOccurrence(4013636, diagnosis, "MRI"))
-
+    mri = form["mri"]
+    if mri is not None and mri.find("MRI - Done") != -1:
+        result.append(ProcedureOccurrence(4013636, diagnosis, "MRI"))
 
     return result
 
@@ -165,223 +148,226 @@ def surgery_mapping(primary_surgery, secondary_surgery):
     return "Other", None
 
 
-def find_specimens(namespace, events):
+def find_specimens(events):
     """
     Create a list of all specimens of one patient.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Specimens can be stored.
+    :param events: Values of all events of one patient, where Specimens can be stored.
     :return:
         List of all specimens.
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-        if "eventtype" in event.attrib and event.attrib.get("eventtype") == "Sample":
-            sample = event.find(namespace + "LogitudinalData").find(namespace + "Form1")
-
-            if sample.find(namespace + "Dataelement_89_3") is not None:
-                year_of_sample_connection = sample.find(namespace + "Dataelement_89_3").text
-                year_of_sample_connection = datetime.strptime(year_of_sample_connection, '%Y').date()
-            else:
-                year_of_sample_connection = None
-            if sample.find(namespace + "Dataelement_54_2") is not None:
-                sample_material_type = sample.find(namespace + "Dataelement_54_2").text
-            else:
-                sample_material_type = None
-            if sample.find(namespace + "Dataelement_56_2") is not None:
-                sample_id = sample.find(namespace + "Dataelement_56_2").text
-            else:
-                sample_id = None
-
-            result.append(Specimen(sample_material_type, year_of_sample_connection, sample_id))
+    for sample in event_values(events, "Sample"):
+        year_of_sample_connection = sample["year_of_collection"]
+        if year_of_sample_connection is not None:
+            year_of_sample_connection = datetime.strptime(year_of_sample_connection, '%Y').date()
+        result.append(Specimen(sample["material_type"], year_of_sample_connection, sample["sample_id"]))
     return result
 
 
-def find_drug_exposures(namespace, events, diagnosis):
+def find_drug_exposures(events, diagnosis):
     """
     Create a list of all Drug Exposures of one patient.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Specimens can be stored.
+    :param events: Values of all events of one patient, where Drug Exposures can be stored.
     :param diagnosis: Date of diagnosis.
     :return:
         List of all Drug Exposures.
     """
     result = []
-    for event in events:
-        if "eventtype" in event.attrib and event.attrib.get("eventtype") == "Pharmacotherapy":
-            pharmacotherapy = event.find(namespace + "LogitudinalData").find(namespace + "Form3")
-
-            if pharmacotherapy.find(namespace + "Dataelement_59_5") is not None:
-                drug_source_value = pharmacotherapy.find(namespace + "Dataelement_59_5").text
-            else:
-                drug_source_value = None
-            if drug_source_value is None or drug_source_value == "Other":
-                if pharmacotherapy.find(namespace + "Dataelement_81_3") is not None:
-                    drug_source_value = pharmacotherapy.find(namespace + "Dataelement_81_3").text
-                else:
-                    drug_source_value = None
+    for pharmacotherapy in event_values(events, "Pharmacotherapy"):
+        drug_source_value = pharmacotherapy["scheme"]
+        if drug_source_value is None or drug_source_value == "Other":
+            drug_source_value = pharmacotherapy["other_scheme"]
+
+        drug_concept_id = drug_exposure_mapping(drug_source_value)
+
+        start_week = pharmacotherapy["start_week"]
+        if start_week is not None:
+            start_week = int(start_week)
+        end_week = pharmacotherapy["end_week"]
+        if end_week is not None:
+            end_week = int(end_week)
+
+        drug_exposure_end_date = None
+        drug_exposure_start_date = None
+        if diagnosis is not None:
+            if start_week is not None:
+                drug_exposure_start_date = (diagnosis + timedelta(weeks=start_week)).date()
+            if end_week is not None:
+                drug_exposure_end_date = (diagnosis + timedelta(weeks=end_week)).date()
 
-            drug_concept_id = drug_exposure_mapping(drug_source_value)
+        if drug_source_value is None or len(drug_source_value) > 50:
+            drug_source_value = None
 
-            if pharmacotherapy.find(namespace + "Dataelement_10_2") is not None:
-                start_week = int(pharmacotherapy.find(namespace + "Dataelement_10_2").text)
-            else:
-                start_week = None
-            if pharmacotherapy.find(namespace + "Dataelement_11_2") is not None:
-                end_week = int(pharmacotherapy.find(namespace + "Dataelement_11_2").text)
-            else:
-                end_week = None
-
-            drug_exposure_end_date = None
-            drug_exposure_start_date = None
-            if diagnosis is not None:
-                if start_week is not None:
-                    drug_exposure_start_date = (diagnosis + timedelta(weeks=start_week)).date()
-                if end_week is not None:
-                    drug_exposure_end_date = (diagnosis + timedelta(weeks=end_week)).date()
-
-            if drug_source_value is None or len(drug_source_value) > 50:
-                drug_source_value = None
-
-            if drug_concept_id is not None:
-                result.append(DrugExposure(drug_concept_id, drug_exposure_start_date,
-                                       drug_exposure_end_date, drug_source_value))
+        if drug_concept_id is not None:
+            result.append(DrugExposure(drug_concept_id, drug_exposure_start_date,
+                                   drug_exposure_end_date, drug_source_value))
     return result
 
 
-def find_procedures(namespace, events, initial_diagnosis):
+def find_procedures(events, initial_diagnosis):
     """
     Create a list of all Drug Exposures of one patient.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Specimens can be stored.
+    :param events: Values of all events of one patient, where Procedures can be stored.
     :param initial_diagnosis: Date of initial diagnosis.
     :return:
         List of all Procedures.
     """
     result = []
-    for event in events.findall(namespace + "Event"):
-
-        if event.attrib.get("eventtype") == "Surgery":
-            if event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_49_1") is not None:
-                primary_surgery = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_49_1").text
-                secondary_surgery_node = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_67_1")
-                secondary_surgery = None if secondary_surgery_node is None else secondary_surgery_node.text
-
-                surgery_name, surgery_code = surgery_mapping(primary_surgery, secondary_surgery)
-            else:
-                secondary_surgery_node = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                    namespace + "Dataelement_67_1")
-                secondary_surgery = None if secondary_surgery_node is None else secondary_surgery_node.text
-                surgery_name, surgery_code = surgery_mapping(None, secondary_surgery)
+    for event_type, event in events:
 
-            start_week = event.find(namespace + "LogitudinalData").find(namespace + "Form").find(
-                namespace + "Dataelement_8_3")
+        if event_type == "Surgery":
+            surgery_name, surgery_code = surgery_mapping(event["surgery_type"], event["other_surgery_type"])
+
+            start_week = event["start_week"]
             if start_week is not None:
-                start_week = int(start_week.text)
+                start_week = int(start_week)
                 date = initial_diagnosis + timedelta(weeks=start_week)
             else:
                 date = None
             if surgery_code is not None:
                 result.append(ProcedureOccurrence(surgery_code, date, surgery_name))
 
-        elif event.attrib.get("eventtype") == "Radiation therapy":
+        elif event_type == "Radiation therapy":
             date = None
-            if event.find(namespace + "LogitudinalData").find(namespace + "Form5").find(
-                namespace + "Dataelement_12_4") is not None:
-                start_week = event.find(namespace + "LogitudinalData").find(namespace + "Form5").find(
-                namespace + "Dataelement_12_4")
-                if start_week is not None:
-                    start_week = int(start_week.text)
-                    date = initial_diagnosis + timedelta(weeks=start_week)
+            start_week = event["start_week"]
+            if start_week is not None:
+                start_week = int(start_week)
+                date = initial_diagnosis + timedelta(weeks=start_week)
             result.append(ProcedureOccurrence(4029715, date, "Radiation therapy"))
 
-        # elif event.attrib.get("eventtype") == "Targeted Therapy":
-        #     start_week = int(event.find(namespace + "LogitudinalData").find(namespace + "Form6").find(
-        #         namespace + "Dataelement_35_3").text)
+        # elif event_type == "Targeted Therapy":
+        #     start_week = int(event["start_week"])
         #     date = initial_diagnosis + timedelta(weeks=start_week)
         #     result.append(ProcedureOccurrence(None, date, "Targeted therapy"))
     return result
 
 
-def find_histopathology(namespace, events):
+def find_histopathology(events):
     """
     Find a localization of primary tumor in form Histopathology.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Histopathology can be stored.
+    :param events: Values of all events of one patient, where Histopathology can be stored.
     :return:
-        The element with localization of primary tumor.
+        The localization of primary tumor.
     """
-    for event in events.findall(namespace + "Event"):
-        if event.attrib.get("eventtype") == "Histopathology":
-            return event.find(namespace + "LogitudinalData").find(namespace + "Form2").find(
-                namespace + "Dataelement_92_1")
+    for histopathology in event_values(events, "Histopathology"):
+        return histopathology["localization"]
 
 
-def find_observation_start_date(namespace, events):
+def find_observation_start_date(events):
     """
     Find an Observation Start Date as the date of oldest sample.
 
-    :param namespace: The namespace of file.
-    :param events: XML element, where Histopathology can be stored.
+    :param events: Values of all events of one patient, where Specimens can be stored.
     :return:
         The observation_start_date.
     """
-    year_of_sample_collection = []
-    for event in events.findall(namespace + "Event"):
-        if "eventtype" in event.attrib:
-            if event.attrib["eventtype"] == "Sample":
-                if event.find(namespace + "LogitudinalData").find(namespace + "Form1").find(
-                    namespace + "Dataelement_89_3") is not None:
-                    year_of_sample_collection.append((event.find(namespace + "LogitudinalData").find(namespace + "Form1").find(
-                    namespace + "Dataelement_89_3")).text)
-    years = [datetime.strptime(year, '%Y') for year in year_of_sample_collection]
+    years = [datetime.strptime(sample["year_of_collection"], '%Y')
+             for sample in event_values(events, "Sample") if sample["year_of_collection"] is not None]
     if years:
         return min(years)
     return None
 
 
-def retrieve_max_ids(cursor, schema, table):
+def create_id_counter(cursor, schema):
     """
-    Find max id in database.
+    Create the counter table ID_COUNTER in the schema, if it does not exist yet.
+    Only the first load into the schema needs CREATE privilege on it.
+    Raises PermissionError if the table does not exist and the user cannot create it.
 
     :param cursor: Cursor of database connection.
     :param schema: Used schema.
-    :param table: In which table are we looking for an ID.
     :return:
-        The max ID.
+        None
     """
-    cursor.execute("SELECT MAX(" + table + "_" + "id) FROM " + schema + "." + table)
-    highest_id = cursor.fetchone()[0]
-    if highest_id is None:
-        ids = 0
-    else:
-        ids = highest_id + 1
-    return ids
+    counter = schema + "." + ID_COUNTER
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", [counter])
+    if cursor.fetchone()[0]:
+        return
+    command = "CREATE TABLE IF NOT EXISTS " + counter + " (table_name varchar(50) PRIMARY KEY, next_id bigint NOT NULL);"
+    try:
+        cursor.execute(command)
+    except InsufficientPrivilege:
+        raise PermissionError("Table " + counter + " with the next free IDs does not exist and the user cannot "
+                              "create it, it has to be created by the owner of the schema: " + command)
 
 
-def put_data_into_right_types(data, schema, cursor):
+def reserve_ids(params, schema, counts):
     """
-    Modify data to be prepared in the INSERT command.
+    Reserve a contiguous block of IDs for every table in one round trip.
+    Next free IDs are kept in the counter table ID_COUNTER. Every reservation starts after the counter
+    and after MAX(id) of the table, so rows written by other loaders, manual inserts or a restore are never reused.
+    MAX of a primary key is read from its index.
+    Concurrent loads wait for the row lock of the counter, so their blocks never overlap.
+    The reservation uses its own connection, so it is committed without other work of the caller,
+    and the reserved blocks stay reserved even if the load fails.
 
-    :param data: Data prepared in the list of instances of classes from ohdsi_classes.py
+    :param params: Params of database.
     :param schema: Used schema.
-    :param cursor: Cursor of database connection.
+    :param counts: Dictionary with the number of needed IDs for every table.
     :return:
-        The data.
+        Dictionary with the first reserved ID for every table.
+    """
+    counter = schema + "." + ID_COUNTER
+    command = "INSERT INTO " + counter + " (table_name, next_id) VALUES " + ", ".join(["(%s, 0)"] * len(counts)) + \
+              " ON CONFLICT (table_name) DO NOTHING;"
+    parameters = list(counts)
+    command += " UPDATE " + counter + " AS counter SET next_id = GREATEST(counter.next_id, block.first_id) + block.count" \
+               " FROM (VALUES " + ", ".join("(%s, %s, (SELECT COALESCE(MAX(" + table + "_id) + 1, 0) FROM " + schema +
+                                           "." + table + "))" for table in counts) + \
+               ") AS block (table_name, count, first_id)" \
+               " WHERE counter.table_name = block.table_name" \
+               " RETURNING counter.table_name, counter.next_id - block.count;"
+    for table, count in counts.items():
+        parameters += [table, count]
+    conn = psycopg2.connect(**params)
+    try:
+        # the transaction is committed when the block ends, it releases the counter
+        with conn, conn.cursor() as cursor:
+            create_id_counter(cursor, schema)
+            cursor.execute(command, parameters)
+            return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+
+def count_rows(data):
     """
-    result = []
-    person_ids = retrieve_max_ids(cursor, schema, "person")
-    observation_ids = retrieve_max_ids(cursor, schema, "observation_period")
-    condition_ids = retrieve_max_ids(cursor, schema, "condition_occurrence")
-    specimen_ids = retrieve_max_ids(cursor, schema, "specimen")
-    drug_ids = retrieve_max_ids(cursor, schema, "drug_exposure")
-    procedure_ids = retrieve_max_ids(cursor, schema, "procedure_occurrence")
+    Count rows of every table written for data, so their IDs can be reserved before data are written.
+
+    :param data: Iterable of data of one patient prepared in the list of instances of classes from ohdsi_classes.py
+    :return:
+        Dictionary with the number of rows for every table.
+    """
+    counts = dict.fromkeys(COPY_TABLES, 0)
+    for record in data:
+        counts["person"] += 1
+        counts["observation_period"] += 1
+        counts["condition_occurrence"] += 1
+        counts["specimen"] += len(record[3])
+        counts["drug_exposure"] += sum(1 for drug_exposure in record[4] if drug_exposure.drug_concept_id is not None)
+        counts["procedure_occurrence"] += len(record[5])
+    return counts
+
+
+def put_data_into_right_types(data, ids):
+    """
+    Modify data to be prepared in the INSERT command.
+
+    :param data: Iterable of data of one patient prepared in the list of instances of classes from ohdsi_classes.py
+    :param ids: Dictionary with the first reserved ID for every table.
+    :return:
+        Generator of data of one patient in form ready for insert into OMOP CDM.
+    """
+    person_ids = ids["person"]
+    observation_ids = ids["observation_period"]
+    condition_ids = ids["condition_occurrence"]
+    specimen_ids = ids["specimen"]
+    drug_ids = ids["drug_exposure"]
+    procedure_ids = ids["procedure_occurrence"]
     for record in data:
         person = create_person_data(record[0], person_ids)
         observation_period = create_observation_period_data(record[1], observation_ids, person_ids)
@@ -389,12 +375,10 @@ def put_data_into_right_types(data, schema, cursor):
         specimen, specimen_ids = create_specimens(record[3], specimen_ids, person_ids)
         drug_exposure, drug_ids = create_drug_exposures(record[4], drug_ids, person_ids)
         procedure_occurrences, procedure_ids = create_procedure_occurrences(record[5], procedure_ids, person_ids)
-        result.append(
-            (person, observation_period, condition_occurrence, specimen, drug_exposure, procedure_occurrences))
+        yield person, observation_period, condition_occurrence, specimen, drug_exposure, procedure_occurrences
         person_ids += 1
         observation_ids += 1
         condition_ids += 1
-    return result
 
 
 def create_person_data(person: Patient, ids):
@@ -664,9 +648,9 @@ def insert_procedure_occurrence(procedure_occurrences, cursor, insert, values):
 
 def insert_data(prepared_data, cursor, conn, schema):
     """
-    Insert data into database.
+    Insert data into database. Nothing is inserted if any row fails, the error is raised again after rollback.
 
-    :param prepared_data: The data in form ready for insert into OMOP CDM.
+    :param prepared_data: Iterable of data of one patient in form ready for insert into OMOP CDM.
     :param cursor: Cursor of database connection.
     :param conn: Database connection.
     :param schema: Used schema.
@@ -710,107 +694,258 @@ def insert_data(prepared_data, cursor, conn, schema):
             insert_procedure_occurrence(record[5], cursor, insert, values)
 
         conn.commit()
-    except Exception as e:
-        print(f"Error: {e}")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def copy_value(value):
+    """
+    Format one value for COPY in text format.
+
+    :param value: The value of one column.
+    :return:
+        The value with escaped special characters, NULL marker for None.
+    """
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def write_copy_rows(buffer, rows):
+    """
+    Helper function for copy_data.
+
+    :param buffer: File with rows of one table for COPY.
+    :param rows: Rows of one table in form ready for insert into OMOP CDM.
+    :return:
+        None
+    """
+    for row in rows:
+        buffer.write("\t".join([copy_value(value) for value in row]) + "\n")
+
 
+def copy_table(cursor, schema, table, buffer):
+    """
+    Helper function for copy_data.
 
-def load_data(params, input_file, schema):
+    :param cursor: Cursor of database connection.
+    :param schema: Used schema.
+    :param table: The table we are loading.
+    :param buffer: File with rows of the table in text format of COPY, read from its start.
+    :return:
+        None
+    """
+    buffer.seek(0)
+    command = "COPY " + schema + "." + table + " (" + ", ".join(OMOP_COLUMNS[table]) + ") FROM STDIN"
+    cursor.copy_expert(command, buffer)
+
+
+def copy_data(prepared_data, cursor, conn, schema):
+    """
+    Insert data into database with one COPY command per table.
+    One connection runs one COPY at a time, so rows are written to a buffer of every table while data
+    of one patient at a time are prepared. Buffers bigger than COPY_BUFFER_SIZE are kept in temporary files.
+
+    :param prepared_data: Iterable of data of one patient in form ready for insert into OMOP CDM.
+    :param cursor: Cursor of database connection.
+    :param conn: Database connection.
+    :param schema: Used schema.
+    :return:
+        None
+    """
+    buffers = [tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_SIZE, mode="w+") for _ in COPY_TABLES]
+    try:
+        for record in prepared_data:
+            # person, observation period and condition occurrence are one row of every patient
+            for buffer, rows in zip(buffers, ([record[0]], [record[1]], [record[2]], record[3], record[4], record[5])):
+                write_copy_rows(buffer, rows)
+        for table, buffer in zip(COPY_TABLES, buffers):
+            copy_table(cursor, schema, table, buffer)
+        conn.commit()
+    finally:
+        for buffer in buffers:
+            buffer.close()
+
+
+def load_data(params, input_file, schema, bulk=True):
     """
     Load data from input_file into database with attached params.
 
     :param params: Params of database.
     :param input_file: The path of input file.
     :param schema: The schema we are working with.
+    :param bulk: Load tables with COPY. INSERT is used if bulk is False or COPY fails.
     :return:
-        None
+        Dictionary with the range of IDs of every table used by this load, None if the load failed.
     """
     try:
-        # open connection
-        conn = psycopg2.connect(**params)
-        cursor = conn.cursor()
-
-        data = put_data_into_right_types(read_xml_and_parse(input_file), schema, cursor)
-        insert_data(data, cursor, conn, schema)
-
-        # close connection
-        cursor.close()
-        conn.close()
+        # the connection is closed also if the load fails, rows which are not committed are rolled back
+        with closing(psycopg2.connect(**params)) as conn:
+            cursor = conn.cursor()
+
+            # the file is read twice, IDs of all rows are reserved before the first row is written
+            counts = count_rows(read_xml_and_parse(input_file))
+            ids = reserve_ids(params, schema, counts)
+            batch = {table: (ids[table], ids[table] + count) for table, count in counts.items()}
+            if bulk:
+                try:
+                    copy_data(put_data_into_right_types(read_xml_and_parse(input_file), ids), cursor, conn, schema)
+                except psycopg2.Error as e:
+                    print(f"Error: {e}, loading data with INSERT")
+                    conn.rollback()
+                    insert_data(put_data_into_right_types(read_xml_and_parse(input_file), ids), cursor, conn, schema)
+            else:
+                insert_data(put_data_into_right_types(read_xml_and_parse(input_file), ids), cursor, conn, schema)
+            cursor.close()
     except Exception as e:
         print(f"Error: {e}")
+        return None
+    return batch
+
+
+# data frames used by quality checks, built from the tables of the schema
+OMOP_FRAMES = [Frame("pdf", create_df_omop, ["con", "schema", "batch"], {"table_name": "person"}),
+               Frame("odf", create_df_omop, ["con", "schema", "batch"], {"table_name": "observation_period"}),
+               Frame("cdf", create_df_omop, ["con", "schema", "batch"], {"table_name": "condition_occurrence"}),
+               Frame("sdf", create_df_omop, ["con", "schema", "batch"], {"table_name": "specimen"}),
+               Frame("ddf", create_df_omop, ["con", "schema", "batch"], {"table_name": "drug_exposure"}),
+               Frame("prdf", create_df_omop, ["con", "schema", "batch"], {"table_name": "procedure_occurrence"}),
+               # joins shared by several quality checks
+               Frame("codf", merge_by_person, ["cdf", "odf"]),
+               Frame("pcdf", merge_by_person, ["pdf", "cdf"]),
+               Frame("cddf", merge_by_person, ["cdf", "ddf"]),
+               Frame("cprdf", merge_by_person, ["cdf", "prdf"]),
+               Frame("psdf", merge_by_person, ["pdf", "sdf"]),
+               Frame("pfdf", person_features, ["pdf", "prdf"])]
+
+# quality checks in the order of graphs on the OMOP dashboard
+OMOP_CHECKS = [Check("completeness_" + table_name, "Completeness of " + table_name, completeness_sql,
+                     ["con", "schema", "batch"], ["reports/omop/completeness" + table_name + ".csv"],
+                     arguments={"table_name": table_name})
+               for table_name in ["person", "observation_period", "condition_occurrence", "specimen", "drug_exposure",
+                                  "procedure_occurrence"]]
+OMOP_CHECKS += [Check("uniqueness_" + table_name, "Uniqueness of " + table_name, uniqueness, [frame],
+                      ["reports/omop/uniqueness" + table_name + ".csv"])
+                for frame, table_name in [("pdf", "person"), ("odf", "observation_period"),
+                                          ("cdf", "condition_occurrence"), ("sdf", "specimen"),
+                                          ("ddf", "drug_exposure"), ("prdf", "procedure_occurrence")]]
+OMOP_CHECKS += [
+    # warnings
+    Check("observation_end_precedes_condition_start", "Observation end precedes condition start",
+          observation_end_precedes_condition_start, ["codf"],
+          ["reports/omop/observation_end_precedes_condition_start.csv"]),
+    Check("observation_end_equals_condition_start", "Observation end equals condition start",
+          observation_end_equals_condition_start, ["codf"],
+          ["reports/omop/observation_end_equals_condition_start.csv"]),
+    Check("too_young_person", "Suspiciously young patient", too_young_person, ["pcdf"],
+          ["reports/omop/too_young_patients.csv"]),
+    Check("observation_end_in_the_future", "Observation end is in the future", observation_end_in_the_future_sql,
+          ["con", "schema", "batch"], ["reports/omop/observation_end_in_the_future.csv"]),
+    Check("condition_start_in_the_future", "Condition start is in the future", condition_start_in_the_future_sql,
+          ["con", "schema", "batch"], ["reports/omop/condition_start_in_the_future.csv"]),
+    Check("missing_drug_exposure_info", "Missing information of drug exposure", missing_drug_exposure_info, ["ddf"],
+          ["reports/omop/missing_drug_exposure_info.csv"]),
+    Check("sus_pharma", "Suspicious pharmacotherapy", sus_pharma, ["ddf"], ["reports/omop/sus_pharma.csv"]),
+    Check("sus_pharma_other", "Suspicious other pharmacotherapy", sus_pharma_other, ["ddf"],
+          ["reports/omop/sus_pharma_other.csv"]),
+    Check("drug_end_before_start", "Drug exposure ends before its start", drug_end_before_start_sql,
+          ["con", "schema", "batch"], ["reports/omop/drug_end_before_start.csv"]),
+
+    Check("therapy_start_before_diagnosis", "Therapy starts before diagnosis", therapy_start_before_diagnosis,
+          ["cddf", "cprdf", "ddf"],
+          ["reports/omop/therapy_before_diagnosis_ddf.csv", "reports/omop/therapy_before_diagnosis_prdf.csv"],
+          graphs=2),
+    Check("treatment_start_in_the_future", "Treatment starts in the future", treatment_start_in_the_future,
+          ["ddf", "prdf"],
+          ["reports/omop/treatment_start_in_the_future.csv", "reports/omop/start_of_treatment_is_in_the_future_prdf.csv"],
+          graphs=2),
+
+    Check("drug_exposure_end_in_the_future", "Drug exposure ends in the future", drug_exposure_end_in_the_future,
+          ["ddf"], ["reports/omop/drug_exposure_end_in_the_future.csv"]),
+    Check("sus_early_pharma", "Suspiciously early pharmacotherapy", sus_early_pharma, ["cddf", "ddf"],
+          ["reports/omop/sus_early_pharma.csv"]),
+    Check("sus_short_pharma", "Suspiciously short pharmacotherapy", sus_short_pharma, ["cddf", "ddf"],
+          ["reports/omop/sus_short_pharma.csv"]),
 
-def create_graphs_omop(ohdsi, input_file):
+    # reports
+    Check("missing_specimen_date", "Patients without date of specimen", missing_specimen_date, ["psdf"],
+          ["reports/omop/patients_without_specimen_date.csv", "reports/omop/patients_with_specimen_date.csv"]),
+    Check("patients_without_specimen_source_id", "Patients without source ID of specimen",
+          patients_without_specimen_source_id, ["psdf"],
+          ["reports/omop/patients_without_specimen_source_id.csv"]),
+    Check("patients_without_specimen_source_value_concept_id", "Patients without source value or concept of specimen",
+          patients_without_specimen_source_value_concept_id, ["psdf"],
+          ["reports/omop/patients_without_specimen_source_value.csv",
+           "reports/omop/patients_without_specimen_concept_id.csv"]),
+    Check("patients_without_condition_values", "Patients without values of condition",
+          patients_without_condition_values, ["pcdf"],
+          ["reports/omop/patients_without_condition_values.csv",
+           "reports/omop/patients_without_condition_start_date.csv",
+           "reports/omop/patients_without_condition_concept_id.csv"]),
+    Check("patients_without_surgery_values", "Patients without values of surgery", patients_without_surgery_values,
+          ["pdf", "prdf"],
+          ["reports/omop/patients_without_procedure_source_value_surgery.csv",
+           "reports/omop/patients_without_procedure_concept_id_surgery.csv",
+           "reports/omop/patients_without_procedure_date_surgery.csv"]),
+    Check("missing_patient_and_diagnostic_values", "Patients without values of patient or diagnostics",
+          missing_patient_and_diagnostic_values, ["pdf", "pfdf"],
+          ["reports/omop/missing_gender_concept_id.csv",
+           "reports/omop/missing_year_of_birth.csv",
+           "reports/omop/missing_person_source_value.csv",
+           "reports/omop/missing_gender_source_value.csv",
+           "reports/omop/patients_without_liver_imaging.csv",
+           "reports/omop/patients_without_lung_imaging.csv",
+           "reports/omop/patients_without_colonoscopy.csv",
+           "reports/omop/patients_without_mri.csv",
+           "reports/omop/patients_without_ct.csv"]),
+    Check("missing_targeted_therapy_values", "Patients without values of targeted therapy",
+          missing_targeted_therapy_values, ["pdf", "prdf"],
+          ["reports/omop/patients_without_procedure_source_value_targeted_therapy.csv",
+           "reports/omop/patients_without_procedure_concept_id_targeted_therapy.csv",
+           "reports/omop/patients_without_procedure_date_targeted_therapy"]),
+    Check("missing_pharmacotherapy_value", "Patients without values of pharmacotherapy",
+          missing_pharmacotherapy_value, ["pdf", "ddf"],
+          ["reports/omop/patients_without_drug_concept_id.csv",
+           "reports/omop/patients_without_drug_exposure_start_date.csv",
+           "reports/omop/patients_without_drug_exposure_start_datetime.csv",
+           "reports/omop/patients_without_drug_exposure_end_date.csv",
+           "reports/omop/patients_without_drug_exposure_end_datetime.csv",
+           "reports/omop/patients_without_drug_type_concept_id.csv",
+           "reports/omop/patients_without_drug_source_value.csv"]),
+    Check("missing_radiation_therapy_values", "Patients without values of radiation therapy",
+          missing_radiation_therapy_values, ["pdf", "prdf"],
+          ["reports/omop/patients_without_procedure_source_value_radiation_therapy.csv",
+           "reports/omop/patients_without_procedure_concept_id_radiation_therapy.csv",
+           "reports/omop/patients_without_procedure_date_radiation_therapy"]),
+    Check("counts_of_records", "Counts of records", counts_of_records_sql, ["con", "schema", "batch"]),
+    Check("get_patients_without_surgery", "Patients without surgery", get_patients_without_surgery, ["pdf", "pfdf"],
+          ["reports/omop/get_patients_without_surgery.csv"])
+]
+
+
+def create_graphs_omop(ohdsi, input_file, whole_schema=False):
     """
     Run OMOP loading data and quality checks.
+    Only rows inserted by this load are checked, unless whole_schema is set.
+    Quality checks are not run if the load failed.
 
     Args:
         ohdsi: Connection information for OMOP database.
         input_file: Name of file with input data.
+        whole_schema: Check all rows in the schema, including rows of previous loads.
 
     Returns:
-        List of generated graphs in json format.
+        List of generated graphs in json format, empty if the load failed.
     """
     schema = ohdsi.pop("schema")
-    load_data(ohdsi, input_file, schema)
+    batch = load_data(ohdsi, input_file, schema)
+    if batch is None:
+        print("Error: loading data into OMOP CDM failed, quality checks are not run")
+        return []
+    if whole_schema:
+        batch = None
 
     # dashboard viz
-    con = psycopg2.connect(**ohdsi)
-    graphs = []
-
-    pdf = create_df_omop(con, "person", schema)
-    odf = create_df_omop(con, "observation_period", schema)
-    cdf = create_df_omop(con, "condition_occurrence", schema)
-    sdf = create_df_omop(con, "specimen", schema)
-    ddf = create_df_omop(con, "drug_exposure", schema)
-    prdf = create_df_omop(con, "procedure_occurrence", schema)
-
-    graphs.append(completeness(pdf).to_json())
-    graphs.append(completeness(odf).to_json())
-    graphs.append(completeness(cdf).to_json())
-    graphs.append(completeness(sdf).to_json())
-    graphs.append(completeness(ddf).to_json())
-    graphs.append(completeness(prdf).to_json())
-
-    graphs.append(uniqueness(pdf).to_json())
-    graphs.append(uniqueness(pdf).to_json())
-    graphs.append(uniqueness(pdf).to_json())
-    graphs.append(uniqueness(pdf).to_json())
-    graphs.append(uniqueness(pdf).to_json())
-    graphs.append(uniqueness(pdf).to_json())
-
-    # warnings
-    graphs.append(observation_end_precedes_condition_start(cdf, odf).to_json())
-    graphs.append(observation_end_equals_condition_start(cdf, odf).to_json())
-    graphs.append(too_young_person(pdf, cdf).to_json())
-    graphs.append(observation_end_in_the_future(odf).to_json())
-    graphs.append(condition_start_in_the_future(cdf).to_json())
-    graphs.append(missing_drug_exposure_info(ddf).to_json())
-    graphs.append(sus_pharma(ddf).to_json())
-    graphs.append(sus_pharma_other(ddf).to_json())
-    graphs.append(drug_end_before_start(ddf).to_json())
-
-    fig_1, fig_2 = therapy_start_before_diagnosis(cdf, ddf, prdf)
-    fig_3, fig_4 = treatment_start_in_the_future(ddf, prdf)
-
-    graphs.append(fig_1.to_json())
-    graphs.append(fig_2.to_json())
-    graphs.append(fig_3.to_json())
-    graphs.append(fig_4.to_json())
-
-    graphs.append(drug_exposure_end_in_the_future(ddf).to_json())
-    graphs.append(sus_early_pharma(cdf, ddf).to_json())
-    graphs.append(sus_short_pharma(cdf, ddf).to_json())
-
-    # reports
-    graphs.append(missing_specimen_date(pdf, sdf).to_json())
-    graphs.append(patients_without_specimen_source_id(pdf, sdf).to_json())
-    graphs.append(patients_without_specimen_source_value_concept_id(pdf, sdf).to_json())
-    graphs.append(patients_without_condition_values(pdf, cdf).to_json())
-    graphs.append(patients_without_surgery_values(pdf, prdf).to_json())
-    graphs.append(missing_patient_and_diagnostic_values(pdf, prdf).to_json())
-    graphs.append(missing_targeted_therapy_values(pdf, prdf).to_json())
-    graphs.append(missing_pharmacotherapy_value(pdf, ddf).to_json())
-    graphs.append(missing_radiation_therapy_values(pdf, prdf).to_json())
-    graphs.append(counts_of_records(pdf, odf, cdf, sdf, ddf, prdf).to_json())
-    graphs.append(get_patients_without_surgery(pdf, prdf).to_json())
-
-    return graphs
\ No newline at end of file
+    with closing(psycopg2.connect(**ohdsi)) as con:
+        return run_checks(OMOP_CHECKS, {"con": con, "schema": schema, "batch": batch}, OMOP_FRAMES)
\ No newline at end of file
@@ -1,159 +1,167 @@
 import pandas as pd
 import plotly.express as px
 from _datetime import datetime
+from fhir_bundle import read_resources, search_resources
 
 
-def create_patient_data_frame(server):
+def create_patient_data_frame(server, resources=None):
     """
     Create data frame from Resource Patient.
 
     :param server: FHIR server.
+    :param resources: Resources kept by the loader, resources are read from server if None.
     :return:
         Patient data frame.
     """
     dicts = []
-    with open('patients_ids.txt', 'r') as ids:
-        for id in ids:
-            id = id[:-1]
-            dict = server.request_json('http://localhost:8080/fhir/Patient/' + id)
-            meta = dict.get("meta")
-            if meta is not None:
-                dict.pop("meta")
-                dict["meta_versionId"] = meta.get("versionId")
-                dict["meta_lastUpdated"] = meta.get("lastUpdated")
-            else:
-                dict["meta_versionId"] = None
-                dict["meta_lastUpdated"] = None
-
-            identifier = dict.get("identifier")
-            if identifier is not None:
-                dict.pop("identifier")
-                identifier = identifier[0]
-            else:
-                identifier = None
-            dict["identifier_value"] = identifier.get("value")
-            dicts.append(dict)
+    for id, dict in read_resources(server, "patients", "Patient", resources):
+        meta = dict.get("meta")
+        if meta is not None:
+            dict.pop("meta")
+            dict["meta_versionId"] = meta.get("versionId")
+            dict["meta_lastUpdated"] = meta.get("lastUpdated")
+        else:
+            dict["meta_versionId"] = None
+            dict["meta_lastUpdated"] = None
+
+        identifier = dict.get("identifier")
+        if identifier is not None:
+            dict.pop("identifier")
+            identifier = identifier[0]
+        else:
+            identifier = None
+        dict["identifier_value"] = identifier.get("value")
+        dicts.append(dict)
 
     return pd.DataFrame(dicts)
 
 
-def create_specimen_data_frame(server):
+def create_specimen_data_frame(server, resources=None):
     """
     Create data frame from Resource Specimen.
 
     :param server: FHIR server.
+    :param resources: Resources kept by the loader, resources are read from server if None.
     :return:
         Specimen data frame.
     """
     dicts = []
-    with open('specimens_ids.txt', 'r') as ids:
-        for id in ids:
-            id = id[:-1]
-            dict = server.request_json('http://localhost:8080/fhir/Specimen/' + id)
-
-            meta = dict.get("meta")
-            if meta is not None:
-                dict.pop("meta")
-                dict["meta_versionId"] = meta.get("versionId")
-                dict["meta_lastUpdated"] = meta.get("lastUpdated")
-            else:
-                dict["meta_versionId"] = None
-                dict["meta_lastUpdated"] = None
-
-            # type
-            type = dict.get("type")
-            if type is not None:
-                dict.pop("type")
-                type_coding = type.get("coding")
-                if type_coding is not None:
-                    type_coding = type_coding.pop()
-
-                if type_coding is not None:
-                    type_display = type_coding.get("display")
-                    dict["type_text"] = type_display
-                    type_code = type_coding.get("code")
-                    dict["type_text_code"] = type_code
-
-                collection = dict.get("collection")
-                if collection is not None:
-                    dict["collection_collectedDateTime"] = collection.get("collectedDateTime")
-                else:
-                    dict["collection_collectedDateTime"] = None
+    for id, dict in read_resources(server, "specimens", "Specimen", resources):
+        meta = dict.get("meta")
+        if meta is not None:
+            dict.pop("meta")
+            dict["meta_versionId"] = meta.get("versionId")
+            dict["meta_lastUpdated"] = meta.get("lastUpdated")
+        else:
+            dict["meta_versionId"] = None
+            dict["meta_lastUpdated"] = None
+
+        # type
+        type = dict.get("type")
+        if type is not None:
+            dict.pop("type")
+            type_coding = type.get("coding")
+            if type_coding is not None:
+                type_coding = type_coding.pop()
+
+            if type_coding is not None:
+                type_display = type_coding.get("display")
+                dict["type_text"] = type_display
+                type_code = type_coding.get("code")
+                dict["type_text_code"] = type_code
+
+            collection = dict.get("collection")
+            if collection is not None:
+                dict["collection_collectedDateTime"] = collection.get("collectedDateTime")
             else:
-                dict["type_text"] = None
                 dict["collection_collectedDateTime"] = None
+        else:
+            dict["type_text"] = None
+            dict["collection_collectedDateTime"] = None
 
-            subject = dict.get("subject")
-            if subject is not None:
-                dict.pop("subject")
-                dict["subject_reference"] = subject.get("reference")
+        subject = dict.get("subject")
+        if subject is not None:
+            dict.pop("subject")
+            dict["subject_reference"] = subject.get("reference")
 
-            dicts.append(dict)
+        dicts.append(dict)
     return pd.DataFrame(dicts)
 
 
-def create_condition_data_frame(server):
+def create_condition_data_frame(server, resources=None):
     """
     Create data frame from Resource Condition.
 
     :param server: FHIR server.
+    :param resources: Resources kept by the loader, resources are read from server if None.
     :return:
         Condition data frame.
     """
     dicts = []
-    with open('conditions_ids.txt', 'r') as ids:
-        for id in ids:
-            id = id[:-1]
-            dict = server.request_json('http://localhost:8080/fhir/Condition/' + id)
-
-            meta = dict.get("meta")
-            if meta is not None:
-                dict.pop("meta")
-                dict["meta_versionId"] = meta.get("versionId")
-                dict["meta_lastUpdated"] = meta.get("lastUpdated")
+    for id, dict in read_resources(server, "conditions", "Condition", resources):
+        meta = dict.get("meta")
+        if meta is not None:
+            dict.pop("meta")
+            dict["meta_versionId"] = meta.get("versionId")
+            dict["meta_lastUpdated"] = meta.get("lastUpdated")
+        else:
+            dict["meta_versionId"] = None
+            dict["meta_lastUpdated"] = None
+
+        dict["code_coding_system"] = None
+        dict["code_coding_code"] = None
+        dict["code_coding_display"] = None
+        dict["code_text"] = None
+        code = dict.get("code")
+        if code is not None:
+            dict.pop("code")
+            coding = code.get("coding")
+            if coding is not None:
+                coding = coding.pop()
+                dict["code_coding_system"] = coding.get("system")
+                dict["code_coding_code"] = coding.get("code")
+                dict["code_coding_display"] = coding.get("display")
+                dict["code_text"] = code.get("text")
+
+        subject = dict.get("subject")
+        if subject is not None:
+            dict.pop("subject")
+            dict["subject_reference"] = subject.get("reference")
+        else:
+            dict["subject_reference"] = None
+
+        clinicalStatus = dict.get("clinicalStatus")
+        if clinicalStatus is not None:
+            dict.pop("clinicalStatus")
+            clinicalStatus_coding = clinicalStatus.get("coding")
+            if clinicalStatus_coding is not None:
+                clinicalStatus_coding = clinicalStatus_coding[0]
+                dict["clinicalStatus_coding_system"] = clinicalStatus_coding.get("system")
+                dict["clinicalStatus_coding_code"] = clinicalStatus_coding.get("code")
+                dict["clinicalStatus_coding_display"] = clinicalStatus_coding.get("display")
             else:
-                dict["meta_versionId"] = None
-                dict["meta_lastUpdated"] = None
-
-            dict["code_coding_system"] = None
-            dict["code_coding_code"] = None
-            dict["code_coding_display"] = None
-            dict["code_text"] = None
-            code = dict.get("code")
-            if code is not None:
-                dict.pop("code")
-                coding = code.get("coding")
-                if coding is not None:
-                    coding = coding.pop()
-                    dict["code_coding_system"] = coding.get("system")
-                    dict["code_coding_code"] = coding.get("code")
-                    dict["code_coding_display"] = coding.get("display")
-                    dict["code_text"] = code.get("text")
-
-            subject = dict.get("subject")
-            if subject is not None:
-                dict.pop("subject")
-                dict["subject_reference"] = subject.get("reference")
-            else:
-                dict["subject_reference"] = None
-
-            clinicalStatus = dict.get("clinicalStatus")
-            if clinicalStatus is not None:
-                dict.pop("clinicalStatus")
-                clinicalStatus_coding = clinicalStatus.get("coding")
-                if clinicalStatus_coding is not None:
-                    clinicalStatus_coding = clinicalStatus_coding[0]
-                    dict["clinicalStatus_coding_system"] = clinicalStatus_coding.get("system")
-                    dict["clinicalStatus_coding_code"] = clinicalStatus_coding.get("code")
-                    dict["clinicalStatus_coding_display"] = clinicalStatus_coding.get("display")
-                else:
-                    dict["clinicalStatus_coding_system"] = None
-                    dict["clinicalStatus_coding_code"] = None
-                    dict["clinicalStatus_coding_display"] = None
-            dicts.append(dict)
+                dict["clinicalStatus_coding_system"] = None
+                dict["clinicalStatus_coding_code"] = None
+                dict["clinicalStatus_coding_display"] = None
+        dicts.append(dict)
     return pd.DataFrame(dicts)
 
 
+def convert_dates(df, columns):
+    """
+    Convert columns with dates to datetime, invalid dates are missing.
+
+    :param df: Input data frame, it is not changed.
+    :param columns: Columns of df with dates.
+    :return:
+        Data frame with converted columns.
+    """
+    df = df.copy()
+    for column in columns:
+        df[column] = pd.to_datetime(df[column], errors="coerce")
+    return df
+
+
 def completeness(df):
     """
     Data quality check for completeness.
@@ -204,6 +212,7 @@ def conformance_patient(df):
     :return:
         Graph of conformance.
     """
+    df = df.copy()
     # gender
     count_of_rows = df.shape[0]
     gender_check_count = df["gender"].isin(["male", "female", "other", "unknown"]).sum()
@@ -231,6 +240,7 @@ def conformance_condition(df):
     :return:
         Graph of conformance.
     """
+    df = df.copy()
     count_of_rows = df.shape[0]
 
     # recordedDate
@@ -313,6 +323,7 @@ def conformance_specimen(df):
     :return:
         Graph of conformance.
     """
+    df = df.copy()
     count_of_rows = df.shape[0]
 
     # type text
@@ -334,26 +345,55 @@ def conformance_specimen(df):
     return fig
 
 
-def conformance_relational(df, server):
+def existing_references(references, server, pdf=None):
+    """
+    Helper function for conformance_relational.
+    References to patients in Patient data frame are resolved without the server,
+    other references are resolved by one search of their IDs for every referenced type.
+
+    :param references: Distinct references in the form Type/id.
+    :param server: FHIR server.
+    :param pdf: Patient data frame, can be None.
+    :return:
+        Set of references to existing resources.
+    """
+    known = set()
+    if pdf is not None and "id" in pdf:
+        known = {"Patient/" + str(id) for id in pdf["id"].dropna()}
+    result = set()
+    unresolved = {}
+    for reference in references:
+        if reference in known:
+            result.add(reference)
+            continue
+        parts = reference.split("/")
+        if len(parts) >= 2 and parts[-2] and parts[-1]:
+            unresolved.setdefault(parts[-2], []).append((reference, parts[-1]))
+    for type, type_references in unresolved.items():
+        try:
+            found = search_resources(server, type, [id for _, id in type_references], elements=["id"])
+        except Exception as e:
+            print(f"Error: {e}")
+            found = {}
+        result.update(reference for reference, id in type_references if id in found)
+    return result
+
+
+def conformance_relational(df, server, pdf=None):
     """
     Data quality check for relational conformance of Resource.
 
     :param df: Data frame.
     :param server: FHIR server.
+    :param pdf: Patient data frame, references to its patients are not checked on the server.
     :return:
         Graph of relational conformance.
     """
     count_of_rows = df.shape[0]
-    count_of_invalid_references = 0
-
-    for index in df.index:
-        link = df['id'][index]
-        subject_reference = df['subject_reference'][index]
-        resource_type = df["resourceType"][index]
-        try:
-            server.request_json('http://localhost:8080/fhir/' + subject_reference)
-        except:
-            count_of_invalid_references += 1
+    subject_references = df['subject_reference']
+    references = [reference for reference in subject_references.dropna().unique() if isinstance(reference, str)]
+    valid = existing_references(references, server, pdf)
+    count_of_invalid_references = int((~subject_references.isin(valid)).sum())
     result = {
         "Records": ["Number of records", "Invalid references"],
         "Count": [count_of_rows, count_of_invalid_references]
@@ -364,26 +404,43 @@ def conformance_relational(df, server):
     return fig
 
 
-def get_birthDay(pdf, subject_reference):
+def birth_dates(pdf, df):
+    """
+    Helper function for conformance_computational.
+
+    :param pdf: Patient data frame.
+    :param df: Data frame with column subject_reference.
+    :return:
+        Birthdays of referenced patients aligned with df, missing if patient is unknown.
+    """
+    subject_reference_split = df["subject_reference"].astype(str).str.split("/")
+    patient_id = subject_reference_split.where(subject_reference_split.str.len() == 2).str[1]
+    if "birthDate" not in pdf:
+        return pd.Series(None, index=df.index, dtype=object)
+    # the first patient with the id is used
+    birth_date = pdf.drop_duplicates("id").set_index("id")["birthDate"]
+    return patient_id.map(birth_date)
+
+
+def count_born_later(pdf, df, columns):
     """
     Helper function for conformance_computational.
 
     :param pdf: Patient data frame.
-    :param subject_reference: Patient id.
+    :param df: Data frame with column subject_reference.
+    :param columns: Columns of df with dates.
     :return:
-        Birthday of Patient.
+        Counts of rows with the date before birthday of patient for every column,
+        rows with a missing value are not counted.
     """
-    subject_reference_split = subject_reference.split("/")
-    patient_id = None
-    if len(subject_reference_split) == 2:
-        patient_id = subject_reference_split[1]
-    birthDate = None
-    if patient_id is not None:
-        patient = pdf.loc[pdf['id'] == patient_id]
-        if not patient.empty:
-            patient = patient.iloc[0]
-            birthDate = patient['birthDate']
-    return birthDate
+    if df.empty:
+        return [0 for _ in columns]
+    birth_date = birth_dates(pdf, df)
+    counts = []
+    for column in columns:
+        known = birth_date.notna() & df[column].notna()
+        counts.append(int((birth_date[known] > df[column][known]).sum()))
+    return counts
 
 
 def conformance_computational(pdf, sdf, cdf):
@@ -396,29 +453,8 @@ def conformance_computational(pdf, sdf, cdf):
     :return:
         Graph of computational conformance.
     """
-    count_invalid_collection_collectedDateTime = 0
-    for index in sdf.index:
-        collection_collectedDateTime = sdf["collection_collectedDateTime"][index]
-        subject_reference = sdf['subject_reference'][index]
-        birthDay = get_birthDay(pdf, subject_reference)
-        if birthDay is not None:
-            if birthDay > collection_collectedDateTime:
-                count_invalid_collection_collectedDateTime += 1
-
-    onsetDateTime_count = 0
-    recordedDate_count = 0
-    for index in cdf.index:
-        onsetDateTime = cdf["onsetDateTime"][index]
-        recordedDate = cdf["recordedDate"][index]
-
-        if index < len(sdf.index):
-            subject_reference = sdf['subject_reference'][index]
-            birthDay = get_birthDay(pdf, subject_reference)
-        if birthDay is not None:
-            if birthDay > onsetDateTime:
-                onsetDateTime_count += 1
-            if birthDay > recordedDate:
-                recordedDate_count += 1
+    count_invalid_collection_collectedDateTime, = count_born_later(pdf, sdf, ["collection_collectedDateTime"])
+    onsetDateTime_count, recordedDate_count = count_born_later(pdf, cdf, ["onsetDateTime", "recordedDate"])
 
     result = {
         "Records": ["Number of records in specimens",
@@ -1,697 +1,699 @@
 import pandas as pd
 import plotly.express as px
 from _datetime import datetime
+from fhir_bundle import read_resources
 # from load_data_fhir_extra import provide_server_connection, read_xml_and_create_resources
 
 
-def create_patient_data_frame(server):
+def patient_id(reference):
+    """
+    Get ID of patient from reference to Patient, the "subject" key shared by all data frames.
+
+    Args:
+        reference: Relative or absolute reference to Patient, e.g. "Patient/123".
+
+    Returns:
+        ID of patient.
+
+    """
+    return reference.split("/")[-1]
+
+
+def create_patient_data_frame(server, resources=None):
     """
     Convert FHIR resources Patient into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = { "subject" : [],
-                "gender" : [],
-                "birthDate" : [],
-                "deceasedBoolean" : [],
-                "deceasedDateTime" : [],
-                "identifier" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('patients_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Patient/' + id)
-
-            # subject
-            result["subject"] = id
-
-            # gender
-            gender = data.get("gender")
-            result["gender"] = gender
-
-            # birthDate
-            birth_date = data.get("birthDate")
-            result["birthDate"] = birth_date
-
-            # deceasedBoolean
-            deceased_boolean = data.get("deceasedBoolean")
-            result["deceasedBoolean"] = deceased_boolean
-
-            # deceasedDateTime
-            deceased_date_time = None if deceased_boolean is False else data.get("deceasedDateTime")
-            result["deceasedDateTime"] = deceased_date_time
-
-            # identifier
-            result["identifier"] = None
-            identifier_wrapper = data.get("identifier")
+    columns = ["subject",
+               "gender",
+               "birthDate",
+               "deceasedBoolean",
+               "deceasedDateTime",
+               "identifier"
+               ]
+    records = []
+    for id, data in read_resources(server, "patients", "Patient", resources):
+        result = {}
+
+        # subject
+        result["subject"] = id
+
+        # gender
+        gender = data.get("gender")
+        result["gender"] = gender
+
+        # birthDate
+        birth_date = data.get("birthDate")
+        result["birthDate"] = birth_date
+
+        # deceasedBoolean
+        deceased_boolean = data.get("deceasedBoolean")
+        result["deceasedBoolean"] = deceased_boolean
+
+        # deceasedDateTime
+        deceased_date_time = None if deceased_boolean is False else data.get("deceasedDateTime")
+        result["deceasedDateTime"] = deceased_date_time
+
+        # identifier
+        result["identifier"] = None
+        identifier_wrapper = data.get("identifier")
+        if identifier_wrapper is not None:
+            identifier_wrapper = identifier_wrapper.pop()
             if identifier_wrapper is not None:
-                identifier_wrapper = identifier_wrapper.pop()
-                if identifier_wrapper is not None:
-                    identifier = identifier_wrapper.get("value")
-                    result["identifier"] = identifier
+                identifier = identifier_wrapper.get("value")
+                result["identifier"] = identifier
 
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['birthDate'] = pd.to_datetime(all_times['birthDate'])
     all_times['deceasedDateTime'] = pd.to_datetime(all_times['deceasedDateTime'])
     return all_times
 
 
-def normalize_tnm(server):
+def normalize_tnm(server, resources=None):
     names = {}
     all_tnm = pd.DataFrame(names)
     all_jsons = []
-    with open('tnm_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Observation/' + id)
-            all_jsons.append(data)
+    for id, data in read_resources(server, "tnm", "Observation", resources):
+        result = {}
+        all_jsons.append(data)
 
     df = pd.json_normalize(all_jsons)
 
 
-def create_tnm_dataframe(server):
+def create_tnm_dataframe(server, resources=None):
     """
     Convert FHIR resources Observation representing TNM and
      other histopathology information into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"method_coding_code" : [],
-                "method_coding_display" : [],
-                "subject" : [],
-                "stage_code" : [],
-                "stage_display" : [],
-                "t_coding_code" : [],
-                "t_coding_display" : [],
-                "n_coding_code" : [],
-                "n_coding_display" : [],
-                "m_coding_code" : [],
-                "m_coding_display" : [],
-                "morpho_coding_code" : [],
-                "morpho_coding_display" : [],
-                "grade_coding_code" : [],
-                "grade_coding_display" : []
-                }
-    all_tnm = pd.DataFrame(all_dict)
-    with open('tnm_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Observation/' + id)
-
-            # method
-            result["method_coding_code"] = None
-            result["method_coding_display"] = None
-            method = data.get("method")
-            if method is not None:
-                method_coding = method.get("coding")
-                if method_coding is not None:
-                    method_coding = method_coding.pop()
-                    result["method_coding_code"] = method_coding.get("code")
-                    result["method_coding_display"] = method_coding.get("display")
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                if reference is not None:
-                    result["subject"] = reference
-
-            # stage
-            result["stage_code"] = None
-            result["stage_display"] = None
-            value = data.get("valueCodeableConcept")
-            if value is not None:
-                coding = value.get("coding")
-                if coding is not None:
-                    coding = coding.pop()
-                    if "code" in coding.keys():
-                        stage_code = coding.get("code")
-                    else:
-                        stage_code = None
-                    if "display" in coding.keys():
-                        stage_display = coding.get("display")
-                    else:
-                        stage_display = None
-                    result["stage_code"] = stage_code
-                    result["stage_display"] = stage_display
-
-            component = data.get("component")
-
-            # grade
-            result["grade_coding_code"] = None
-            result["grade_coding_display"] = None
-            if component is not None:
-                grade = component.pop()
-                if grade is not None:
-                    grade_value = grade.get("valueCodeableConcept")
-                    if grade_value is not None:
-                        grade_coding = grade_value.get("coding")
+    columns = ["method_coding_code",
+               "method_coding_display",
+               "subject",
+               "stage_code",
+               "stage_display",
+               "t_coding_code",
+               "t_coding_display",
+               "n_coding_code",
+               "n_coding_display",
+               "m_coding_code",
+               "m_coding_display",
+               "morpho_coding_code",
+               "morpho_coding_display",
+               "grade_coding_code",
+               "grade_coding_display"
+               ]
+    records = []
+    for id, data in read_resources(server, "tnm", "Observation", resources):
+        result = {}
+
+        # method
+        result["method_coding_code"] = None
+        result["method_coding_display"] = None
+        method = data.get("method")
+        if method is not None:
+            method_coding = method.get("coding")
+            if method_coding is not None:
+                method_coding = method_coding.pop()
+                result["method_coding_code"] = method_coding.get("code")
+                result["method_coding_display"] = method_coding.get("display")
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # stage
+        result["stage_code"] = None
+        result["stage_display"] = None
+        value = data.get("valueCodeableConcept")
+        if value is not None:
+            coding = value.get("coding")
+            if coding is not None:
+                coding = coding.pop()
+                if "code" in coding.keys():
+                    stage_code = coding.get("code")
+                else:
+                    stage_code = None
+                if "display" in coding.keys():
+                    stage_display = coding.get("display")
+                else:
+                    stage_display = None
+                result["stage_code"] = stage_code
+                result["stage_display"] = stage_display
+
+        component = data.get("component")
+
+        # grade
+        result["grade_coding_code"] = None
+        result["grade_coding_display"] = None
+        if component is not None:
+            grade = component.pop()
+            if grade is not None:
+                grade_value = grade.get("valueCodeableConcept")
+                if grade_value is not None:
+                    grade_coding = grade_value.get("coding")
+                    if grade_coding is not None:
+                        grade_coding = grade_coding.pop()
                         if grade_coding is not None:
-                            grade_coding = grade_coding.pop()
-                            if grade_coding is not None:
-                                grade_coding_code = grade_coding.get("code")
-                                grade_coding_display = grade_coding.get("display")
-                                result["grade_coding_code"] = grade_coding_code
-                                result["grade_coding_display"] = grade_coding_display
-
-            # morphology
-            result["morpho_coding_code"] = None
-            result["morpho_coding_display"] = None
-            if component is not None:
-                morpho = component.pop()
-                if morpho is not None:
-                    morpho_value = morpho.get("valueCodeableConcept")
-                    if morpho_value is not None:
-                        morpho_coding = morpho_value.get("coding")
-                        if morpho_coding is not None:
-                            morpho_coding = morpho_coding.pop()
-                            morpho_coding_code = morpho_coding.get("code")
-                            morpho_coding_display = morpho_coding.get("display")
-                            result["morpho_coding_code"] = morpho_coding_code
-                            result["morpho_coding_display"] = morpho_coding_display
-
-            # M
-            result["m_coding_code"] = None
-            result["m_coding_display"] = None
-            if component is not None:
-                m = component.pop()
-                if m is not None:
-                    m_value = m.get("valueCodeableConcept")
-                    if m_value is not None:
-                        m_coding = m_value.get("coding")
-                        if m_coding is not None:
-                            m_coding = m_coding.pop()
-                            m_coding_code = m_coding.get("code")
-                            m_coding_display = m_coding.get("display")
-                            result["m_coding_code"] = m_coding_code
-                            result["m_coding_display"] = m_coding_display
-
-            # N
-            result["n_coding_code"] = None
-            result["n_coding_display"] = None
-            if component is not None:
-                n = component.pop()
-                if n is not None:
-                    n_value = n.get("valueCodeableConcept")
-                    if n_value is not None:
-                        n_coding = n_value.get("coding")
-                        if n_coding is not None:
-                            n_coding = n_coding.pop()
-                            n_coding_code = n_coding.get("code")
-                            n_coding_display = n_coding.get("display")
-                            result["n_coding_code"] = n_coding_code
-                            result["n_coding_display"] = n_coding_display
-
-            # T
-            result["t_coding_code"] = None
-            result["t_coding_display"] = None
-            if component is not None:
-                t = component.pop()
-                if t is not None:
-                    t_value = t.get("valueCodeableConcept")
-                    if t_value is not None:
-                        t_coding = t_value.get("coding")
-                        if t_coding is not None:
-                            t_coding = t_coding.pop()
-                            t_coding_code = t_coding.get("code")
-                            t_coding_display = t_coding.get("display")
-                            result["t_coding_code"] = t_coding_code
-                            result["t_coding_display"] = t_coding_display
-
-            next_df = pd.DataFrame([result])
-            all_tnm = pd.concat([all_tnm, next_df])
+                            grade_coding_code = grade_coding.get("code")
+                            grade_coding_display = grade_coding.get("display")
+                            result["grade_coding_code"] = grade_coding_code
+                            result["grade_coding_display"] = grade_coding_display
+
+        # morphology
+        result["morpho_coding_code"] = None
+        result["morpho_coding_display"] = None
+        if component is not None:
+            morpho = component.pop()
+            if morpho is not None:
+                morpho_value = morpho.get("valueCodeableConcept")
+                if morpho_value is not None:
+                    morpho_coding = morpho_value.get("coding")
+                    if morpho_coding is not None:
+                        morpho_coding = morpho_coding.pop()
+                        morpho_coding_code = morpho_coding.get("code")
+                        morpho_coding_display = morpho_coding.get("display")
+                        result["morpho_coding_code"] = morpho_coding_code
+                        result["morpho_coding_display"] = morpho_coding_display
+
+        # M
+        result["m_coding_code"] = None
+        result["m_coding_display"] = None
+        if component is not None:
+            m = component.pop()
+            if m is not None:
+                m_value = m.get("valueCodeableConcept")
+                if m_value is not None:
+                    m_coding = m_value.get("coding")
+                    if m_coding is not None:
+                        m_coding = m_coding.pop()
+                        m_coding_code = m_coding.get("code")
+                        m_coding_display = m_coding.get("display")
+                        result["m_coding_code"] = m_coding_code
+                        result["m_coding_display"] = m_coding_display
+
+        # N
+        result["n_coding_code"] = None
+        result["n_coding_display"] = None
+        if component is not None:
+            n = component.pop()
+            if n is not None:
+                n_value = n.get("valueCodeableConcept")
+                if n_value is not None:
+                    n_coding = n_value.get("coding")
+                    if n_coding is not None:
+                        n_coding = n_coding.pop()
+                        n_coding_code = n_coding.get("code")
+                        n_coding_display = n_coding.get("display")
+                        result["n_coding_code"] = n_coding_code
+                        result["n_coding_display"] = n_coding_display
+
+        # T
+        result["t_coding_code"] = None
+        result["t_coding_display"] = None
+        if component is not None:
+            t = component.pop()
+            if t is not None:
+                t_value = t.get("valueCodeableConcept")
+                if t_value is not None:
+                    t_coding = t_value.get("coding")
+                    if t_coding is not None:
+                        t_coding = t_coding.pop()
+                        t_coding_code = t_coding.get("code")
+                        t_coding_display = t_coding.get("display")
+                        result["t_coding_code"] = t_coding_code
+                        result["t_coding_display"] = t_coding_display
+
+        records.append(result)
+    all_tnm = pd.DataFrame(records, columns=columns, dtype=object)
     return all_tnm
 
-def create_recurrence_df(server):
+def create_recurrence_df(server, resources=None):
     """
     Convert FHIR resources Observation representing
      recurrence of metastasis into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"subject" : [],
-                "recurrence" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('recurrence_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Observation/' + id)
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # recurrence
-            result["recurrence"] = None
-            value_quantity = data.get("valueQuantity")
-            if value_quantity is not None:
-                value = value_quantity.get("value")
-                result["recurrence"] = value
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+    columns = ["subject",
+               "recurrence"
+               ]
+    records = []
+    for id, data in read_resources(server, "recurrence", "Observation", resources):
+        result = {}
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # recurrence
+        result["recurrence"] = None
+        value_quantity = data.get("valueQuantity")
+        if value_quantity is not None:
+            value = value_quantity.get("value")
+            result["recurrence"] = value
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
+    all_times['recurrence'] = all_times['recurrence'].astype(float)
     return all_times
 
 
-def create_time_observation_df(server):
+def create_time_observation_df(server, resources=None):
     """
     Convert FHIR resources Observation representing
      time information into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"last_update" : [],
-                "subject" : [],
-                "overall_survival" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('time_observation_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Observation/' + id)
-
-            # last_update
-            last_update = data.get("effectiveDateTime")
-            result["last_update"] = last_update
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # overall_survival
-            result["overall_survival"] = None
-            value_quantity = data.get("valueQuantity")
-            if value_quantity is not None:
-                value = value_quantity.get("value")
-                result["overall_survival"] = value
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+    columns = ["last_update",
+               "subject",
+               "overall_survival"
+               ]
+    records = []
+    for id, data in read_resources(server, "time_observation", "Observation", resources):
+        result = {}
+
+        # last_update
+        last_update = data.get("effectiveDateTime")
+        result["last_update"] = last_update
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # overall_survival
+        result["overall_survival"] = None
+        value_quantity = data.get("valueQuantity")
+        if value_quantity is not None:
+            value = value_quantity.get("value")
+            result["overall_survival"] = value
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['last_update'] = pd.to_datetime(all_times['last_update'])
+    all_times['overall_survival'] = all_times['overall_survival'].astype(float)
     return all_times
 
 
-def create_radiation_df(server):
+def create_radiation_df(server, resources=None):
     """
     Convert FHIR resources Procedure representing
      Radiation Therapy into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"subject" : [],
-                "start" : [],
-                "end" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('radiation_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Procedure/' + id)
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # start + end
-            result["start"] = None
-            result["end"] = None
-            performed_period = data.get("performedPeriod")
-            if performed_period is not None:
-                start = performed_period.get("start")
-                result["start"] = start
-                end = performed_period.get("end")
-                result["end"] = end
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+    columns = ["subject",
+               "start",
+               "end"
+               ]
+    records = []
+    for id, data in read_resources(server, "radiation", "Procedure", resources):
+        result = {}
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # start + end
+        result["start"] = None
+        result["end"] = None
+        performed_period = data.get("performedPeriod")
+        if performed_period is not None:
+            start = performed_period.get("start")
+            result["start"] = start
+            end = performed_period.get("end")
+            result["end"] = end
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['start'] = pd.to_datetime(all_times['start'])
     all_times['end'] = pd.to_datetime(all_times['end'])
     return all_times
 
 
-def create_response_df(server):
+def create_response_df(server, resources=None):
     """
     Convert FHIR resources Observation representing
      response to therapy into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"subject": [],
-                "date": [],
-                "code": [],
-                "display": []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('response_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Observation/' + id)
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # date
-            date = data.get("effectiveDateTime")
-            result["date"] = date
-
-            # code + display
-            result["code"] = None
-            result["display"] = None
-            value = data.get("valueCodeableConcept")
-            if value is not None:
-                coding = value.get("coding")
+    columns = ["subject",
+               "date",
+               "code",
+               "display"
+               ]
+    records = []
+    for id, data in read_resources(server, "response", "Observation", resources):
+        result = {}
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # date
+        date = data.get("effectiveDateTime")
+        result["date"] = date
+
+        # code + display
+        result["code"] = None
+        result["display"] = None
+        value = data.get("valueCodeableConcept")
+        if value is not None:
+            coding = value.get("coding")
+            if coding is not None:
+                coding = coding.pop()
                 if coding is not None:
-                    coding = coding.pop()
-                    if coding is not None:
-                        code = coding.get("code")
-                        result["code"] = code
-                        display = coding.get("display")
-                        result["display"] = display
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+                    code = coding.get("code")
+                    result["code"] = code
+                    display = coding.get("display")
+                    result["display"] = display
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['date'] = pd.to_datetime(all_times['date'])
     return all_times
 
 
-def create_surgery_df(server):
+def create_surgery_df(server, resources=None):
     """
     Convert FHIR resources Procedure representing
      Surgery into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"subject": [],
-                "surgery_code": [],
-                "surgery_display": [],
-                "start": [],
-                "body_site_code": [],
-                "body_site_display": [],
-                "outcome_code": [],
-                "outcome_display": [],
-                "note_text": []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('surgery_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Procedure/' + id)
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # surgery code + display
-            result["surgery_code"] = None
-            result["surgery_display"] = None
-            surgery_code = data.get("code")
-            if surgery_code is not None:
-                coding = surgery_code.get("coding")
-                if coding is not None:
-                    coding = coding.pop()
-                    code = coding.get("code")
-                    result["surgery_code"] = code
-                    display = coding.get("display")
-                    result["surgery_display"] = display
-
-            # start
-            result["start"] = None
-            performed_period = data.get("performedPeriod")
-            if performed_period is not None:
-                start = performed_period.get("start")
-                result["start"] = start
-
-            # bodySite code
-            result["body_site_code"] = None
-            result["body_site_display"] = None
-            body_site = data.get("bodySite")
+    columns = ["subject",
+               "surgery_code",
+               "surgery_display",
+               "start",
+               "body_site_code",
+               "body_site_display",
+               "outcome_code",
+               "outcome_display",
+               "note_text"
+               ]
+    records = []
+    for id, data in read_resources(server, "surgery", "Procedure", resources):
+        result = {}
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # surgery code + display
+        result["surgery_code"] = None
+        result["surgery_display"] = None
+        surgery_code = data.get("code")
+        if surgery_code is not None:
+            coding = surgery_code.get("coding")
+            if coding is not None:
+                coding = coding.pop()
+                code = coding.get("code")
+                result["surgery_code"] = code
+                display = coding.get("display")
+                result["surgery_display"] = display
+
+        # start
+        result["start"] = None
+        performed_period = data.get("performedPeriod")
+        if performed_period is not None:
+            start = performed_period.get("start")
+            result["start"] = start
+
+        # bodySite code
+        result["body_site_code"] = None
+        result["body_site_display"] = None
+        body_site = data.get("bodySite")
+        if body_site is not None:
+            body_site = body_site.pop()
             if body_site is not None:
-                body_site = body_site.pop()
-                if body_site is not None:
-                    body_site_coding = body_site.get("coding")
+                body_site_coding = body_site.get("coding")
+                if body_site_coding is not None:
+                    body_site_coding = body_site_coding.pop()
                     if body_site_coding is not None:
-                        body_site_coding = body_site_coding.pop()
-                        if body_site_coding is not None:
-                            body_site_code = body_site_coding.get("code")
-                            result["body_site_code"] = body_site_code
-
-                            # bodySite display
-                            body_site_display = body_site_coding.get("display")
-                            result["body_site_display"] = body_site_display
-
-            # outcome code + display
-            result["outcome_code"] = None
-            result["outcome_display"] = None
-            outcome = data.get("outcome")
-            if outcome is not None:
-                outcome_coding = outcome.get("coding")
+                        body_site_code = body_site_coding.get("code")
+                        result["body_site_code"] = body_site_code
+
+                        # bodySite display
+                        body_site_display = body_site_coding.get("display")
+                        result["body_site_display"] = body_site_display
+
+        # outcome code + display
+        result["outcome_code"] = None
+        result["outcome_display"] = None
+        outcome = data.get("outcome")
+        if outcome is not None:
+            outcome_coding = outcome.get("coding")
+            if outcome_coding is not None:
+                outcome_coding = outcome_coding.pop()
                 if outcome_coding is not None:
-                    outcome_coding = outcome_coding.pop()
-                    if outcome_coding is not None:
-                        outcome_code = outcome_coding.get("code")
-                        result["outcome_code"] = outcome_code
-                        outcome_display = outcome_coding.get("display")
-                        result["outcome_display"] = outcome_display
-
-            # note
-            result["note_text"] = None
-            note = data.get("note")
+                    outcome_code = outcome_coding.get("code")
+                    result["outcome_code"] = outcome_code
+                    outcome_display = outcome_coding.get("display")
+                    result["outcome_display"] = outcome_display
+
+        # note
+        result["note_text"] = None
+        note = data.get("note")
+        if note is not None:
+            note = note.pop()
             if note is not None:
-                note = note.pop()
-                if note is not None:
-                    note_text = note.get("text")
-                    result["note_text"] = note_text
+                note_text = note.get("text")
+                result["note_text"] = note_text
 
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['start'] = pd.to_datetime(all_times['start'])
     return all_times
 
 
-def create_specimen_data_frame(server):
+def create_specimen_data_frame(server, resources=None):
     """
     Create data frame from Resource Specimen.
 
     :param server: FHIR server.
+    :param resources: Resources kept by the loader, resources are read from server if None.
     :return:
         Specimen data frame.
     """
-    all_dict = {"collected_date_time": [],
-                "identifier": [],
-                "type_code": [],
-                "type_display" : [],
-                "subject" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('specimens_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Specimen/' + id)
-
-            # collection collected
-            result["collected_date_time"] = None
-            collection = data.get("collection")
-            if collection is not None:
-                collected_date_time = collection.get("collectedDateTime")
-                result["collected_date_time"] = collected_date_time
-
-            # identifier
-            result["identifier"] = None
-            identifier_wrapper = data.get("identifier")
+    columns = ["collected_date_time",
+               "identifier",
+               "type_code",
+               "type_display",
+               "subject"
+               ]
+    records = []
+    for id, data in read_resources(server, "specimens", "Specimen", resources):
+        result = {}
+
+        # collection collected
+        result["collected_date_time"] = None
+        collection = data.get("collection")
+        if collection is not None:
+            collected_date_time = collection.get("collectedDateTime")
+            result["collected_date_time"] = collected_date_time
+
+        # identifier
+        result["identifier"] = None
+        identifier_wrapper = data.get("identifier")
+        if identifier_wrapper is not None:
+            identifier_wrapper = identifier_wrapper.pop()
             if identifier_wrapper is not None:
-                identifier_wrapper = identifier_wrapper.pop()
-                if identifier_wrapper is not None:
-                    identifier = identifier_wrapper.get("value")
-                    result["identifier"] = identifier
-
-            # type code + display
-            result["type_code"] = None
-            result["type_display"] = None
-            type = data.get("type")
-            if type is not None:
-                type_coding = type.get("coding")
+                identifier = identifier_wrapper.get("value")
+                result["identifier"] = identifier
+
+        # type code + display
+        result["type_code"] = None
+        result["type_display"] = None
+        type = data.get("type")
+        if type is not None:
+            type_coding = type.get("coding")
+            if type_coding is not None:
+                type_coding = type_coding.pop()
                 if type_coding is not None:
-                    type_coding = type_coding.pop()
-                    if type_coding is not None:
-                        type_code = type_coding.get("code")
-                        result["type_code"] = type_code
-                        type_display = type_coding.get("display")
-                        result["type_display"] = type_display
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+                    type_code = type_coding.get("code")
+                    result["type_code"] = type_code
+                    type_display = type_coding.get("display")
+                    result["type_display"] = type_display
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['collected_date_time'] = pd.to_datetime(all_times['collected_date_time'])
     return all_times
 
 
-def create_condition_data_frame(server):
+def create_condition_data_frame(server, resources=None):
     """
     Create data frame from Resource Condition.
 
     :param server: FHIR server.
+    :param resources: Resources kept by the loader, resources are read from server if None.
     :return:
         Condition data frame.
     """
-    all_dict = {"recorded_date": [],
-                "onset_date_time": [],
-                "code_code": [],
-                "code_display" : [],
-                "subject" : []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('conditions_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Condition/' + id)
-
-            # recordedDate
-            recorded_date = data.get("recordedDate")
-            result["recorded_date"] = recorded_date
-
-            # onsetDateTime
-            onset_date_time = data.get("onsetDateTime")
-            result["onset_date_time"] = onset_date_time
-
-            # code + display
-            code = data.get("code")
-            if code is not None:
-                code_coding = code.get("coding")
+    columns = ["recorded_date",
+               "onset_date_time",
+               "code_code",
+               "code_display",
+               "subject"
+               ]
+    records = []
+    for id, data in read_resources(server, "conditions", "Condition", resources):
+        result = {}
+
+        # recordedDate
+        recorded_date = data.get("recordedDate")
+        result["recorded_date"] = recorded_date
+
+        # onsetDateTime
+        onset_date_time = data.get("onsetDateTime")
+        result["onset_date_time"] = onset_date_time
+
+        # code + display
+        code = data.get("code")
+        if code is not None:
+            code_coding = code.get("coding")
+            if code_coding is not None:
+                code_coding = code_coding.pop()
                 if code_coding is not None:
-                    code_coding = code_coding.pop()
-                    if code_coding is not None:
-                        code_code = code_coding.get("code")
-                        result["code_code"] = code_code
-                        code_display = code_coding.get("display")
-                        result["code_display"] = code_display
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+                    code_code = code_coding.get("code")
+                    result["code_code"] = code_code
+                    code_display = code_coding.get("display")
+                    result["code_display"] = code_display
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['recorded_date'] = pd.to_datetime(all_times['recorded_date'])
     all_times['onset_date_time'] = pd.to_datetime(all_times['onset_date_time'])
     return all_times
 
 
-def create_targeted_therapy_dataframe(server):
+def create_targeted_therapy_dataframe(server, resources=None):
     """
    Convert FHIR resources Procedure representing
     Targeted Therapy into pandas dataframe.
 
     Args:
         server: FHIR server.
+        resources: Resources kept by the loader, resources are read from server if None.
 
     Returns:
         Dataframe.
 
     """
-    all_dict = {"subject": [],
-                "start": [],
-                "end": []
-                }
-    all_times = pd.DataFrame(all_dict)
-    with open('targeteds_ids.txt', 'r') as ids:
-        for id in ids:
-            result = {}
-            id = id[:-1]
-            data = server.request_json('http://localhost:8080/fhir/Procedure/' + id)
-
-            # subject
-            result["subject"] = None
-            subject = data.get("subject")
-            if subject is not None:
-                reference = subject.get("reference")
-                result["subject"] = reference
-
-            # start + end
-            result["start"] = None
-            result["end"] = None
-            performed_period = data.get("performedPeriod")
-            if performed_period is not None:
-                start = performed_period.get("start")
-                result["start"] = start
-                end = performed_period.get("end")
-                result["end"] = end
-
-            next_df = pd.DataFrame([result])
-            all_times = pd.concat([all_times, next_df])
+    columns = ["subject",
+               "start",
+               "end"
+               ]
+    records = []
+    for id, data in read_resources(server, "targeteds", "Procedure", resources):
+        result = {}
+
+        # subject
+        result["subject"] = None
+        subject = data.get("subject")
+        if subject is not None:
+            reference = subject.get("reference")
+            if reference is not None:
+                result["subject"] = patient_id(reference)
+
+        # start + end
+        result["start"] = None
+        result["end"] = None
+        performed_period = data.get("performedPeriod")
+        if performed_period is not None:
+            start = performed_period.get("start")
+            result["start"] = start
+            end = performed_period.get("end")
+            result["end"] = end
+
+        records.append(result)
+    all_times = pd.DataFrame(records, columns=columns, dtype=object)
     all_times['start'] = pd.to_datetime(all_times['start'])
     all_times['end'] = pd.to_datetime(all_times['end'])
     return all_times
@@ -728,9 +730,7 @@ def last_update_before_initial_diagnosis(cdf, odf):
         Graph of result.
 
     """
-    cdf_copy = cdf.copy()
-    odf_copy = odf.copy()
-    result = pd.merge(cdf_copy, odf_copy, how="inner", on=["subject"])
+    result = pd.merge(cdf, odf, how="inner", on=["subject"])
     result["fromDiagToVitalCheckWeeks"] = result["last_update"] < result["recorded_date"]
 
     all = result.shape[0]
@@ -763,9 +763,7 @@ def vital_check_date_is_equal_to_initial_diagnosis_date(cdf, odf):
     Returns:
         Graph of result.
     """
-    cdf_copy = cdf.copy()
-    odf_copy = odf.copy()
-    result = pd.merge(cdf_copy, odf_copy, how="inner", on=["subject"])
+    result = pd.merge(cdf, odf, how="inner", on=["subject"])
     result["fromDiagToVitalCheckWeeks"] = result["last_update"] == result["recorded_date"]
 
     all = result.shape[0]
@@ -804,9 +802,7 @@ def suspicious_survival_information(cdf, odf):
         Graph of result.
 
     """
-    cdf_copy = cdf.copy()
-    odf_copy = odf.copy()
-    result = pd.merge(cdf_copy, odf_copy, how="inner", on=["subject"])
+    result = pd.merge(cdf, odf, how="inner", on=["subject"])
     result["fromDiagToVitalCheckWeeks"] = result["last_update"] > result["recorded_date"]
 
     result['last_update'] = pd.to_datetime(result['last_update'])
@@ -845,10 +841,7 @@ def age_at_primary_diagnosis(pdf, cdf):
     :return:
         Graph of result.
     """
-    cdf_copy = cdf.copy()
-    cdf_copy["subject"] = cdf_copy["subject"].apply(lambda x: x.split("/")[1])
-    pdf_copy = pdf.copy()
-    merged_df = pd.merge(pdf_copy, cdf_copy, how="left", on="subject")
+    merged_df = pd.merge(pdf, cdf, how="left", on="subject")
     count_of_rows = merged_df.shape[0]
     merged_df["age_at_diagnosis"] = merged_df["onset_date_time"] - merged_df["birthDate"]
     incorrect_df = merged_df.loc[merged_df['age_at_diagnosis'] < pd.Timedelta(days=15*365.25)]
@@ -880,13 +873,8 @@ def suspiciously_long_survival(pdf, odf, cdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    odf_copy = odf.copy()
-    odf_copy["subject"] = odf_copy["subject"].apply(lambda x: x.split("/")[1])
-    cdf_copy = cdf.copy()
-    cdf_copy["subject"] = cdf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, odf_copy, how="inner", on=["subject"])
-    result = pd.merge(result, cdf_copy, how="inner", on=["subject"])
+    result = pd.merge(pdf, odf, how="inner", on=["subject"])
+    result = pd.merge(result, cdf, how="inner", on=["subject"])
     all = result.shape[0]
 
     result["age_at_diagnosis"] = result["recorded_date"] - result["birthDate"]
@@ -924,10 +912,7 @@ def vital_status_timestamp_missing(pdf, odf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    odf_copy = odf.copy()
-    odf_copy["subject"] = odf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, odf_copy, how="inner", on=["subject"])
+    result = pd.merge(pdf, odf, how="inner", on=["subject"])
     all = result.shape[0]
     result = result[result['deceasedBoolean'].notnull()]
     result = result[result['last_update'].isnull()]
@@ -1011,35 +996,33 @@ def diagnosis_in_future(cdf):
     return fig
 
 
-def match_surgery_location_and_histo_location(row):
+# SNOMED CT code of histological location for every ICD-10 code of surgery location
+HISTOLOGY_LOCATION_CODES = {"C18.0": "32713005",
+                            "C18.1": None,
+                            "C18.2": "9040008",
+                            "C18.3": "48338005",
+                            "C18.4": "485005",
+                            "C18.5": "72592005",
+                            "C18.6": "32622004",
+                            "C18.7": "60184004",
+                            "C18.8": None,
+                            "C18.9": None,
+                            "C19": "49832006",
+                            "C20": "34402009"}
+
+
+def match_surgery_location_and_histo_location(df):
     """
     Check if codes of surgery location and histology location match.
 
     Args:
-        row: Row in data frame.
+        df: Data frame with surgery location code_code and histology location body_site_code.
 
     Returns:
-        Result of match.
-    """
-    surgery_loc = row["code_code"]
-    histology_loc = row["body_site_code"]
-    if histology_loc is None:
-        return False
-    codes = {"C18.0": "32713005",
-             "C18.1": None,
-             "C18.2": "9040008",
-             "C18.3": "48338005",
-             "C18.4": "485005",
-             "C18.5": "72592005",
-             "C18.6": "32622004",
-             "C18.7": "60184004",
-             "C18.8": None,
-             "C18.9": None,
-             "C19": "49832006",
-             "C20": "34402009"}
-    if surgery_loc in codes.keys():
-        return histology_loc == codes.get(surgery_loc)
-    return False
+        Series of results of match aligned with df.
+    """
+    expected = df["code_code"].map(HISTOLOGY_LOCATION_CODES)
+    return expected.notna() & (df["body_site_code"] == expected)
 
 
 # 13
@@ -1056,19 +1039,14 @@ def surgery_and_histological_location_do_not_match_only_one(cdf, sdf):
         Graph of result.
 
     """
-    cdf_copy = cdf.copy()
-    sdf_copy = sdf.copy()
-    result = pd.merge(cdf_copy, sdf_copy, how="right", on=["subject"])
+    result = pd.merge(cdf, sdf, how="right", on=["subject"])
     all = result.shape[0]
     result = result[result['code_code'].notnull()]
     result['count'] = result['subject'].map(result['subject'].value_counts())
     result = result[result['count'] == 1]
 
-    result_result = [None for _ in range(all)]
-    result["result"] = pd.Series(result_result).copy()
     result.reset_index(drop=True, inplace=True)
-    for index, row in result.iterrows():
-        result.loc[index, "result"] = match_surgery_location_and_histo_location(row)
+    result["result"] = match_surgery_location_and_histo_location(result)
 
     failures = all - result.result.sum()
 
@@ -1100,19 +1078,14 @@ def surgery_and_histological_location_do_not_match_multiple(cdf, sdf):
         Graph of result.
 
     """
-    cdf_copy = cdf.copy()
-    sdf_copy = sdf.copy()
-    all = cdf_copy.shape[0]
-    result = pd.merge(cdf_copy, sdf_copy, how="right", on=["subject"])
+    all = cdf.shape[0]
+    result = pd.merge(cdf, sdf, how="right", on=["subject"])
     result['count'] = result['subject'].map(result['subject'].value_counts())
     result = result[result['count'] > 1]
 
     surgery_count = result.shape[0]
-    result_result = [None for _ in range(surgery_count)]
-    result["result"] = pd.Series(result_result).copy()
     result.reset_index(drop=True, inplace=True)
-    for index, row in result.iterrows():
-        result.loc[index, "result"] = match_surgery_location_and_histo_location(row)
+    result["result"] = match_surgery_location_and_histo_location(result)
 
     failures = surgery_count - result.result.sum()
 
@@ -1130,92 +1103,82 @@ def surgery_and_histological_location_do_not_match_multiple(cdf, sdf):
     return fig
 
 
-def get_valid_surgeries(row):
-    """
-    Maps body site on right surgery
-
-    Args:
-        row: Row in data frame.
-
-    Returns:
-        Check if surgery and body site are matching.
-    """
-    surgery_type = row["surgery_display"]
-    surgery_loc = row["body_site_display"]
+# valid and suspicious types of surgery for every body site, other types are invalid
+SURGERY_TYPES = {
     # C18.0 + (missing C18.1) + C18.2
-    if surgery_loc == "Cecum structure" or surgery_loc == "Ascending colon structure":
-        if surgery_type == "Right hemicolectomy":
-            return "Valid"
-        elif surgery_type == "Pan-procto colectomy" or surgery_type == "Total colectomy":
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Cecum structure": {"Right hemicolectomy": "Valid",
+                        "Pan-procto colectomy": "Suspicious",
+                        "Total colectomy": "Suspicious"},
+    "Ascending colon structure": {"Right hemicolectomy": "Valid",
+                                  "Pan-procto colectomy": "Suspicious",
+                                  "Total colectomy": "Suspicious"},
     # C18.3
-    if surgery_loc == "Structure of right colic flexur":
-        if surgery_type == "Right hemicolectomy":
-            return "Valid"
-        elif surgery_type == "Pan-procto colectomy" or surgery_type == "Total colectomy" or surgery_type == "Transverse colectomy":
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Structure of right colic flexur": {"Right hemicolectomy": "Valid",
+                                        "Pan-procto colectomy": "Suspicious",
+                                        "Total colectomy": "Suspicious",
+                                        "Transverse colectomy": "Suspicious"},
     # C18.4
-    if surgery_loc == "Transverse colon structure":
-        if surgery_type == "Right hemicolectomy":
-            return "Valid"
-        elif surgery_type == "Pan-procto colectomy" or surgery_type == "Left hemicolectomy with anastomosis" or surgery_type == "Right hemicolectomy":
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Transverse colon structure": {"Right hemicolectomy": "Valid",
+                                   "Pan-procto colectomy": "Suspicious",
+                                   "Left hemicolectomy with anastomosis": "Suspicious"},
     # C18.5
-    if surgery_loc == "Structure of left colic flexure":
-        if surgery_type == "Left hemicolectomy with anastomosis":
-            return "Valid"
-        elif (surgery_type == "Abdominoperineal resection of rectum" or surgery_type == "Pan-procto colectomy"
-              or surgery_type == "Total colectomy" or surgery_type == "Sigmoid colectomy"
-              or surgery_type == "Transverse colectomy"):
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Structure of left colic flexure": {"Left hemicolectomy with anastomosis": "Valid",
+                                        "Abdominoperineal resection of rectum": "Suspicious",
+                                        "Pan-procto colectomy": "Suspicious",
+                                        "Total colectomy": "Suspicious",
+                                        "Sigmoid colectomy": "Suspicious",
+                                        "Transverse colectomy": "Suspicious"},
     # C18.6
-    if surgery_loc == "Descending colon structure":
-        if surgery_type == "Left hemicolectomy with anastomosis":
-            return "Valid"
-        elif (surgery_type == "Abdominoperineal resection of rectum" or surgery_type == "Pan-procto colectomy"
-              or surgery_type == "Total colectomy" or surgery_type == "Sigmoid colectomy"):
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Descending colon structure": {"Left hemicolectomy with anastomosis": "Valid",
+                                   "Abdominoperineal resection of rectum": "Suspicious",
+                                   "Pan-procto colectomy": "Suspicious",
+                                   "Total colectomy": "Suspicious",
+                                   "Sigmoid colectomy": "Suspicious"},
     # C18.7
-    if surgery_loc == "Sigmoid colon structure":
-        if surgery_type == "Sigmoid colectomy":
-            return "Valid"
-        elif (surgery_type == "Abdominoperineal resection of rectum" or surgery_type == "Pan-procto colectomy"
-              or surgery_type == "Total colectomy" or surgery_type == "Low anteroir colon resection"):
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Sigmoid colon structure": {"Sigmoid colectomy": "Valid",
+                                "Abdominoperineal resection of rectum": "Suspicious",
+                                "Pan-procto colectomy": "Suspicious",
+                                "Total colectomy": "Suspicious",
+                                "Low anteroir colon resection": "Suspicious"},
     # C18.8 + C18.9 are missing
     # C19 (C19.9 is missing)
-    if surgery_loc == "Structure of rectosigmoid junction":
-        if (surgery_type == "Anterior resection of rectum" or surgery_type == "Endo-rectal tumor resection"
-            or surgery_type == "Low anteroir colon resection" or surgery_type == "Sigmoid colectomy"):
-            return "Valid"
-        elif (surgery_type == "Abdominoperineal resection of rectum" or surgery_type == "Pan-procto colectomy"
-              or surgery_type == "Total colectomy" or surgery_type == "Left hemicolectomy with anastomosis"):
-            return "Suspicious"
-        else:
-            return "Invalid"
+    "Structure of rectosigmoid junction": {"Anterior resection of rectum": "Valid",
+                                           "Endo-rectal tumor resection": "Valid",
+                                           "Low anteroir colon resection": "Valid",
+                                           "Sigmoid colectomy": "Valid",
+                                           "Abdominoperineal resection of rectum": "Suspicious",
+                                           "Pan-procto colectomy": "Suspicious",
+                                           "Total colectomy": "Suspicious",
+                                           "Left hemicolectomy with anastomosis": "Suspicious"},
     # C20 (C20.9 is missing)
-    if surgery_loc == "Rectum structure":
-        if (surgery_type == "Anterior resection of rectum" or surgery_type == "Endo-rectal tumor resection"
-            or surgery_type == "Low anteroir colon resection" or surgery_type == "Abdominoperineal resection of rectum"):
-            return "Valid"
-        elif (surgery_type == "Left hemicolectomy with anastomosis" or surgery_type == "Pan-procto colectomy"
-              or surgery_type == "Total colectomy"):
-            return "Suspicious"
-        else:
-            return "Invalid"
-    return "Invalid"
+    "Rectum structure": {"Anterior resection of rectum": "Valid",
+                         "Endo-rectal tumor resection": "Valid",
+                         "Low anteroir colon resection": "Valid",
+                         "Abdominoperineal resection of rectum": "Valid",
+                         "Left hemicolectomy with anastomosis": "Suspicious",
+                         "Pan-procto colectomy": "Suspicious",
+                         "Total colectomy": "Suspicious"},
+}
+
+SURGERY_TYPES_TABLE = pd.DataFrame([(body_site, surgery_type, check)
+                                    for body_site, surgery_types in SURGERY_TYPES.items()
+                                    for surgery_type, check in surgery_types.items()],
+                                   columns=["body_site_display", "surgery_display", "surgery_check"])
+
+
+def get_valid_surgeries(df):
+    """
+    Maps body site on right surgery
+
+    Args:
+        df: Surgery data frame.
+
+    Returns:
+        Series of checks if surgery and body site are matching aligned with df.
+    """
+    columns = ["body_site_display", "surgery_display"]
+    checks = df[columns].astype(object).merge(SURGERY_TYPES_TABLE, how="left", on=columns)["surgery_check"]
+    return pd.Series(checks.fillna("Invalid").values, index=df.index, dtype=object)
 
 
 # 15
@@ -1234,11 +1197,8 @@ def mismatch_between_surgery_location_and_surgery_type(sdf):
     result = sdf.copy()
     all = result.shape[0]
 
-    result_result = ["Invalid" for _ in range(all)]
-    result["surgery_check"] = pd.Series(result_result).copy()
     result.reset_index(drop=True, inplace=True)
-    for index, row in result.iterrows():
-        result.loc[index, "surgery_check"] = get_valid_surgeries(row)
+    result["surgery_check"] = get_valid_surgeries(result)
 
     result = result[result['surgery_check'] != "Valid"]
 
@@ -1303,11 +1263,8 @@ def count_adjusted_overall_survival(time_df, procedure_df, condition_df):
         Dataframe with adjusted overall survival.
 
     """
-    time_df_copy = time_df.copy()
-    procedure_df_copy = procedure_df.copy()
-    condition_df_copy = condition_df.copy()
-    result = pd.merge(time_df_copy, condition_df_copy, how="inner", on=["subject"])
-    result = pd.merge(result, procedure_df_copy, how="right", on=["subject"])
+    result = pd.merge(time_df, condition_df, how="inner", on=["subject"])
+    result = pd.merge(result, procedure_df, how="right", on=["subject"])
 
     result = result.sort_values(by=['subject', 'start'], ascending=[True, True])
     result = result.groupby('subject').first().reset_index()
@@ -1336,15 +1293,12 @@ def event_starts_or_ends_after_survival_of_patient_procedure(patient_df, procedu
         Graph of result.
 
     """
-    patient_df_copy = patient_df.copy()
-    time_df_copy = time_df.copy()
-    procedure_df_copy = procedure_df.copy()
-    all = procedure_df_copy.shape[0]
-    result = count_adjusted_overall_survival(time_df_copy, procedure_df_copy, condition_df)
+    all = procedure_df.shape[0]
+    result = count_adjusted_overall_survival(time_df, procedure_df, condition_df)
     result['end'] = pd.to_datetime(result['end'])
     result['recorded_date'] = pd.to_datetime(result['recorded_date'])
     result["end_weeks"] = ((result['end'] - result["recorded_date"]).dt.days) / 7
-    result = pd.merge(patient_df_copy, result, how="right", on=["subject"])
+    result = pd.merge(patient_df, result, how="right", on=["subject"])
 
     result["check"] = ((result["start_weeks"] > result["adjusted_overall_survival"])
                        | (result["end_weeks"] > (result["adjusted_overall_survival"] + 1)))
@@ -1382,13 +1336,10 @@ def event_starts_or_ends_after_survival_of_patient(patient_df, df, time_df, cond
         Graph of result.
 
     """
-    patient_df_copy = patient_df.copy()
-    time_df_copy = time_df.copy()
-    df_copy = df.copy()
-    df_copy.rename(columns={'date': 'start'}, inplace=True)
+    df_copy = df.rename(columns={'date': 'start'})
     all = df_copy.shape[0]
-    result = count_adjusted_overall_survival(time_df_copy, df_copy, condition_df)
-    result = pd.merge(patient_df_copy, result, how="right", on=["subject"])
+    result = count_adjusted_overall_survival(time_df, df_copy, condition_df)
+    result = pd.merge(patient_df, result, how="right", on=["subject"])
 
     result["check"] = result["start_weeks"] > result["adjusted_overall_survival"]
 
@@ -1423,9 +1374,7 @@ def start_of_response_to_therapy_is_before_diagnosis(odf, cdf):
         Graph of result.
 
     """
-    odf_copy = odf.copy()
-    cdf_copy = cdf.copy()
-    result = pd.merge(cdf_copy, odf_copy, how="right", on=["subject"])
+    result = pd.merge(cdf, odf, how="right", on=["subject"])
     all = result.shape[0]
 
     result = result[result['date'].notnull()]
@@ -1461,10 +1410,7 @@ def patient_died_but_last_response_is_complete(pdf, odf):
         Graph of result.
 
     """
-    odf_copy = odf.copy()
-    pdf_copy = pdf.copy()
-    odf_copy["subject"] = odf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, odf_copy, how="right", on=["subject"])
+    result = pd.merge(pdf, odf, how="right", on=["subject"])
     all = result.shape[0]
 
     result['date'] = pd.to_datetime(result['date'])
@@ -1539,9 +1485,7 @@ def start_of_therapy_is_before_diagnosis(pdf, cdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    cdf_copy = cdf.copy()
-    result = pd.merge(cdf_copy, pdf_copy, how="right", on=["subject"])
+    result = pd.merge(cdf, pdf, how="right", on=["subject"])
     all = result.shape[0]
 
     result = result[result['start'].notnull()]
@@ -1578,9 +1522,7 @@ def start_of_treatment_is_in_the_future(pdf, cdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    cdf_copy = cdf.copy()
-    result = pd.merge(cdf_copy, pdf_copy, how="right", on=["subject"])
+    result = pd.merge(cdf, pdf, how="right", on=["subject"])
     all = result.shape[0]
 
     result = result[result['start'].notnull()]
@@ -1676,105 +1618,113 @@ def non_surgery_therapy_starts_and_ends_in_week_0_since_initial_diagnosis(pdf, c
     return fig
 
 
-def get_stage(row):
+# UICC versions of TNM classification by code of Observation method
+UICC_VERSIONS = {"444256004": "6th",
+                 "443830009": "7th"}
+
+N1_CODES = ["N1", "N1a", "N1b", "N1c"]
+N2_CODES = ["N2", "N2a", "N2b"]
+
+# rules of cancer staging: UICC version, T codes, N codes, M codes and stage,
+# None matches any code, the first rule for a combination of codes is used
+UICC_STAGE_RULES = [
+    ("6th", None, None, ["M1"], "IV"),
+    ("6th", None, None, ["MX"], None),
+    ("6th", ["Tis"], ["N0"], ["M0"], "0"),
+    ("6th", ["T1", "T2"], ["N0"], ["M0"], "I"),
+    ("6th", ["T3"], ["N0"], ["M0"], "IIA"),
+    ("6th", ["T4"], ["N0"], ["M0"], "IIB"),
+    ("6th", ["T1", "T2"], ["N1"], ["M0"], "IIIA"),
+    ("6th", ["T3", "T4"], ["N1"], ["M0"], "IIIB"),
+    ("6th", None, ["N2"], ["M0"], "IIIC"),
+
+    ("7th", None, None, ["M1"], "IV"),
+    ("7th", None, None, ["M1a"], "IVA"),
+    ("7th", None, None, ["M1b"], "IVB"),
+    ("7th", ["Tis"], ["N0"], ["M0"], "0"),
+    ("7th", ["T1", "T2"], ["N0"], ["M0"], "I"),
+    ("7th", ["T3"], ["N0"], ["M0"], "IIA"),
+    ("7th", ["T4a"], ["N0"], ["M0"], "IIB"),
+    ("7th", ["T4b"], ["N0"], ["M0"], "IIC"),
+    ("7th", ["T4"], ["N0"], ["M0"], "II"),
+    ("7th", ["T1", "T2"], N1_CODES, ["M0"], "IIIA"),
+    ("7th", ["T1"], ["N2a"], ["M0"], "IIIA"),
+    ("7th", ["T3", "T4a"], N1_CODES, ["M0"], "IIIB"),
+    ("7th", ["T2", "T3"], ["N2a"], ["M0"], "IIIB"),
+    ("7th", ["T1", "T2"], ["N2b"], ["M0"], "IIIB"),
+    ("7th", ["T4a"], ["N2a"], ["M0"], "IIIC"),
+    ("7th", ["T3", "T4a"], ["N2b"], ["M0"], "IIIC"),
+    ("7th", ["T4b"], N1_CODES + N2_CODES, ["M0"], "IIIC"),
+    ("7th", None, N1_CODES + N2_CODES, ["M0"], "III"),
+]
+
+
+def create_stage_table(rules):
+    """
+    Create lookup table of cancer stages from rules of staging.
+
+    Args:
+        rules: List of rules like UICC_STAGE_RULES.
+
+    Returns:
+        Dictionary of stages by UICC version, T code, N code and M code, None matches any code.
+
+    """
+    table = {}
+    for uicc_version, t_codes, n_codes, m_codes, stage in rules:
+        for t_code in t_codes or [None]:
+            for n_code in n_codes or [None]:
+                for m_code in m_codes or [None]:
+                    table.setdefault((uicc_version, t_code, n_code, m_code), stage)
+    return table
+
+
+UICC_STAGES = create_stage_table(UICC_STAGE_RULES)
+
+
+def get_stage(method_coding_code, t_coding_code, n_coding_code, m_coding_code):
     """
     Calculate cancer stage from TNM information and UICC version.
+    The most specific entry of UICC_STAGES is used.
 
     Args:
-        row: Row from data frame.
+        method_coding_code: Code of UICC version.
+        t_coding_code: T code.
+        n_coding_code: N code.
+        m_coding_code: M code.
 
     Returns:
         Calculated cancer stage.
 
     """
-    method_coding_code = row["method_coding_code"]
-    t_coding_code = row["t_coding_code"]
-    n_coding_code = row["n_coding_code"]
-    m_coding_code = row["m_coding_code"]
-
-    if method_coding_code == "444256004":
-        uicc_version = "6th"
-    elif method_coding_code == "443830009":
-        uicc_version = "7th"
-    else:
-        uicc_version = None
-
-    if uicc_version == "6th":
-        if m_coding_code == "M1":
-            return "IV"
-        elif m_coding_code == "MX":
-            return None
-        elif m_coding_code == "M0":
-            if t_coding_code == "Tis" and n_coding_code == "N0":
-                return "0"
-            elif (t_coding_code == "T1" or t_coding_code == "T2") and n_coding_code == "N0":
-                return "I"
-            elif t_coding_code == "T3" and n_coding_code == "N0":
-                return "IIA"
-            elif t_coding_code == "T4" and n_coding_code == "N0":
-                return "IIB"
-            elif (t_coding_code == "T1" or t_coding_code == "T2") and n_coding_code == "N1":
-                return "IIIA"
-            elif (t_coding_code == "T3" or t_coding_code == "T4") and n_coding_code == "N1":
-                return "IIIB"
-            elif n_coding_code == "N2":
-                return "IIIC"
-            else:
-                return None
-        else:
-            return None
-    elif uicc_version == "7th":
-        if m_coding_code == "M1":
-            return "IV"
-        elif m_coding_code == "M1a":
-            return "IVA"
-        elif m_coding_code == "M1b":
-            return "IVB"
-        elif m_coding_code == "M0":
-            if t_coding_code == "Tis" and n_coding_code == "N0":
-                return "0"
-            elif (t_coding_code == "T1" or t_coding_code == "T2") and n_coding_code == "N0":
-                return "I"
-            elif t_coding_code == "T3" and n_coding_code == "N0":
-                return "IIA"
-            elif t_coding_code == "T4a" and n_coding_code == "N0":
-                return "IIB"
-            elif t_coding_code == "T4b" and n_coding_code == "N0":
-                return "IIC"
-            elif t_coding_code == "T4" and n_coding_code == "N0":
-                return "II"
-            elif (t_coding_code == "T1" or t_coding_code == "T2") and (n_coding_code == "N1"
-            or n_coding_code == "N1a" or n_coding_code == "N1b" or n_coding_code == "N1c"):
-                return "IIIA"
-            elif t_coding_code == "T1" and n_coding_code == "N2a":
-                return "IIIA"
-            elif (t_coding_code == "T3" or t_coding_code == "T4a") and (n_coding_code == "N1"
-            or n_coding_code == "N1a" or n_coding_code == "N1b" or n_coding_code == "N1c"):
-                return "IIIB"
-            elif (t_coding_code == "T2" or t_coding_code == "T3") and n_coding_code == "N2a":
-                return "IIIB"
-            elif (t_coding_code == "T2" or t_coding_code == "T1") and n_coding_code == "N2b":
-                return "IIIB"
-            elif t_coding_code == "T4a" and n_coding_code == "N2a":
-                return "IIIC"
-            elif (t_coding_code == "T3" or t_coding_code == "T4a") and n_coding_code == "N2b":
-                return "IIIC"
-            elif t_coding_code == "T4b" and (n_coding_code == "N1" or n_coding_code == "N1a"
-                                            or n_coding_code == "N1b" or n_coding_code == "N1c"
-                                            or n_coding_code == "N2" or n_coding_code == "N2a"
-                                            or n_coding_code == "N2b"):
-                return "IIIC"
-            elif (n_coding_code == "N1" or n_coding_code == "N1a" or n_coding_code == "N1b"
-                  or n_coding_code == "N1c" or n_coding_code == "N2" or n_coding_code == "N2a"
-                  or n_coding_code == "N2b"):
-                return "III"
-            else:
-                return None
-        else:
-            return None
+    uicc_version = UICC_VERSIONS.get(method_coding_code)
+    for key in ((t_coding_code, n_coding_code, m_coding_code),
+                (None, n_coding_code, m_coding_code),
+                (t_coding_code, None, m_coding_code),
+                (None, None, m_coding_code)):
+        if (uicc_version,) + key in UICC_STAGES:
+            return UICC_STAGES[(uicc_version,) + key]
     return None
 
 
+def compute_stages(odf):
+    """
+    Calculate cancer stages of all rows, every combination of codes is calculated only once.
+
+    Args:
+        odf: TNM Observation data frame.
+
+    Returns:
+        Series of calculated cancer stages aligned with odf.
+
+    """
+    columns = ["method_coding_code", "t_coding_code", "n_coding_code", "m_coding_code"]
+    combinations = odf[columns].drop_duplicates()
+    combinations["uicc_stage_computed"] = [get_stage(*codes) for codes in combinations.itertuples(index=False)]
+    stages = odf[columns].merge(combinations, how="left", on=columns)["uicc_stage_computed"]
+    return pd.Series(stages.values, index=odf.index, dtype=object)
+
+
 # 26
 def mismatch_between_provided_and_computed_stage_value(odf):
     """
@@ -1795,11 +1745,8 @@ def mismatch_between_provided_and_computed_stage_value(odf):
     result = result[result['n_coding_code'].notnull()]
     result = result[result['m_coding_code'].notnull()]
 
-    result_result = [None for _ in range(all)]
-    result["uicc_stage_computed"] = pd.Series(result_result).copy()
     result.reset_index(drop=True, inplace=True)
-    for index, row in result.iterrows():
-        result.loc[index, "uicc_stage_computed"] = get_stage(row)
+    result["uicc_stage_computed"] = compute_stages(result)
 
     result = result[result['uicc_stage_computed'].notnull()]
 
@@ -1845,11 +1792,8 @@ def sus_tnm_combo_for_uicc_version_or_uncomputable_stage(odf):
     result = result[result['n_coding_code'] != "NX"]
     result = result[((result['method_coding_code'] == "444256004") | (result["method_coding_code"] == "443830009"))]
 
-    result_result = [None for _ in range(all)]
-    result["uicc_stage_computed"] = pd.Series(result_result).copy()
     result.reset_index(drop=True, inplace=True)
-    for index, row in result.iterrows():
-        result.loc[index, "uicc_stage_computed"] = get_stage(row)
+    result["uicc_stage_computed"] = compute_stages(result)
 
     result = result[result['uicc_stage_computed'].isna()]
 
@@ -1926,10 +1870,7 @@ def create_plot_without_preservation_mode(pdf, sdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    sdf_copy = sdf.copy()
-    sdf_copy["subject"] = sdf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, sdf_copy, how="inner", on=["subject"])
+    result = pd.merge(pdf, sdf, how="inner", on=["subject"])
     all = result.shape[0]
     result = result[(result['type_display'].isnull() | result['type_code'].isnull())]
 
@@ -1963,10 +1904,7 @@ def create_plots_without_response_to_therapy(pdf, rdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    rdf_copy = rdf.copy()
-    rdf_copy["subject"] = rdf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, rdf_copy, how="inner", on=["subject"])
+    result = pd.merge(pdf, rdf, how="inner", on=["subject"])
     all = result.shape[0]
 
     result = result[(result['date'].isnull()) | result['code'].isnull() | result['display'].isnull()]
@@ -2004,10 +1942,7 @@ def get_patients_with_preservation_mode_but_without_ffpe(pdf, sdf):
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
-    sdf_copy = sdf.copy()
-    sdf_copy["subject"] = sdf_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, sdf_copy, how="inner", on=["subject"])
+    result = pd.merge(pdf, sdf, how="inner", on=["subject"])
     all = result.shape[0]
     result = result[result['type_display'].notnull()]
 
@@ -2049,20 +1984,14 @@ def treatment_after_complete_response_without_recurrence_diagnosis(pdf, response
         Graph of result.
 
     """
-    pdf_copy = pdf.copy()
     all = response_df.shape[0]
-    recurrence_df_copy = recurrence_df.copy()
-    condition_df_copy = condition_df.copy()
-    response_df_copy = response_df.copy()
 
     # create recurrence date
-    recurrence_df_copy = pd.merge(recurrence_df_copy, condition_df_copy, how="inner", on=["subject"])
-    recurrence_df_copy["date_recurrence"] = recurrence_df_copy["recorded_date"] + pd.to_timedelta(recurrence_df_copy["recurrence"]*7,unit='D')
+    recurrence_dates = pd.merge(recurrence_df, condition_df, how="inner", on=["subject"])
+    recurrence_dates["date_recurrence"] = recurrence_dates["recorded_date"] + pd.to_timedelta(recurrence_dates["recurrence"]*7,unit='D')
 
-    response_df_copy["subject"] = response_df_copy["subject"].apply(lambda x: x.split("/")[1])
-    recurrence_df_copy["subject"] = recurrence_df_copy["subject"].apply(lambda x: x.split("/")[1])
-    result = pd.merge(pdf_copy, recurrence_df_copy, how="left", on=["subject"])
-    result = pd.merge(result, response_df_copy, how="left", on=["subject"])
+    result = pd.merge(pdf, recurrence_dates, how="left", on=["subject"])
+    result = pd.merge(result, response_df, how="left", on=["subject"])
     result = result[result['date'].notnull()]
 
     # group by "subject" then sort by response "date" within group
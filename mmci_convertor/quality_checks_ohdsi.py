@@ -1,64 +1,148 @@
 from _datetime import datetime
+import io
+import threading
 import pandas as pd
 import plotly.express as px
 
+# columns of OMOP CDM tables used by the loader and the quality checks, tables are in the order of loading
+OMOP_COLUMNS = {"person": ["person_id", "gender_concept_id", "year_of_birth", "race_concept_id",
+                           "ethnicity_concept_id", "person_source_value", "gender_source_value"],
+                "observation_period": ["observation_period_id", "person_id", "observation_period_start_date",
+                                       "observation_period_end_date", "period_type_concept_id"],
+                "condition_occurrence": ["condition_occurrence_id", "person_id", "condition_concept_id",
+                                         "condition_start_date", "condition_type_concept_id",
+                                         "condition_source_value"],
+                "specimen": ["specimen_id", "person_id", "specimen_concept_id", "specimen_type_concept_id",
+                             "specimen_date", "specimen_source_id", "specimen_source_value"],
+                "drug_exposure": ["drug_exposure_id", "person_id", "drug_concept_id", "drug_exposure_start_date",
+                                  "drug_exposure_start_datetime", "drug_exposure_end_date",
+                                  "drug_exposure_end_datetime", "drug_type_concept_id", "drug_source_value"],
+                "procedure_occurrence": ["procedure_occurrence_id", "person_id", "procedure_type_concept_id",
+                                         "procedure_concept_id", "procedure_date", "procedure_source_value"]}
+
+# quality checks run in threads sharing one connection to database, COPY must not be interleaved with other queries
+QUERY_LOCK = threading.Lock()
+
+
+def batch_condition(table_name, batch):
+    """
+    SQL condition selecting rows of OMOP CDM table inserted by one load.
+
+    :param table_name: Processed table.
+    :param batch: Dictionary with the range of IDs reserved by one load for every table, None for all rows.
+    :return:
+        Condition and list of its parameters.
+    """
+    if batch is None:
+        return "TRUE", []
+    first_id, end_id = batch[table_name]
+    return table_name + "_id >= %s AND " + table_name + "_id < %s", [first_id, end_id]
+
+
+def column_types(table_name):
+    """
+    Types of columns of OMOP CDM table in data frames.
+    IDs and concepts are nullable integers, dates are datetime64 and source values are text.
 
-def create_df_omop(con, table_name, schema):
+    :param table_name: Processed table.
+    :return:
+        Dictionary of types of columns which are not dates and list of date columns.
+    """
+    types = {}
+    dates = []
+    for column in OMOP_COLUMNS[table_name]:
+        if column.endswith("_date") or column.endswith("_datetime"):
+            dates.append(column)
+        elif column.endswith("_source_value") or column == "specimen_source_id":
+            types[column] = "object"
+        else:
+            types[column] = "Int64"
+    return types, dates
+
+
+def read_table(con, table_name, command, parameters=None):
+    """
+    Read rows of OMOP CDM table selected by SELECT command.
+    Rows are transferred by COPY in CSV format and parsed straight into typed columns,
+    so no Python object is created for every value. Integer columns are parsed as numbers first
+    and converted to nullable integers afterwards, it is much faster than parsing them as nullable integers.
+
+    :param con: Connection to database.
+    :param table_name: Processed table.
+    :param command: SELECT command returning the columns of the table from OMOP_COLUMNS.
+    :param parameters: Parameters of the command.
+    :return:
+        Data frame with columns of the table from OMOP_COLUMNS typed by column_types.
+    """
+    buffer = io.StringIO()
+    with QUERY_LOCK, con.cursor() as cursor:
+        query = cursor.mogrify(command, parameters).decode()
+        cursor.copy_expert("COPY (" + query + ") TO STDOUT WITH (FORMAT csv, HEADER true, NULL '\\N')", buffer)
+    buffer.seek(0)
+    types, dates = column_types(table_name)
+    texts = {column: kind for column, kind in types.items() if kind == "object"}
+    df = pd.read_csv(buffer, dtype=texts, parse_dates=dates, na_values=["\\N"], keep_default_na=False)
+    return df.astype(types)
+
+
+def create_df_omop(con, table_name, schema, batch=None):
     """
     Universal function for creation of data frames from OMOP CDM tables.
+    Only columns from OMOP_COLUMNS are read.
 
     :param con: Connection to database.
     :param table_name: Processed table.
     :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, only rows of this load are read. All rows by default.
     :return:
         Data frame from OMOP CDM table.
     """
-    table = schema + "." + table_name
-    sql_query = pd.read_sql_query("SELECT * FROM " + table, con)
-    if table_name == "person":
-        return pd.DataFrame(sql_query, columns=["person_id", "gender_concept_id", "year_of_birth",
-                                                "race_concept_id", "ethnicity_concept_id",
-                                                "person_source_value", "gender_source_value"])
-    if table_name == "observation_period":
-        return pd.DataFrame(sql_query, columns=["observation_period_id", "person_id",
-                                                "observation_period_start_date", "observation_period_end_date",
-                                                "period_type_concept_id"])
-    if table_name == "condition_occurrence":
-        return pd.DataFrame(sql_query, columns=["condition_occurrence_id", "person_id",
-                                                "condition_concept_id", "condition_start_date",
-                                                "condition_type_concept_id", "condition_source_value"])
-    if table_name == "specimen":
-        return pd.DataFrame(sql_query, columns=["specimen_id", "person_id", "specimen_concept_id",
-                                                "specimen_type_concept_id", "specimen_date",
-                                                "specimen_source_id", "specimen_source_value"])
-    if table_name == "drug_exposure":
-        return pd.DataFrame(sql_query, columns=["drug_exposure_id", "person_id", "drug_concept_id",
-                               "drug_exposure_start_date", "drug_exposure_start_datetime",
-                               "drug_exposure_end_date", "drug_exposure_end_datetime",
-                               "drug_type_concept_id", "drug_source_value"])
-    if table_name == "procedure_occurrence":
-        return pd.DataFrame(sql_query, columns=["procedure_occurrence_id", "person_id",
-                                                "procedure_type_concept_id", "procedure_concept_id", "procedure_date",
-                                                "procedure_source_value"])
-    return None
-
-
-def completeness(df):
+    if table_name not in OMOP_COLUMNS:
+        return None
+    condition, parameters = batch_condition(table_name, batch)
+    command = "SELECT " + ", ".join(OMOP_COLUMNS[table_name]) + " FROM " + schema + "." + table_name + \
+              " WHERE " + condition
+    return read_table(con, table_name, command, parameters)
+
+
+def merge_by_person(left, right):
     """
-    Data quality check for completeness.
+    Left join of two data frames by person, shared by quality checks so every join is done once.
+    Checks must not modify the joined data frame.
 
-    :param df: Input data frame
+    :param left: Data frame, all its rows are kept.
+    :param right: Data frame joined to left.
     :return:
-        Graph of completeness.
+        Joined data frame.
     """
-    name = df.columns[0][:-3]
-    missing_values = pd.isnull(df).sum()
-    fig = px.bar(missing_values)
-    fig.update_layout(xaxis_title='count of missing values', yaxis_title='attribute', title="Missing values",
-                      showlegend=False)
-    df.to_csv("reports/omop/completeness" + name + ".csv", index=False)
-    fig.update_layout(title="Completeness" + name)
-    return fig
+    return pd.merge(left, right, how="left", on="person_id")
+
+
+# procedure_source_value of diagnostic imaging and of procedures which are not surgeries
+IMAGING_PROCEDURES = ["liver imaging", "lung imaging", "colonoscopy", "MRI", "CT"]
+NON_SURGERY_PROCEDURES = IMAGING_PROCEDURES + ["Targeted therapy", "Radiation therapy"]
+
+
+def person_features(pdf, prdf):
+    """
+    Wide data frame of persons with counts of their procedures, built by one groupby,
+    so quality checks of persons only reduce its columns instead of merging filtered procedures.
+    Procedures which are not in NON_SURGERY_PROCEDURES are counted as surgeries.
+
+    :param pdf: Person data frame.
+    :param prdf: Procedure Occurrence data frame.
+    :return:
+        Data frame with person_id and counts of procedures in columns named by NON_SURGERY_PROCEDURES and surgery,
+        rows are in the order of pdf.
+    """
+    kind = prdf["procedure_source_value"].where(prdf["procedure_source_value"].isin(NON_SURGERY_PROCEDURES),
+                                                "surgery")
+    counts = prdf.groupby([prdf["person_id"], kind]).size().unstack(fill_value=0)
+    counts = counts.reindex(index=pdf["person_id"], columns=NON_SURGERY_PROCEDURES + ["surgery"], fill_value=0)
+    return counts.astype(int).rename_axis(columns=None).reset_index()
+
+
+# completeness, warnings # 7, # 8, # 16 and report # 35 are evaluated by the database in quality_checks_ohdsi_sql.py
 
 
 def uniqueness(df):
@@ -93,17 +177,16 @@ def uniqueness(df):
 # original checks:
 # warnings
 # 1
-def observation_end_precedes_condition_start(cdf, odf):
+def observation_end_precedes_condition_start(codf):
     """
     Warning # 1
     Original warning type: "Vital check date precedes initial diagnosis date"
 
-    :param cdf: Condition Occurrence data frame.
-    :param odf: Observation Period data frame.
+    :param codf: Condition Occurrence data frame merged with Observation Period data frame.
     :return:
         Graph of result.
     """
-    merged_df = pd.merge(cdf, odf, how="left", on="person_id")
+    merged_df = codf
     count_of_rows = merged_df.shape[0]
     merged_df = merged_df.dropna()
 
@@ -127,17 +210,16 @@ def observation_end_precedes_condition_start(cdf, odf):
 
 
 # 2
-def observation_end_equals_condition_start(cdf, odf):
+def observation_end_equals_condition_start(codf):
     """
     Warning # 2
     Original warning type: "Vital check date is equal to initial diagnosis date"
 
-    :param cdf: Condition Occurrence data frame.
-    :param odf: Observation Period data frame.
+    :param codf: Condition Occurrence data frame merged with Observation Period data frame.
     :return:
         Graph of result.
     """
-    merged_df = pd.merge(cdf, odf, how="left", on="person_id")
+    merged_df = codf
     count_of_rows = merged_df.shape[0]
     merged_df = merged_df.dropna()
 
@@ -160,17 +242,16 @@ def observation_end_equals_condition_start(cdf, odf):
 
 
 # 4
-def too_young_person(pdf, cdf):
+def too_young_person(pcdf):
     """
     Warning # 4
     Original warning type: "Suspiciously young patient"
 
-    :param pdf: Person data frame.
-    :param cdf: Condition Occurrence data frame.
+    :param pcdf: Person data frame merged with Condition Occurrence data frame.
     :return:
         Graph of result.
     """
-    merged_df = pd.merge(pdf, cdf, how="left", on="person_id")
+    merged_df = pcdf.copy()
     count_of_rows = merged_df.shape[0]
     merged_df.dropna()
 
@@ -191,67 +272,6 @@ def too_young_person(pdf, cdf):
     return fig
 
 
-# 7
-def observation_end_in_the_future(odf):
-    """
-    Warning # 7
-    Original warning type: "Vital status timestamp is in the future"
-
-    :param odf: Observation Period data frame.
-    :return:
-        Graph of result.
-    """
-    odf_copy = odf.copy()
-    count_of_rows = odf_copy.shape[0]
-    odf_copy.dropna()
-    odf_copy["missing_timestamp"] = odf_copy['observation_period_end_date'].isnull()
-    current_time = datetime.now().date()
-    odf_copy["date_in_future"] = odf_copy["observation_period_end_date"] > current_time
-    incorrect_count = odf_copy["date_in_future"].sum()
-
-    filter_odf_copy = odf_copy[odf_copy['date_in_future'] == True]
-    filter_odf_copy.to_csv('reports/omop/observation_end_in_the_future.csv', index=False)
-
-    result = {
-        "Records": ["Number of records", "observation_end_in_the_future"],
-        "Count": [count_of_rows, incorrect_count]
-    }
-    dff = pd.DataFrame(result)
-    fig = px.bar(dff, x='Records', y='Count')
-    fig.update_layout(title="Warning # 7: Vital status timestamp is in the future")
-    return fig
-
-
-# 8
-def condition_start_in_the_future(cdf):
-    """
-    Warning # 8
-    Original warning type: "Initial diagnosis date is in the future"
-
-    :param cdf: Condition Occurrence data frame.
-    :return:
-        Graph of result.
-    """
-    cdf_copy = cdf.copy()
-    count_of_rows = cdf_copy.shape[0]
-    now = datetime.now().date()
-    cdf_copy.dropna()
-    cdf_copy["date_in_future"] = cdf_copy["condition_start_date"] > now
-    incorrect_count = cdf_copy["date_in_future"].sum()
-
-    filter_cdf_copy = cdf_copy[cdf_copy['date_in_future'] == True]
-    filter_cdf_copy.to_csv('reports/omop/condition_start_in_the_future.csv', index=False)
-
-    result = {
-        "Records": ["Number of records", "condition_start_in_the_future"],
-        "Count": [count_of_rows, incorrect_count]
-    }
-    dff = pd.DataFrame(result)
-    fig = px.bar(dff, x='Records', y='Count')
-    fig.update_layout(title="Warning # 8: Initial diagnosis date is in the future")
-    return fig
-
-
 # 9
 def missing_drug_exposure_info(ddf):
     """
@@ -342,49 +362,19 @@ def sus_pharma_other(ddf):
     return fig
 
 
-# 16
-def drug_end_before_start(ddf):
-    """
-    Warning # 16
-    Original warning type: "Negative event (treatment/response) duration: end time is before start time"
-
-    :param ddf: Drug Exposure data frame.
-    :return:
-        Graph of result.
-    """
-    ddf_copy = ddf.copy()
-    count_of_rows = ddf_copy.shape[0]
-    ddf_copy = ddf_copy.dropna()
-    ddf_copy["date_in_future"] = (ddf_copy["drug_exposure_end_date"]
-                                  < ddf_copy["drug_exposure_start_date"])
-    incorrect_count = ddf_copy["date_in_future"].sum()
-
-    filter_ddf_copy = ddf_copy[ddf_copy['date_in_future'] == True]
-    filter_ddf_copy.to_csv('reports/omop/drug_end_before_start.csv', index=False)
-
-    result = {
-        "Records": ["Number of records", "drug_end_before_start"],
-        "Count": [count_of_rows, incorrect_count]
-    }
-    dff = pd.DataFrame(result)
-    fig = px.bar(dff, x='Records', y='Count')
-    fig.update_layout(title="Warning # 16: Negative event (treatment/response) duration: end time is before start time")
-    return fig
-
-
 # 21
-def therapy_start_before_diagnosis(cdf, ddf, prdf):
+def therapy_start_before_diagnosis(cddf, cprdf, ddf):
     """
     Warning # 21
     Original warning type: "Start of therapy is before diagnosis"
 
-    :param cdf: Condition Occurrence data frame.
-    :param prdf: Procedure Occurrence data frame.
+    :param cddf: Condition Occurrence data frame merged with Drug Exposure data frame.
+    :param cprdf: Condition Occurrence data frame merged with Procedure Occurrence data frame.
     :param ddf: Drug Exposure data frame.
     :return:
         Two graphs of result.
     """
-    merged_ddf = pd.merge(cdf, ddf, how="left", on="person_id")
+    merged_ddf = cddf
     count_of_rows = ddf.shape[0]
     merged_ddf = merged_ddf.dropna()
 
@@ -404,7 +394,7 @@ def therapy_start_before_diagnosis(cdf, ddf, prdf):
     fig_dff.update_layout(title="Warning # 21: Start of therapy is before diagnosis - drug exposures")
 
     # prdf
-    merged_prdf = pd.merge(cdf, prdf, how="left", on="person_id")
+    merged_prdf = cprdf
     count_of_rows = ddf.shape[0]
     merged_prdf = merged_prdf.dropna()
 
@@ -436,7 +426,7 @@ def treatment_start_in_the_future(ddf, prdf):
     :return:
         Two graphs of result.
     """
-    current_date = datetime.now().date()
+    current_date = pd.Timestamp(datetime.now().date())
     ddf_copy = ddf.copy()
     count_of_rows = ddf_copy.shape[0]
     ddf_copy = ddf_copy.dropna()
@@ -484,7 +474,7 @@ def drug_exposure_end_in_the_future(ddf):
     :return:
         Graphs of result.
     """
-    current_date = datetime.now().date()
+    current_date = pd.Timestamp(datetime.now().date())
     ddf_copy = ddf.copy()
     count_of_rows = ddf_copy.shape[0]
     ddf_copy = ddf_copy.dropna()
@@ -505,18 +495,18 @@ def drug_exposure_end_in_the_future(ddf):
 
 
 # 24
-def sus_early_pharma(cdf, ddf):
+def sus_early_pharma(cddf, ddf):
     """
     Warning # 24
     Original warning type:
     "Non-surgery therapy starts and ends in week 0 since initial diagnosis (maybe false positive)"
 
-    :param cdf: Condition Occurrence data frame.
+    :param cddf: Condition Occurrence data frame merged with Drug Exposure data frame.
     :param ddf: Drug Exposure data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(cdf, ddf, how="left", on="person_id")
+    merged_ddf = cddf
     count_of_rows = ddf.shape[0]
     merged_ddf = merged_ddf.dropna()
 
@@ -540,18 +530,18 @@ def sus_early_pharma(cdf, ddf):
 
 
 # 25
-def sus_short_pharma(cdf, ddf):
+def sus_short_pharma(cddf, ddf):
     """
     Warning # 25
     Original warning type:
     "Suspiciously short pharma therapy - less than 1 week (maybe false positive)"
 
-    :param cdf: Condition Occurrence data frame.
+    :param cddf: Condition Occurrence data frame merged with Drug Exposure data frame.
     :param ddf: Drug Exposure data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(cdf, ddf, how="left", on="person_id")
+    merged_ddf = cddf
     count_of_rows = ddf.shape[0]
     merged_ddf = merged_ddf.dropna()
 
@@ -574,16 +564,15 @@ def sus_short_pharma(cdf, ddf):
 
 # reports
 # 1 + 2
-def missing_specimen_date(pdf, sdf):
+def missing_specimen_date(psdf):
     """
     Report # 1 + 2
 
-    :param pdf: Person data frame.
-    :param sdf: Specimen data frame.
+    :param psdf: Person data frame merged with Specimen data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(pdf, sdf, how="left", on="person_id")
+    merged_ddf = psdf.copy()
     count_of_rows = merged_ddf.shape[0]
 
     merged_ddf["missing_specimen_date"] = merged_ddf["specimen_date"].isnull()
@@ -607,16 +596,15 @@ def missing_specimen_date(pdf, sdf):
 
 
 # 3
-def patients_without_specimen_source_id(pdf, sdf):
+def patients_without_specimen_source_id(psdf):
     """
     Report # 3
 
-    :param pdf: Person data frame.
-    :param sdf: Specimen data frame.
+    :param psdf: Person data frame merged with Specimen data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(pdf, sdf, how="left", on="person_id")
+    merged_ddf = psdf.copy()
     count_of_rows = merged_ddf.shape[0]
 
     merged_ddf["missing_specimen_source_id"] = merged_ddf["specimen_source_id"].isnull()
@@ -640,16 +628,15 @@ def patients_without_specimen_source_id(pdf, sdf):
 
 
 # 5
-def patients_without_specimen_source_value_concept_id(pdf, sdf):
+def patients_without_specimen_source_value_concept_id(psdf):
     """
     Report # 5
 
-    :param pdf: Person data frame.
-    :param sdf: Specimen data frame.
+    :param psdf: Person data frame merged with Specimen data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(pdf, sdf, how="left", on="person_id")
+    merged_ddf = psdf.copy()
     count_of_rows = merged_ddf.shape[0]
 
     merged_ddf["missing_specimen_source_value"] = merged_ddf["specimen_source_value"].isnull()
@@ -676,16 +663,15 @@ def patients_without_specimen_source_value_concept_id(pdf, sdf):
 
 
 # 6
-def patients_without_condition_values(pdf, cdf):
+def patients_without_condition_values(pcdf):
     """
     Report # 6
 
-    :param pdf: Person data frame.
-    :param cdf: Condition Occurrence data frame.
+    :param pcdf: Person data frame merged with Condition Occurrence data frame.
     :return:
         Graphs of result.
     """
-    merged_ddf = pd.merge(pdf, cdf, how="left", on="person_id")
+    merged_ddf = pcdf.copy()
     count_of_rows = merged_ddf.shape[0]
 
     # condition_source_value
@@ -733,10 +719,7 @@ def patients_without_surgery_values(pdf, prdf):
         Graphs of result.
     """
     patients = pdf.shape[0]
-    surgeries = prdf[~prdf['procedure_source_value'].isin(["liver imaging", "CT",
-                                                           "colonoscopy", "lung imaging",
-                                                           "MRI", "Targeted therapy",
-                                                           "Radiation therapy"])]
+    surgeries = prdf[~prdf['procedure_source_value'].isin(NON_SURGERY_PROCEDURES)]
 
     merged_ddf = pd.merge(pdf, surgeries, how="right", on="person_id")
     patients_with_surgery_count = merged_ddf.shape[0]
@@ -780,12 +763,12 @@ def patients_without_surgery_values(pdf, prdf):
 
 
 # 8
-def missing_patient_and_diagnostic_values(pdf, prdf):
+def missing_patient_and_diagnostic_values(pdf, pfdf):
     """
     Report # 8
 
     :param pdf: Person data frame.
-    :param prdf: Procedure Occurrence data frame.
+    :param pfdf: Counts of procedures of persons from person_features.
     :return:
         Graphs of result.
     """
@@ -812,40 +795,13 @@ def missing_patient_and_diagnostic_values(pdf, prdf):
     filter_pdf = pdf[pdf['gender_source_value'].isnull()]
     filter_pdf.to_csv('reports/omop/missing_gender_source_value.csv', index=False)
 
-    # "liver imaging"
-    liver_imaging = prdf[prdf['procedure_source_value'] == "liver imaging"]
-    liver_imaging_df = pd.merge(pdf, liver_imaging, how="left", on="person_id")
-    patients_without_liver_imaging = liver_imaging_df[~liver_imaging_df['procedure_source_value'].isnull()]
-    patients_with_liver_imaging_count = liver_imaging_df.shape[0]
-    patients_without_liver_imaging.to_csv('reports/omop/patients_without_liver_imaging.csv', index=False)
-
-    # "lung imaging"
-    lung_imaging = prdf[prdf['procedure_source_value'] == "lung_imaging"]
-    lung_imaging_df = pd.merge(pdf, lung_imaging, how="left", on="person_id")
-    patients_without_lung_imaging = lung_imaging_df[~lung_imaging_df['procedure_source_value'].isnull()]
-    patients_with_lung_imaging_count = lung_imaging_df.shape[0]
-    patients_without_lung_imaging.to_csv('reports/omop/patients_without_lung_imaging.csv', index=False)
-
-    # "colonoscopy"
-    colonoscopy = prdf[prdf['procedure_source_value'] == "colonoscopy"]
-    colonoscopy_df = pd.merge(pdf, colonoscopy, how="left", on="person_id")
-    patients_without_colonoscopy = colonoscopy_df[~colonoscopy_df['procedure_source_value'].isnull()]
-    patients_with_colonoscopy_count = colonoscopy_df.shape[0]
-    patients_without_colonoscopy.to_csv('reports/omop/patients_without_colonoscopy.csv', index=False)
-
-    # "MRI"
-    mri = prdf[prdf['procedure_source_value'] == "MRI"]
-    mri_df = pd.merge(pdf, mri, how="left", on="person_id")
-    patients_without_mri = mri_df[~mri_df['procedure_source_value'].isnull()]
-    patients_with_mri_count = mri_df.shape[0]
-    patients_without_mri.to_csv('reports/omop/patients_without_mri.csv', index=False)
-
-    # "CT"
-    ct = prdf[prdf['procedure_source_value'] == "CT"]
-    ct_df = pd.merge(pdf, ct, how="left", on="person_id")
-    patients_without_ct = ct_df[~ct_df['procedure_source_value'].isnull()]
-    patients_with_ct_count = ct_df.shape[0]
-    patients_without_ct.to_csv('reports/omop/patients_without_ct.csv', index=False)
+    # diagnostics
+    patients_with_imaging_count = {}
+    for procedure in IMAGING_PROCEDURES:
+        name = procedure.lower().replace(" ", "_")
+        patients_with_imaging_count[name] = (pfdf[procedure] > 0).sum()
+        patients_without_imaging = pdf[(pfdf[procedure] == 0).values]
+        patients_without_imaging.to_csv('reports/omop/patients_without_' + name + '.csv', index=False)
 
     result = {
         "Records": ["Number of patients",
@@ -863,11 +819,11 @@ def missing_patient_and_diagnostic_values(pdf, prdf):
                   missing_year_of_birth,
                   missing_person_source_value,
                   missing_gender_source_value,
-                  patients_with_liver_imaging_count,
-                  patients_with_lung_imaging_count,
-                  patients_with_colonoscopy_count,
-                  patients_with_mri_count,
-                  patients_with_ct_count]
+                  patients_with_imaging_count["liver_imaging"],
+                  patients_with_imaging_count["lung_imaging"],
+                  patients_with_imaging_count["colonoscopy"],
+                  patients_with_imaging_count["mri"],
+                  patients_with_imaging_count["ct"]]
     }
     dff = pd.DataFrame(result)
     fig = px.bar(dff, x='Records', y='Count')
@@ -1071,47 +1027,6 @@ def missing_radiation_therapy_values(pdf, prdf):
 # 23 - 30; get X Record set, return tibble
 
 
-# 35 histogram with count of records in tables
-def counts_of_records(pdf, odf, cdf, sdf, ddf, prdf):
-    """
-    Report # 35
-
-    :param pdf: Person data frame.
-    :param odf: Observation Period data frame.
-    :param cdf: Condition Occurrence data frame.
-    :param sdf: Specimen data frame.
-    :param ddf: Drug Exposure data frame.
-    :param prdf: Procedure Occurrence data frame.
-    :return:
-        Graphs of result.
-    """
-    patients = pdf.shape[0]
-    observations = odf.shape[0]
-    conditions = cdf.shape[0]
-    specimens = sdf.shape[0]
-    drugs = ddf.shape[0]
-    procedures = prdf.shape[0]
-    result = {
-        "Records": ["Patient records",
-                    "Observation period records",
-                    "Condition occurrence records",
-                    "Specimen records",
-                    "Drug exposure records",
-                    "Procedure occurrence records",
-                    ],
-        "Count": [patients,
-                  observations,
-                  conditions,
-                  specimens,
-                  drugs,
-                  procedures
-                  ]
-    }
-    dff = pd.DataFrame(result)
-    fig = px.bar(dff, x='Records', y='Count')
-    fig.update_layout(title="Report # 35")
-    return fig
-
 # 31 - 34 values have not been mapped
 
 # 36, 37, 38, 39 is done in completeness
@@ -1120,24 +1035,19 @@ def counts_of_records(pdf, odf, cdf, sdf, ddf, prdf):
 
 
 # 41
-def get_patients_without_surgery(pdf, prdf):
+def get_patients_without_surgery(pdf, pfdf):
     """
     Report # 41
 
     :param pdf: Person data frame.
-    :param prdf: Procedure Occurrence data frame.
+    :param pfdf: Counts of procedures of persons from person_features.
     :return:
         Graphs of result.
     """
     patients = pdf.shape[0]
-    surgeries = prdf[~prdf['procedure_source_value'].isin(["liver imaging", "CT",
-                                                           "colonoscopy", "lung imaging",
-                                                           "MRI", "Targeted therapy",
-                                                           "Radiation therapy"])]
-    merged_df = pd.merge(pdf, surgeries, how="left", on="person_id")
-    patients_without_surgery = merged_df["procedure_source_value"].isnull().sum()
-
-    filter_df = merged_df[merged_df["procedure_source_value"].isnull()]
+    patients_without_surgery = (pfdf["surgery"] == 0).sum()
+
+    filter_df = pdf[(pfdf["surgery"] == 0).values]
     filter_df.to_csv('reports/omop/get_patients_without_surgery.csv', index=False)
     result = {
         "Records": ["patients", "patients_without_surgery"],
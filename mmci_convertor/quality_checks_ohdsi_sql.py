@@ -0,0 +1,227 @@
+from _datetime import datetime
+import pandas as pd
+import plotly.express as px
+from quality_checks_ohdsi import OMOP_COLUMNS, QUERY_LOCK, batch_condition, read_table
+
+# Quality checks evaluated by the database server. Counts are computed by one aggregate
+# query per check and only the failing rows are transferred, the other checks over data frames
+# are in quality_checks_ohdsi.py.
+# Every check takes the range of IDs returned by load_data to check only the rows of one load.
+
+
+def fetch_counts(con, command, parameters=None):
+    """
+    Run an aggregate query returning one row.
+
+    :param con: Connection to database.
+    :param command: SELECT command.
+    :param parameters: Parameters of the command.
+    :return:
+        Tuple of counts.
+    """
+    with QUERY_LOCK, con.cursor() as cursor:
+        cursor.execute(command, parameters)
+        return cursor.fetchone()
+
+
+def count_failing_rows(con, table_name, schema, condition, parameters=None, batch=None):
+    """
+    Count all rows of OMOP CDM table and rows matching the condition of a check.
+
+    :param con: Connection to database.
+    :param table_name: Processed table.
+    :param schema: Schema in database.
+    :param condition: SQL condition selecting failing rows.
+    :param parameters: Parameters of the condition.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Count of rows and count of failing rows.
+    """
+    scope, scope_parameters = batch_condition(table_name, batch)
+    command = "SELECT COUNT(*), COUNT(*) FILTER (WHERE " + condition + ") FROM " + schema + "." + table_name + \
+              " WHERE " + scope
+    return fetch_counts(con, command, (parameters or []) + scope_parameters)
+
+
+def fetch_failing_rows(con, table_name, schema, condition, parameters=None, batch=None):
+    """
+    Read rows of OMOP CDM table matching the condition of a check.
+
+    :param con: Connection to database.
+    :param table_name: Processed table.
+    :param schema: Schema in database.
+    :param condition: SQL condition selecting failing rows.
+    :param parameters: Parameters of the condition.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Data frame with the same columns as from create_df_omop.
+    """
+    columns = OMOP_COLUMNS[table_name]
+    scope, scope_parameters = batch_condition(table_name, batch)
+    command = "SELECT " + ", ".join(columns) + " FROM " + schema + "." + table_name + \
+              " WHERE (" + condition + ") AND " + scope
+    return read_table(con, table_name, command, (parameters or []) + scope_parameters)
+
+
+def completeness_sql(con, table_name, schema, batch=None):
+    """
+    Data quality check for completeness.
+    Only rows with at least one missing value are written into the report.
+
+    :param con: Connection to database.
+    :param table_name: Processed table.
+    :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Graph of completeness.
+    """
+    columns = OMOP_COLUMNS[table_name]
+    scope, scope_parameters = batch_condition(table_name, batch)
+    command = "SELECT " + ", ".join(["COUNT(*) - COUNT(" + column + ")" for column in columns]) + \
+              " FROM " + schema + "." + table_name + " WHERE " + scope
+    missing_values = pd.Series(fetch_counts(con, command, scope_parameters), index=columns, dtype="int64")
+
+    name = columns[0][:-3]
+    fig = px.bar(missing_values)
+    fig.update_layout(xaxis_title='count of missing values', yaxis_title='attribute', title="Missing values",
+                      showlegend=False)
+    condition = " OR ".join([column + " IS NULL" for column in columns])
+    filter_df = fetch_failing_rows(con, table_name, schema, condition, batch=batch)
+    filter_df.to_csv("reports/omop/completeness" + name + ".csv", index=False)
+    fig.update_layout(title="Completeness" + name)
+    return fig
+
+
+# 7
+def observation_end_in_the_future_sql(con, schema, batch=None):
+    """
+    Warning # 7
+    Original warning type: "Vital status timestamp is in the future"
+
+    :param con: Connection to database.
+    :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Graph of result.
+    """
+    current_time = datetime.now().date()
+    condition = "observation_period_end_date > %s"
+    count_of_rows, incorrect_count = count_failing_rows(con, "observation_period", schema, condition,
+                                                        [current_time], batch)
+
+    filter_odf = fetch_failing_rows(con, "observation_period", schema, condition, [current_time], batch)
+    filter_odf["missing_timestamp"] = False
+    filter_odf["date_in_future"] = True
+    filter_odf.to_csv('reports/omop/observation_end_in_the_future.csv', index=False)
+
+    result = {
+        "Records": ["Number of records", "observation_end_in_the_future"],
+        "Count": [count_of_rows, incorrect_count]
+    }
+    dff = pd.DataFrame(result)
+    fig = px.bar(dff, x='Records', y='Count')
+    fig.update_layout(title="Warning # 7: Vital status timestamp is in the future")
+    return fig
+
+
+# 8
+def condition_start_in_the_future_sql(con, schema, batch=None):
+    """
+    Warning # 8
+    Original warning type: "Initial diagnosis date is in the future"
+
+    :param con: Connection to database.
+    :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Graph of result.
+    """
+    now = datetime.now().date()
+    condition = "condition_start_date > %s"
+    count_of_rows, incorrect_count = count_failing_rows(con, "condition_occurrence", schema, condition, [now], batch)
+
+    filter_cdf = fetch_failing_rows(con, "condition_occurrence", schema, condition, [now], batch)
+    filter_cdf["date_in_future"] = True
+    filter_cdf.to_csv('reports/omop/condition_start_in_the_future.csv', index=False)
+
+    result = {
+        "Records": ["Number of records", "condition_start_in_the_future"],
+        "Count": [count_of_rows, incorrect_count]
+    }
+    dff = pd.DataFrame(result)
+    fig = px.bar(dff, x='Records', y='Count')
+    fig.update_layout(title="Warning # 8: Initial diagnosis date is in the future")
+    return fig
+
+
+# 16
+def drug_end_before_start_sql(con, schema, batch=None):
+    """
+    Warning # 16
+    Original warning type: "Negative event (treatment/response) duration: end time is before start time"
+
+    :param con: Connection to database.
+    :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Graph of result.
+    """
+    # only complete records are checked
+    condition = " AND ".join([column + " IS NOT NULL" for column in OMOP_COLUMNS["drug_exposure"]]) + \
+                " AND drug_exposure_end_date < drug_exposure_start_date"
+    count_of_rows, incorrect_count = count_failing_rows(con, "drug_exposure", schema, condition, batch=batch)
+
+    filter_ddf = fetch_failing_rows(con, "drug_exposure", schema, condition, batch=batch)
+    filter_ddf["date_in_future"] = True
+    filter_ddf.to_csv('reports/omop/drug_end_before_start.csv', index=False)
+
+    result = {
+        "Records": ["Number of records", "drug_end_before_start"],
+        "Count": [count_of_rows, incorrect_count]
+    }
+    dff = pd.DataFrame(result)
+    fig = px.bar(dff, x='Records', y='Count')
+    fig.update_layout(title="Warning # 16: Negative event (treatment/response) duration: end time is before start time")
+    return fig
+
+
+# 35 histogram with count of records in tables
+def counts_of_records_sql(con, schema, batch=None):
+    """
+    Report # 35
+
+    :param con: Connection to database.
+    :param schema: Schema in database.
+    :param batch: Range of IDs returned by load_data, None for all rows.
+    :return:
+        Graphs of result.
+    """
+    subqueries = []
+    parameters = []
+    for table_name in OMOP_COLUMNS:
+        scope, scope_parameters = batch_condition(table_name, batch)
+        subqueries.append("(SELECT COUNT(*) FROM " + schema + "." + table_name + " WHERE " + scope + ")")
+        parameters += scope_parameters
+    patients, observations, conditions, specimens, drugs, procedures = fetch_counts(con,
+                                                                                    "SELECT " + ", ".join(subqueries),
+                                                                                    parameters)
+    result = {
+        "Records": ["Patient records",
+                    "Observation period records",
+                    "Condition occurrence records",
+                    "Specimen records",
+                    "Drug exposure records",
+                    "Procedure occurrence records",
+                    ],
+        "Count": [patients,
+                  observations,
+                  conditions,
+                  specimens,
+                  drugs,
+                  procedures
+                  ]
+    }
+    dff = pd.DataFrame(result)
+    fig = px.bar(dff, x='Records', y='Count')
+    fig.update_layout(title="Report # 35")
+    return fig
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the convertor import each other by flat imports, like when gui.py is run from its folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+from fhirclient.server import FHIRServer
+
+from fhir_export import exported_resources, wait_for_export
+from quality_checks_fhir import create_patient_data_frame
+
+
+def patient(id, birth_date):
+    return {"resourceType": "Patient", "id": id, "meta": {"versionId": "1", "lastUpdated": "2024-01-01T00:00:00Z"},
+            "identifier": [{"value": "p" + id}], "gender": "male", "birthDate": birth_date}
+
+
+def specimen(id, patient_id):
+    return {"resourceType": "Specimen", "id": id, "subject": {"reference": "Patient/" + patient_id}}
+
+
+# canned output of export, with resources of other loads, the patients are split into two files
+FILES = {
+    "Patient_a.ndjson": ("Patient", [patient("1", "1970-01-01"), patient("2", "1980-02-02"),
+                                     patient("90", "1990-03-03")]),
+    "Patient_b.ndjson": ("Patient", [patient("3", "2000-04-04"), patient("91", "1960-05-05")]),
+    "Specimen_a.ndjson": ("Specimen", [specimen("11", "1"), specimen("92", "90"), specimen("12", "3")])
+}
+
+
+class ExportStub:
+    """
+    FHIR server with kick-off, status and NDJSON endpoints of Bulk Data export, serving canned files.
+    """
+
+    def __init__(self, polls=2):
+        self.polls = polls
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                url = urlparse(self.path)
+                base = "http://" + self.headers["Host"] + "/fhir/"
+                if url.path == "/fhir/$export":
+                    self.send_response(202)
+                    self.send_header("Content-Location", base + "status/1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif url.path == "/fhir/status/1" and stub.polls > 0:
+                    stub.polls -= 1
+                    self.send_response(202)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                elif url.path == "/fhir/status/1":
+                    manifest = {"transactionTime": "2024-01-01T00:00:00Z", "request": base + "$export",
+                                "requiresAccessToken": False,
+                                "output": [{"type": type, "url": base + "files/" + name}
+                                           for name, (type, _) in FILES.items()],
+                                "error": []}
+                    self.send_body("application/json", json.dumps(manifest).encode())
+                elif url.path.startswith("/fhir/files/"):
+                    _, resources = FILES[url.path[len("/fhir/files/"):]]
+                    data = "".join(json.dumps(resource) + "\n" for resource in resources).encode()
+                    self.send_body("application/fhir+ndjson", data)
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+
+            def send_body(self, content_type, data):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("localhost", 0), Handler)
+        self.url = "http://localhost:" + str(self.httpd.server_port) + "/fhir/"
+
+    def paths(self):
+        return [urlparse(path).path for path, _ in self.requests]
+
+
+@pytest.fixture
+def stub():
+    stub = ExportStub()
+    thread = threading.Thread(target=stub.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.httpd.shutdown()
+    stub.httpd.server_close()
+
+
+@pytest.fixture
+def ids_files(tmp_path, monkeypatch):
+    # IDs files of the last load are read from the working directory
+    monkeypatch.chdir(tmp_path)
+    with open("patients_ids.txt", "w") as file:
+        file.write("1\n2\n3\n")
+    with open("specimens_ids.txt", "w") as file:
+        file.write("11\n12\n")
+
+
+def test_exported_resources_of_ids_files(stub, ids_files, tmp_path):
+    server = FHIRServer(None, base_uri=stub.url)
+    directory = str(tmp_path / "export")
+    resources = exported_resources(server, {"patients": "Patient", "specimens": "Specimen"}, directory,
+                                   since="2024-01-01T00:00:00Z", poll_interval=0)
+
+    path, headers = stub.requests[0]
+    query = parse_qs(urlparse(path).query)
+    assert query == {"_type": ["Patient,Specimen"], "_since": ["2024-01-01T00:00:00Z"]}
+    assert headers["Prefer"] == "respond-async"
+    assert stub.paths().count("/fhir/status/1") == 3
+    assert sorted(os.listdir(directory)) == ["Patient_0.ndjson", "Patient_1.ndjson", "Specimen_2.ndjson"]
+
+    assert [resource["id"] for resource in resources["patients"]] == ["1", "2", "3"]
+    assert [resource["id"] for resource in resources["specimens"]] == ["11", "12"]
+    # files are parsed again for every iteration
+    assert [resource["id"] for resource in resources["patients"]] == ["1", "2", "3"]
+
+
+def test_frames_from_export_equal_frames_from_kept_resources(stub, ids_files, tmp_path):
+    server = FHIRServer(None, base_uri=stub.url)
+    resources = exported_resources(server, {"patients": "Patient"}, str(tmp_path / "export"), poll_interval=0)
+    kept = {"patients": [patient("1", "1970-01-01"), patient("2", "1980-02-02"), patient("3", "2000-04-04")]}
+
+    assert "_since" not in parse_qs(urlparse(stub.requests[0][0]).query)
+    pd.testing.assert_frame_equal(create_patient_data_frame(server, resources),
+                                  create_patient_data_frame(server, kept))
+
+
+def test_wait_for_export_times_out(stub):
+    server = FHIRServer(None, base_uri=stub.url)
+    stub.polls = 1000
+    with pytest.raises(TimeoutError):
+        wait_for_export(server, stub.url + "status/1", poll_interval=0, timeout=0)
@@ -0,0 +1,63 @@
+import base64
+import copy
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from check_registry import call, run_check, run_checks
+from load_data_fhir import FHIR_CHECKS, FHIR_FRAMES
+from test_quality_checks_fhir import RESOURCES
+
+
+class EmptyServer:
+    """
+    FHIR server without any resource.
+    """
+
+    def request_json(self, path):
+        return {"resourceType": "Bundle", "type": "searchset", "entry": []}
+
+
+@pytest.fixture
+def values(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("reports/fhir")
+    resources = copy.deepcopy(RESOURCES)
+    # full dates, so every pandas version parses all birthdays
+    resources["patients"][2]["birthDate"] = "1985-01-01"
+    return {"server": EmptyServer(), "resources": resources}
+
+
+def counts(graphs, check_id):
+    index = [check.id for check in FHIR_CHECKS].index(check_id)
+    y = json.loads(graphs[index])["data"][0]["y"]
+    # newer plotly writes arrays in base64
+    if isinstance(y, dict):
+        y = np.frombuffer(base64.b64decode(y["bdata"]), dtype=y["dtype"])
+    return [int(count) for count in y]
+
+
+def test_checks_do_not_change_frames(values):
+    for frame in FHIR_FRAMES:
+        values[frame.name] = call(frame, values)
+    for check in FHIR_CHECKS:
+        frames = {name: values[name].copy() for name in check.inputs if isinstance(values[name], pd.DataFrame)}
+        run_check(check, values)
+        for name, frame in frames.items():
+            pd.testing.assert_frame_equal(values[name], frame, obj=check.id + " " + name)
+
+
+def test_run_checks_gives_counts_of_checks_run_one_after_another(values):
+    graphs = run_checks(FHIR_CHECKS, values, FHIR_FRAMES)
+
+    assert counts(graphs, "conformance_patient") == [4, 0, 0]
+    assert counts(graphs, "conformance_relational_specimen") == [8, 1]
+    assert counts(graphs, "conformance_computational") == [8, 4, 8, 3, 2]
+    assert counts(graphs, "age_at_primary_diagnosis") == [10, 9]
+
+
+def test_processes_give_figures_of_threads(values):
+    assert run_checks(FHIR_CHECKS, values, FHIR_FRAMES, processes=2) == run_checks(FHIR_CHECKS, values, FHIR_FRAMES)
@@ -0,0 +1,60 @@
+import pytest
+
+import load_data_ohdsi
+from load_data_ohdsi import create_graphs_omop, insert_data
+
+
+class FailingCursor:
+    """
+    Cursor of a database which refuses every row.
+    """
+
+    def execute(self, command, values=None):
+        raise RuntimeError("row refused")
+
+
+class Connection:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_insert_data_raises_after_rollback():
+    conn = Connection()
+    record = ((0, 8507, 1970, 0, 0, "1", "male"), (), (), [], [], [])
+    with pytest.raises(RuntimeError):
+        insert_data([record], FailingCursor(), conn, "cdm")
+
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+
+
+def test_checks_are_not_run_if_load_failed(monkeypatch):
+    monkeypatch.setattr(load_data_ohdsi, "load_data", lambda params, input_file, schema: None)
+
+    def connect(**params):
+        raise AssertionError("checks connected to the database")
+
+    monkeypatch.setattr(load_data_ohdsi.psycopg2, "connect", connect)
+
+    assert create_graphs_omop({"schema": "cdm"}, "test_data.xml") == []
+    assert create_graphs_omop({"schema": "cdm"}, "test_data.xml", whole_schema=True) == []
+
+
+def test_checks_close_connection(monkeypatch):
+    conn = Connection()
+    monkeypatch.setattr(load_data_ohdsi, "load_data", lambda params, input_file, schema: {"person": (0, 1)})
+    monkeypatch.setattr(load_data_ohdsi.psycopg2, "connect", lambda **params: conn)
+    monkeypatch.setattr(load_data_ohdsi, "run_checks", lambda checks, values, frames: ["graph"])
+
+    assert create_graphs_omop({"schema": "cdm"}, "test_data.xml") == ["graph"]
+    assert conn.closed
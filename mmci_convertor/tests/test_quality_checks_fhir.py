@@ -0,0 +1,121 @@
+import pandas as pd
+
+from quality_checks_fhir import create_condition_data_frame, create_patient_data_frame, \
+    create_specimen_data_frame, conformance_computational
+
+
+def patient(id, identifier, birth_date):
+    return {"resourceType": "Patient", "id": id, "meta": {"versionId": "1"},
+            "identifier": [{"value": identifier}], "gender": "female", "birthDate": birth_date}
+
+
+def specimen(id, reference, collected):
+    return {"resourceType": "Specimen", "id": id, "meta": {"versionId": "1"},
+            "type": {"coding": [{"code": "T", "display": "Tumor"}]},
+            "collection": {"collectedDateTime": collected},
+            "subject": {"reference": reference}}
+
+
+def condition(id, reference, onset, recorded):
+    return {"resourceType": "Condition", "id": id, "meta": {"versionId": "1"},
+            "clinicalStatus": {"coding": [{"system": "http://terminology.hl7.org/CodeSystem/condition-clinical",
+                                           "code": "unknown", "display": "Unknown"}]},
+            "code": {"coding": [{"system": "http://hl7.org/fhir/sid/icd-10", "code": "C20",
+                                 "display": "Malignant neoplasm of rectum"}],
+                     "text": "C20: Malignant neoplasm of rectum"},
+            "subject": {"reference": reference}, "onsetDateTime": onset, "recordedDate": recorded}
+
+
+# stored resources in the shape kept by the loader, the conditions are aligned with the specimens by position,
+# so the old lookup of conditions by specimen row gives the same patients
+RESOURCES = {
+    "patients": [patient("1", "p1", "1970-05-01"),
+                 patient("2", "p2", "1990-01-01"),
+                 patient("3", "p3", "1985"),
+                 # the first patient with the id is used
+                 patient("1", "p1-copy", "2000-01-01")],
+    "specimens": [specimen("11", "Patient/1", "1969-12-31"),
+                  specimen("12", "Patient/1", "2001-02-03"),
+                  specimen("13", "Patient/2", "1989-06-30"),
+                  specimen("14", "Patient/2", "1990-01-01"),
+                  specimen("15", "Patient/3", "1984-12-31"),
+                  specimen("16", "Patient/3", "1985-07-01"),
+                  specimen("17", "Patient/404", "1900-01-01"),
+                  specimen("18", "Patient/1", "1970-04-30")],
+    "conditions": [condition("21", "Patient/1", "1969-01-01", "1971-01-01"),
+                   condition("22", "Patient/1", "2001-01-01", "1960-01-01"),
+                   condition("23", "Patient/2", "1989-12-31", "1989-12-31"),
+                   condition("24", "Patient/2", "1995-05-05", "1995-05-05"),
+                   condition("25", "Patient/3", "1984-01-01", "1986-01-01"),
+                   condition("26", "Patient/3", "1990-01-01", "1990-01-01"),
+                   condition("27", "Patient/404", "1900-01-01", "1900-01-01"),
+                   condition("28", "Patient/1", "1970-05-01", "1970-05-02")]
+}
+
+
+def get_birthDay(pdf, subject_reference):
+    # per row lookup used by conformance_computational before the keyed join
+    subject_reference_split = subject_reference.split("/")
+    patient_id = None
+    if len(subject_reference_split) == 2:
+        patient_id = subject_reference_split[1]
+    birthDate = None
+    if patient_id is not None:
+        patient = pdf.loc[pdf['id'] == patient_id]
+        if not patient.empty:
+            patient = patient.iloc[0]
+            birthDate = patient['birthDate']
+    return birthDate
+
+
+def old_counts(pdf, sdf, cdf):
+    count_invalid_collection_collectedDateTime = 0
+    for index in sdf.index:
+        birthDay = get_birthDay(pdf, sdf['subject_reference'][index])
+        if birthDay is not None:
+            if birthDay > sdf["collection_collectedDateTime"][index]:
+                count_invalid_collection_collectedDateTime += 1
+
+    onsetDateTime_count = 0
+    recordedDate_count = 0
+    for index in cdf.index:
+        if index < len(sdf.index):
+            birthDay = get_birthDay(pdf, sdf['subject_reference'][index])
+        if birthDay is not None:
+            if birthDay > cdf["onsetDateTime"][index]:
+                onsetDateTime_count += 1
+            if birthDay > cdf["recordedDate"][index]:
+                recordedDate_count += 1
+    return [sdf.shape[0], count_invalid_collection_collectedDateTime,
+            cdf.shape[0], onsetDateTime_count, recordedDate_count]
+
+
+def frames():
+    return (create_patient_data_frame(None, RESOURCES),
+            create_specimen_data_frame(None, RESOURCES),
+            create_condition_data_frame(None, RESOURCES))
+
+
+def counts(fig):
+    return [int(count) for count in fig.data[0].y]
+
+
+def test_born_later_counts_match_per_row_lookup():
+    pdf, sdf, cdf = frames()
+    expected = old_counts(pdf, sdf, cdf)
+    assert expected == [8, 4, 8, 3, 2]
+    assert counts(conformance_computational(pdf, sdf, cdf)) == expected
+
+
+def test_born_later_counts_use_condition_subject():
+    pdf, sdf, cdf = frames()
+    # conditions in reverse order no longer match the specimen rows by position
+    cdf = cdf.iloc[::-1].reset_index(drop=True)
+    assert counts(conformance_computational(pdf, sdf, cdf)) == [8, 4, 8, 3, 2]
+
+
+def test_born_later_counts_of_empty_frames():
+    pdf, sdf, cdf = frames()
+    sdf = sdf.iloc[0:0]
+    cdf = pd.DataFrame(columns=cdf.columns)
+    assert counts(conformance_computational(pdf, sdf, cdf)) == [0, 0, 0, 0, 0]
@@ -0,0 +1,24 @@
+import pytest
+
+import quality_checks_fhir_extra
+
+# builders of data frames keyed by patient ID and names of IDs files they read
+BUILDERS = [("create_tnm_dataframe", "tnm"),
+            ("create_recurrence_df", "recurrence"),
+            ("create_time_observation_df", "time_observation"),
+            ("create_radiation_df", "radiation"),
+            ("create_response_df", "response"),
+            ("create_surgery_df", "surgery"),
+            ("create_specimen_data_frame", "specimens"),
+            ("create_condition_data_frame", "conditions"),
+            ("create_targeted_therapy_dataframe", "targeteds")]
+
+
+@pytest.mark.parametrize("builder, name", BUILDERS)
+def test_subject_without_reference_has_no_patient(builder, name):
+    resources = {name: [{"id": "1", "subject": {"display": "Unknown patient"}},
+                        {"id": "2"},
+                        {"id": "3", "subject": {"reference": "Patient/7"}},
+                        {"id": "4", "subject": {"reference": "http://localhost:8080/fhir/Patient/8"}}]}
+    df = getattr(quality_checks_fhir_extra, builder)(None, resources)
+    assert list(df["subject"]) == [None, None, "7", "8"]